@@ -0,0 +1,336 @@
+"""Memory address traces and single-pass cache replay.
+
+An AddressTraceWriter attached to a Simulator records the accesses of
+the unified cache, instruction fetches and LW/SW data accesses alike, in
+the order the cache serves them: a hit when it hits, a miss when its
+block arrives and is filled (the first miss and the retries while the
+block is on its way are not recorded). A miss still pending when the run
+ends is therefore left out. Replaying the trace through the recorded
+cache gives back its misses exactly; replaying it through other caches
+answers "what would the miss ratio be with this cache?" without
+simulating the pipeline again.
+
+File layout (little endian):
+
+  8 bytes   magic "MIPSADDR"
+  4 bytes   format version
+  then one 8 byte record per access, until the end of the file:
+  4 bytes   cycles since the previous record (the first: since cycle 0)
+  4 bytes   byte address, with bit 0 set for a write and bit 1 for a
+            data (LW/SW) access; addresses are word aligned, so these
+            bits are free
+
+replay() pushes a trace through any number of cache configurations in
+one pass. LRU caches are done with stack distances (Mattson's algorithm):
+for each distinct (sets, block words) pair, one LRU stack per set is kept
+no deeper than the most ways asked for, and the depth at which every
+access finds its block is counted. An access hits in an n-way LRU cache
+exactly when that depth is below n, so one pass gives the misses of every
+associativity at once. FIFO and random caches have no such property and
+are simulated one by one, still within the same pass over the trace.
+
+The trace is the stream of the run that recorded it. With another cache
+the pipeline would stall differently and re-read the cache a different
+number of times, so the replayed figures are those of the recorded
+access stream, the usual trace-driven approximation. Write policy does
+not change what hits, so it is not a replay parameter.
+"""
+
+import random
+import struct
+import sys
+from array import array
+
+from team23_project2 import Config, cacheGeometry
+
+MAGIC = b"MIPSADDR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sI")
+
+WRITE = 1               # flag bits kept in the low bits of the address
+DATA = 2
+FLAG_MASK = 3
+
+BUFFER_RECORDS = 1 << 16    # records buffered before they are written
+READ_RECORDS = 1 << 18      # records read at once
+
+FIELDS = ("config", "sets", "ways", "blockWords", "replacement", "accesses",
+          "misses", "missRatio", "instructionMisses", "dataMisses")
+
+
+#========================================
+# Address Trace Writer Class
+#========================================
+class AddressTraceWriter(object):
+
+    def __init__(self, file):
+        self.file = file
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        self.buffer = array('I')
+        self.lastCycle = 0
+        self.records = 0
+
+    #############
+    # Opens a new trace file
+    @classmethod
+    def open(cls, path):
+        return cls(open(path, "wb"))
+
+    #############
+    # Called by the Cache for every hit and every fill
+    def record(self, cycle, address, isWrite, isData):
+        flags = (WRITE if isWrite else 0) | (DATA if isData else 0)
+        self.buffer.append(cycle - self.lastCycle)
+        self.buffer.append(address | flags)
+        self.lastCycle = cycle
+        if (len(self.buffer) >= 2 * BUFFER_RECORDS):
+            self.flush()
+
+    def flush(self):
+        if (sys.byteorder != "little"):
+            self.buffer.byteswap()
+        self.file.write(self.buffer.tobytes())
+        self.records += len(self.buffer) // 2
+        del self.buffer[:]
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+#############
+# Records the accesses of a Simulator to a new trace file and returns
+# the writer, to be closed when the run is over
+def attach(sim, path):
+    sim.cache.recorder = AddressTraceWriter.open(path)
+    return sim.cache.recorder
+
+
+#============================================================
+# Reads a trace in chunks, yielding (cycle, address, flags) for
+# every access
+#============================================================
+def readTrace(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if (len(header) < HEADER.size):
+            raise ValueError(path + " is not an address trace")
+        magic, version = HEADER.unpack(header)
+        if (magic != MAGIC):
+            raise ValueError(path + " is not an address trace")
+        if (version != FORMAT_VERSION):
+            raise ValueError(path + " is address trace version " + str(version) +
+                             "; expected " + str(FORMAT_VERSION))
+        cycle = 0
+        while (True):
+            chunk = f.read(8 * READ_RECORDS)
+            if (not chunk):
+                break
+            if (len(chunk) & 7):
+                raise ValueError(path + " ends in the middle of a record")
+            words = array('I')
+            words.frombytes(chunk)
+            if (sys.byteorder != "little"):
+                words.byteswap()
+            for i in range(0, len(words), 2):
+                cycle += words[i]
+                value = words[i + 1]
+                yield cycle, value & ~FLAG_MASK, value & FLAG_MASK
+
+
+#========================================
+# Stack Distance Group Class
+#========================================
+class StackGroup(object):
+    """LRU stacks of every set for one (sets, block words) geometry."""
+
+    def __init__(self, numSets, blockWords):
+        self.setMask = numSets - 1
+        self.offsetBits = (blockWords * 4).bit_length() - 1
+        self.depth = 0              # the most ways of any config in the group
+        self.stacks = [[] for s in range(numSets)]
+        # distances[d][n] = accesses of kind d (0 instruction, 1 data)
+        # found n blocks down their set's stack; deeper or never seen
+        # ones are counted in far
+        self.distances = None
+        self.far = [0, 0]
+
+    def start(self):
+        self.distances = [[0] * self.depth, [0] * self.depth]
+
+    def access(self, address, kind):
+        block = address >> self.offsetBits
+        stack = self.stacks[block & self.setMask]
+        try:
+            distance = stack.index(block)
+        except ValueError:
+            self.far[kind] += 1
+            stack.insert(0, block)
+            if (len(stack) > self.depth):
+                stack.pop()
+            return
+        self.distances[kind][distance] += 1
+        if (distance):
+            del stack[distance]
+            stack.insert(0, block)
+
+    #############
+    # Misses of each kind in an LRU cache with `ways` ways
+    def misses(self, ways):
+        return [self.far[kind] + sum(self.distances[kind][ways:]) for kind in (0, 1)]
+
+
+#========================================
+# Replay Cache Class
+#========================================
+class ReplayCache(object):
+    """A cache replaced FIFO or at random, tags only, like Cache."""
+
+    def __init__(self, numSets, ways, blockWords, replacement, seed):
+        self.setMask = numSets - 1
+        self.offsetBits = (blockWords * 4).bit_length() - 1
+        self.ways = ways
+        self.replacement = replacement
+        self.rng = random.Random(seed)
+        self.tagMaps = [{} for s in range(numSets)]     # block -> way
+        self.order = [[] for s in range(numSets)]       # ways, oldest fill first
+        self.missCounts = [0, 0]
+
+    def access(self, address, kind):
+        block = address >> self.offsetBits
+        set = block & self.setMask
+        tags = self.tagMaps[set]
+        if (block in tags):
+            return
+        self.missCounts[kind] += 1
+        order = self.order[set]
+        if (len(order) < self.ways):
+            way = len(order)
+        else:
+            if (self.replacement == "random"):
+                way = self.rng.randrange(self.ways)
+            else:
+                way = order[0]
+            order.remove(way)
+            for old in tags:
+                if (tags[old] == way):
+                    del tags[old]
+                    break
+        tags[block] = way
+        order.append(way)
+
+    def misses(self, ways):
+        return self.missCounts
+
+
+#============================================================
+# Replays an address trace (a path or an iterable of (cycle,
+# address, flags)) through every config of `configs`, a list of
+# (name, Config), in one pass. Returns one result per config,
+# in order, as a dictionary of the FIELDS
+#============================================================
+def replay(trace, configs):
+    groups = {}                 # (sets, block words) -> StackGroup
+    models = []                 # the StackGroup or ReplayCache answering each config
+    for name, config in configs:
+        numSets, ways, blockWords = cacheGeometry(config)
+        if (config.cacheReplacement == "lru"):
+            model = groups.get((numSets, blockWords))
+            if (model is None):
+                model = groups[(numSets, blockWords)] = StackGroup(numSets, blockWords)
+            model.depth = max(model.depth, ways)
+        else:
+            model = ReplayCache(numSets, ways, blockWords, config.cacheReplacement,
+                                config.cacheSeed)
+        models.append(model)
+    for group in groups.values():
+        group.start()
+    simulated = list(groups.values()) + [model for model in models if (isinstance(model, ReplayCache))]
+
+    if (isinstance(trace, str)):
+        trace = readTrace(trace)
+    accesses = [0, 0]
+    for cycle, address, flags in trace:
+        kind = 1 if (flags & DATA) else 0
+        accesses[kind] += 1
+        for model in simulated:
+            model.access(address, kind)
+
+    results = []
+    for (name, config), model in zip(configs, models):
+        numSets, ways, blockWords = cacheGeometry(config)
+        misses = model.misses(ways)
+        total = accesses[0] + accesses[1]
+        results.append({"config": name,
+                        "sets": numSets,
+                        "ways": ways,
+                        "blockWords": blockWords,
+                        "replacement": config.cacheReplacement,
+                        "accesses": total,
+                        "misses": misses[0] + misses[1],
+                        "missRatio": round(float(misses[0] + misses[1]) / total, 6) if total else 0.0,
+                        "instructionMisses": misses[0],
+                        "dataMisses": misses[1]})
+    return results
+
+
+#############
+# Returns a Config for a "sets:ways:block words[:policy]" spec
+def configFromSpec(spec):
+    fields = spec.split(':')
+    options = {"cacheSets": int(fields[0]), "cacheWays": int(fields[1]),
+               "cacheBlockWords": int(fields[2])}
+    if (len(fields) > 3):
+        options["cacheReplacement"] = fields[3]
+    return Config(**options)
+
+
+#############
+# Returns (name, Config) for every combination of a
+# "sets,..:ways,..:block words,..[:policy,..]" grid
+def gridConfigs(spec):
+    fields = [field.split(',') for field in spec.split(':')]
+    policies = fields[3] if (len(fields) > 3) else ["lru"]
+    configs = []
+    for sets in fields[0]:
+        for ways in fields[1]:
+            for blockWords in fields[2]:
+                for policy in policies:
+                    name = sets + ":" + ways + ":" + blockWords + ":" + policy
+                    configs.append((name, configFromSpec(name)))
+    return configs
+
+
+def main(args):
+    traceName = None
+    outputFileName = None
+    configs = []
+
+    for i in range(len(args)):
+        if (args[i] == '-i' and i < (len(args) - 1)):
+            traceName = args[i + 1]
+        elif (args[i] == '-o' and i < (len(args) - 1)):
+            outputFileName = args[i + 1]
+        elif (args[i] == '-k' and i < (len(args) - 1)):
+            configs.append((args[i + 1], configFromSpec(args[i + 1])))
+        elif (args[i] == '-g' and i < (len(args) - 1)):
+            configs.extend(gridConfigs(args[i + 1]))
+
+    if (traceName is None or not configs):
+        print("usage: addresstrace.py -i <address trace> [-o <report.csv>]\n"
+              "                       [-k <sets>:<ways>:<block words>[:lru|fifo|random]] ...\n"
+              "                       [-g <sets,...>:<ways,...>:<block words,...>[:<policy,...>]] ...")
+        return 2
+
+    results = replay(traceName, configs)
+    out = open(outputFileName, "w") if (outputFileName is not None) else sys.stdout
+    out.write(",".join(FIELDS) + "\n")
+    for result in results:
+        out.write(",".join(str(result[field]) for field in FIELDS) + "\n")
+    if (outputFileName is not None):
+        out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
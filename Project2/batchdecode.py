@@ -0,0 +1,186 @@
+"""Whole-image disassembly with NumPy.
+
+Disassembler.disassemble() decodes the image a word at a time. For
+multi-megabyte images this module does the same work on whole arrays:
+the image is viewed as a uint32 array without copying, the fields are
+pulled out with vectorized shifts and masks, the BREAK is found with a
+vectorized search, and every column of the Disassembler is filled in a
+single step. Instruction records are built once per distinct word of
+the text section and shared by every copy of that word.
+
+output() writes the same _dis.txt as Disassembler.output(), character
+for character, rendering the binary fields of a chunk of lines at once.
+
+NumPy is optional and only imported when first needed; available() says
+whether it is installed, and worthwhile() whether an image is big enough
+to be worth the import. decode() and writeOutput() pick the batch or the
+word at a time path accordingly.
+"""
+
+from array import array
+
+from team23_project2 import TEXT_BASE, WORD_TYPECODE, Disassembler, Instruction
+
+MIN_WORDS = 1 << 16     # smaller images decode faster a word at a time
+CHUNK_LINES = 1 << 16   # _dis.txt lines rendered at once
+
+numpy = None            # imported on first use
+
+
+#############
+# Imports NumPy if it is installed; returns whether it is
+def available():
+    global numpy
+    if (numpy is None):
+        try:
+            import numpy as module
+        except ImportError:
+            return False
+        numpy = module
+    return True
+
+
+#############
+# True when the image is big enough to benefit and NumPy is there
+def worthwhile(words):
+    return len(words) >= MIN_WORDS and available()
+
+
+#############
+# Converts a NumPy array into an array of the given typecode
+def toArray(typecode, values):
+    result = array(typecode)
+    result.frombytes(values.astype(numpy.dtype(typecode)).tobytes())
+    return result
+
+
+#############
+# Disassembles an image, in one batch when that is worthwhile
+def decode(words):
+    if (worthwhile(words)):
+        return disassemble(words)
+    return Disassembler(words).disassemble()
+
+
+#############
+# Writes the _dis.txt of a program, in batches when that is worthwhile
+def writeOutput(dis, file):
+    if (dis.cacheEntry is None and worthwhile(dis.words)):
+        output(dis, file)
+    else:
+        dis.output(file)
+
+
+#============================================================
+# Disassembles an image and returns the Disassembler, with
+# every column equal to what disassemble() would build
+#============================================================
+def disassemble(words):
+    if (not available()):
+        raise ValueError("batch disassembly needs the numpy package")
+    dis = Disassembler(words)
+    w = numpy.frombuffer(dis.words, dtype=numpy.dtype(WORD_TYPECODE))
+
+    valid = w >> 31
+    opcode = (w >> 26) & 31
+    rType = (opcode == 0) | (opcode == 28)
+
+    # the text section runs up to and including the first valid BREAK
+    breaks = numpy.flatnonzero(valid.astype(bool) & rType & ((w & 63) == 13))
+    textEnd = int(breaks[0]) + 1 if len(breaks) else len(w)
+    text = w[:textEnd]
+
+    # one record per distinct word, shared by all its copies
+    unique, inverse = numpy.unique(text, return_inverse=True)
+    records = [Instruction(int(word)) for word in unique.tolist()]
+    dis.decoded = [records[i] for i in inverse.tolist()]
+    dis.instStrings = [record.text for record in dis.decoded]
+
+    # columns over the valid words of the text section
+    positions = numpy.flatnonzero(valid[:textEnd])
+    instructions = text[positions]
+    ops = opcode[positions].astype(numpy.int64)
+    rs = ((instructions >> 21) & 31).astype(numpy.int64)
+    rt = ((instructions >> 16) & 31).astype(numpy.int64)
+    rd = ((instructions >> 11) & 31).astype(numpy.int64)
+    imm = (instructions & 0xFFFF).astype(numpy.int64)
+    imm -= (imm & 0x8000) << 1
+    jump = ops == 2
+    third = numpy.where(rType[positions] | jump, rd, imm)
+
+    dis.instructions = toArray(WORD_TYPECODE, instructions)
+    dis.opcodes = toArray('B', ops)
+    dis.addrs = toArray(WORD_TYPECODE, TEXT_BASE + positions * 4)
+    dis.args1 = toArray('i', numpy.where(jump, -rs, rs))
+    dis.args2 = toArray('i', numpy.where(jump, -rt, rt))
+    dis.args3 = toArray('i', numpy.where(jump, -third, third))
+    dis.numInstrs = len(positions)
+
+    dis.valids = toArray('B', valid)
+    dis.mem = toArray('i', w[textEnd:])
+    dis.dataAddress = TEXT_BASE + textEnd * 4
+    return dis
+
+
+#############
+# Returns the '0'/'1' text of every word as a list of bytes, spaced
+# 1 5 5 5 5 5 6 like an instruction line when `spaced`
+def binaryStrings(words, spaced):
+    bits = numpy.unpackbits(words.astype(">u4").view(numpy.uint8).reshape(-1, 4), axis=1)
+    bits += ord('0')
+    if (spaced):
+        rows = numpy.empty((len(words), 38), dtype=numpy.uint8)
+        rows[:, 1::6] = ord(' ')
+        rows[:, 0] = bits[:, 0]
+        for field in range(5):
+            rows[:, 2 + 6 * field:7 + 6 * field] = bits[:, 1 + 5 * field:6 + 5 * field]
+        rows[:, 32:] = bits[:, 26:]
+        bits = rows
+    return bits.view("S" + str(bits.shape[1])).ravel().tolist()
+
+
+#############
+# Returns every integer in decimal as a list of bytes
+def decimalStrings(values):
+    return values.astype("S").tolist()
+
+
+#############
+# Joins three columns of bytes into tab separated lines
+def joinLines(first, second, third):
+    parts = [b"\t"] * (6 * len(first))
+    parts[0::6] = first
+    parts[2::6] = second
+    parts[4::6] = third
+    parts[5::6] = [b"\n"] * len(first)
+    return b"".join(parts).decode("ascii")
+
+
+#============================================================
+# Writes the disassembly exactly as Disassembler.output() does
+#============================================================
+def output(dis, file):
+    if (not available()):
+        raise ValueError("batch disassembly needs the numpy package")
+    words = numpy.frombuffer(dis.words, dtype=numpy.dtype(WORD_TYPECODE))
+    instructions = numpy.frombuffer(dis.instructions, dtype=numpy.dtype(WORD_TYPECODE))
+    values = numpy.frombuffer(dis.mem, dtype=numpy.int32)
+    count = len(instructions)
+
+    # one line per valid instruction, numbered from TEXT_BASE
+    # without gaps for the invalid words skipped
+    for start in range(0, count, CHUNK_LINES):
+        end = min(start + CHUNK_LINES, count)
+        texts = "\n".join(dis.instStrings[start:end]).encode("ascii").split(b"\n")
+        file.write(joinLines(binaryStrings(instructions[start:end], True),
+                             decimalStrings(numpy.arange(TEXT_BASE + start * 4, TEXT_BASE + end * 4, 4)),
+                             texts))
+
+    # then one line per data word, continuing from the valid
+    # instruction count, as output() does
+    for start in range(0, len(values), CHUNK_LINES):
+        end = min(start + CHUNK_LINES, len(values))
+        first = count + start
+        file.write(joinLines(binaryStrings(words[first:count + end], False),
+                             decimalStrings(numpy.arange(TEXT_BASE + first * 4, TEXT_BASE + (count + end) * 4, 4)),
+                             decimalStrings(values[start:end])))
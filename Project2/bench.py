@@ -0,0 +1,240 @@
+"""Simulator throughput benchmarks.
+
+Runs a fixed suite of synthetic workloads (see workloads.py) through
+Simulator.run and reports, per case:
+
+  decode    seconds to disassemble the image
+  cycles    simulated cycles
+  rate      simulated cycles per host second
+  relative  simulated cycles per 1000 rounds of a calibration loop
+  rss       peak resident set size of the process, in KiB
+
+Each case runs in a fresh interpreter so its peak RSS is its own, and
+times calibrate() there first: a fixed loop of the list, attribute and
+dict operations the pipeline spends its time on. Dividing the rate by
+its speed cancels most of the difference between hosts and Python
+builds, so the baselines in bench_baselines.json hold relative rates,
+not raw ones. A case whose relative rate drops by more than the
+tolerance, or whose RSS grows by more than the tolerance plus
+RSS_SLACK_KIB, is reported as a regression and makes the exit status
+non-zero.
+
+Regenerate the baselines with -s (on a quiet machine, every case) after
+a change that is meant to move them, or when the interpreter changes
+enough that unchanged code is reported as regressed.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baselines.json")
+CALIBRATION_ROUNDS = 200000
+REPEATS = 5                 # runs of every case; the median counts
+RSS_SLACK_KIB = 4096        # allocator and interpreter noise allowed on top of the tolerance
+
+# name: (kind, body words, data words, iterations, cycle limit)
+SUITE = {
+    "alu-small": ("alu", 200, 256, 200, None),
+    "mem-medium": ("mem", 2000, 8192, 20, None),
+    "branch-medium": ("branch", 2000, 256, 20, None),
+    "stride-1M": ("stride", 64, 1 << 20, 400, None),
+    "alu-256K": ("alu", 1 << 18, 256, 1, 50000),
+    "stride-4M": ("stride", 256, 1 << 22, 1000, 100000),
+}
+
+
+#############
+# Peak resident set size of this process in KiB
+def peakRSS():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == "darwin"):
+        peak //= 1024       # bytes on macOS, KiB elsewhere
+    return peak
+
+
+#############
+# Rounds per second of the calibration loop
+def calibrate(rounds=CALIBRATION_ROUNDS):
+    class Stage(object):
+        pass
+    stage = Stage()
+    stage.buffer = [-1] * 4
+    stage.kinds = dict((i, i % 5) for i in range(64))
+    stage.retired = 0
+    buffer = stage.buffer
+    start = time.perf_counter()
+    for i in range(rounds):
+        index = i & 63
+        if (buffer[-1] != -1):
+            del buffer[0]
+            buffer.append(-1)
+        if (stage.kinds[index] != 0):
+            buffer[buffer.index(-1)] = index
+            stage.retired += 1
+    return rounds / (time.perf_counter() - start)
+
+
+#############
+# Runs one case in this process and returns its measurements
+def runCase(name):
+    from team23_project2 import Simulator
+    import batchdecode
+    import workloads
+
+    kind, textWords, dataWords, iterations, maxCycles = SUITE[name]
+    words = workloads.generate(kind, textWords, dataWords, iterations)
+
+    start = time.perf_counter()
+    program = batchdecode.decode(words)
+    decodeSeconds = time.perf_counter() - start
+
+    # the host's speed drifts by tens of percent within seconds, so each
+    # run is divided by the calibration loop timed right around it
+    rates = []
+    relativeRates = []
+    for repeat in range(REPEATS):
+        before = calibrate()
+        sim = Simulator(program)
+        start = time.perf_counter()
+        cycles = sim.run(maxCycles=maxCycles)
+        seconds = time.perf_counter() - start
+        calibration = (before + calibrate()) / 2
+        rates.append(cycles / seconds)
+        relativeRates.append(1000 * rates[-1] / calibration)
+    rate = sorted(rates)[REPEATS // 2]
+    return {"name": name,
+            "decodeSeconds": round(decodeSeconds, 4),
+            "cycles": cycles,
+            "seconds": round(seconds, 4),
+            "cyclesPerSecond": round(rate),
+            "relativeRate": round(sorted(relativeRates)[REPEATS // 2], 3),
+            "peakRSSKiB": peakRSS()}
+
+
+#############
+# Runs one case in a fresh interpreter
+def runIsolated(name):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "-c", name, "-i"])
+    return json.loads(output.decode("ascii"))
+
+
+#############
+# Stored baselines by case; ones with raw rates only, stored before
+# rates were calibrated, are left out
+def loadBaselines():
+    if (not os.path.exists(BASELINE_FILE)):
+        return {}
+    with open(BASELINE_FILE) as f:
+        baselines = json.load(f)
+    return dict((name, baseline) for name, baseline in baselines.items() if ("relativeRate" in baseline))
+
+
+def saveBaselines(results):
+    baselines = loadBaselines()
+    for result in results:
+        baselines[result["name"]] = {"relativeRate": result["relativeRate"],
+                                     "peakRSSKiB": result["peakRSSKiB"]}
+    with open(BASELINE_FILE, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+#############
+# Returns the regressions of one result against its baseline
+def regressions(result, baseline, tolerance):
+    found = []
+    if (baseline is None):
+        return found
+    if (result["relativeRate"] < baseline["relativeRate"] * (1 - tolerance)):
+        found.append("relative rate " + str(result["relativeRate"]) + " < baseline " +
+                     str(baseline["relativeRate"]))
+    if (result["peakRSSKiB"] > baseline["peakRSSKiB"] * (1 + tolerance) + RSS_SLACK_KIB):
+        found.append("rss " + str(result["peakRSSKiB"]) + " > baseline " +
+                     str(baseline["peakRSSKiB"]))
+    return found
+
+
+def formatResult(result, baseline, problems):
+    line = (result["name"].ljust(16) +
+            " decode " + ("%.3fs" % result["decodeSeconds"]).rjust(8) +
+            "  cycles " + str(result["cycles"]).rjust(8) +
+            "  rate " + str(result["cyclesPerSecond"]).rjust(8) + "/s" +
+            "  relative " + ("%.2f" % result["relativeRate"]).rjust(8) +
+            "  rss " + str(result["peakRSSKiB"]).rjust(8) + " KiB")
+    if (baseline is not None):
+        change = result["relativeRate"] / baseline["relativeRate"] - 1
+        line += "  (" + ("%+.1f" % (change * 100)) + "% vs baseline)"
+    for problem in problems:
+        line += "\n    REGRESSION: " + problem
+    return line
+
+
+#========================================
+# Main Code
+#========================================
+def main(args):
+    names = []
+    inProcess = False
+    save = False
+    tolerance = 0.3
+    outputFileName = None
+
+    for i in range(len(args)):
+        if (args[i] == '-c' and i < (len(args) - 1)):
+            names.append(args[i + 1])
+        elif (args[i] == '-i'):
+            inProcess = True
+        elif (args[i] == '-s'):
+            save = True
+        elif (args[i] == '-t' and i < (len(args) - 1)):
+            tolerance = float(args[i + 1])
+        elif (args[i] == '-o' and i < (len(args) - 1)):
+            outputFileName = args[i + 1]
+        elif (args[i] == '-h'):
+            print("usage: bench.py [-c <case>]... [-s] [-t <tolerance>] [-o <report file>]\n"
+                  "cases: " + ", ".join(sorted(SUITE)))
+            return 2
+
+    for name in names:
+        if (name not in SUITE):
+            print("unknown case '" + name + "'; cases: " + ", ".join(sorted(SUITE)))
+            return 2
+    if (not names):
+        names = list(SUITE)
+
+    if (inProcess):
+        # child of runIsolated: one case, result as JSON on stdout
+        print(json.dumps(runCase(names[0])))
+        return 0
+
+    baselines = loadBaselines()
+    results = []
+    lines = []
+    failed = 0
+    for name in names:
+        result = runIsolated(name)
+        results.append(result)
+        baseline = baselines.get(name)
+        problems = regressions(result, baseline, tolerance)
+        if (problems):
+            failed += 1
+        lines.append(formatResult(result, baseline, problems))
+        print(lines[-1])
+        sys.stdout.flush()
+
+    if (outputFileName is not None):
+        with open(outputFileName, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    if (save):
+        saveBaselines(results)
+        print("baselines saved to " + BASELINE_FILE)
+        return 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,221 @@
+"""Checkpoints of the complete Simulator state.
+
+A checkpoint holds everything a Simulator needs to carry on exactly as if
+it had never stopped: PC, cycle, registers, main memory, every cache
+line with its replacement order, pending misses and counters, the
+prefetch buffer, victim cache and write buffer, every pipeline buffer
+and the Config it ran with. Restoring one and running on produces the
+same cycles, trace and results as the original run.
+
+File layout (little endian):
+
+  8 bytes   magic "MIPSCKPT"
+  2 bytes   format version
+  4 bytes   length of the JSON state
+  4 bytes   number of memory words
+  rest      zlib stream of the JSON state followed by the memory words
+
+The program text is not stored separately; the text section is never
+written, so it is decoded again from the restored memory unless the
+caller passes the program in.
+"""
+
+import hashlib
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+from team23_project2 import Config, Simulator, Disassembler, Instruction, WORD_TYPECODE
+
+MAGIC = b"MIPSCKPT"
+VERSION = 2
+HEADER = struct.Struct("<8sHII")
+
+# counters of the prefetcher, victim cache and write buffer
+EXTENSION_COUNTERS = ("prefetches", "prefetchHits", "prefetchLate", "prefetchUnused",
+                      "victimHits", "victimCastouts", "bufferedWritebacks", "writebackStalls")
+
+
+#############
+# Hash of the text section, used to check a checkpoint against a program
+def textHash(program):
+    return hashlib.sha1(program.words[:len(program.decoded)].tobytes()).hexdigest()
+
+
+#############
+# Buffers hold -1 or tuples, which JSON turns into lists
+def bufferFromJson(buffer):
+    return [tuple(entry) if isinstance(entry, list) else entry for entry in buffer]
+
+
+#############
+# Returns the state of a Simulator as plain JSON-able values
+def simulatorState(sim):
+    cache = sim.cache
+    state = {
+        "config": dict(vars(sim.config)),
+        "textHash": textHash(sim.program),
+        "imageWords": len(sim.program.words),
+        "PC": sim.PC,
+        "cycle": sim.cycle,
+        "halted": sim.halted,
+        "instructionsRetired": sim.instructionsRetired,
+        "registers": sim.registers,
+        "extraDecoded": [inst.word for inst in sim.decoded[sim.dataStart:]],
+        "fetch": {"preIssueBuffer": sim.fetch.preIssueBuffer,
+                  "stopped": sim.fetch.stopped,
+                  "breakFound": sim.fetch.breakFound,
+                  "pendingBranch": sim.fetch.pendingBranch,
+                  "olderCount": sim.fetch.olderCount,
+                  "speculativeNops": sim.fetch.speculativeNops,
+                  "predictor": (None if (sim.fetch.predictor is None) else
+                                sim.fetch.predictor.getState())},
+        "preALUBuff": sim.ALU.preALUBuff,
+        "postALUBuff": sim.ALU.postALUBuff,
+        "preMEMBuff": sim.MEM.preMEMBuff,
+        "postMEMBuff": sim.MEM.postMEMBuff,
+        "cache": {"cacheSets": cache.cacheSets,
+                  "order": cache.order,
+                  "pending": sorted(cache.pending.items()),
+                  "rng": cache.rng.getstate(),
+                  "hits": cache.hits,
+                  "misses": cache.misses,
+                  "evictions": cache.evictions,
+                  "writebacks": cache.writebacks,
+                  "prefetched": list(cache.prefetched.items()),
+                  "strideTable": list(cache.strideTable.items()),
+                  "victims": list(cache.victims.items()),
+                  "writeBuffer": cache.writeBuffer,
+                  "extensionCounters": dict((name, getattr(cache, name)) for name in EXTENSION_COUNTERS)},
+    }
+    return state
+
+
+#############
+# Copies a state made by simulatorState() into a fresh Simulator
+def applyState(sim, state):
+    sim.PC = state["PC"]
+    sim.cycle = state["cycle"]
+    sim.halted = state["halted"]
+    sim.instructionsRetired = state["instructionsRetired"]
+    sim.registers[:] = state["registers"]
+    for word in state["extraDecoded"]:
+        sim.decoded.append(Instruction(word))
+
+    fetch = state["fetch"]
+    sim.fetch.preIssueBuffer[:] = fetch["preIssueBuffer"]
+    sim.fetch.stopped = fetch["stopped"]
+    sim.fetch.breakFound = fetch["breakFound"]
+    if (fetch.get("pendingBranch") is not None):
+        sim.fetch.pendingBranch = tuple(fetch["pendingBranch"])
+        sim.fetch.olderCount = fetch["olderCount"]
+        sim.fetch.speculativeNops = fetch["speculativeNops"]
+    if (sim.fetch.predictor is not None and fetch.get("predictor") is not None):
+        sim.fetch.predictor.setState(fetch["predictor"])
+    sim.ALU.preALUBuff[:] = state["preALUBuff"]
+    sim.ALU.postALUBuff[:] = bufferFromJson(state["postALUBuff"])
+    sim.MEM.preMEMBuff[:] = bufferFromJson(state["preMEMBuff"])
+    sim.MEM.postMEMBuff[:] = bufferFromJson(state["postMEMBuff"])
+    sim.scoreboard.rebuild(sim)
+
+    cache = sim.cache
+    saved = state["cache"]
+    for setIndex in range(cache.numSets):
+        cache.cacheSets[setIndex][:] = saved["cacheSets"][setIndex]
+        cache.order[setIndex][:] = saved["order"][setIndex]
+        tags = cache.tagMaps[setIndex]
+        tags.clear()
+        for way in range(cache.ways):
+            line = cache.cacheSets[setIndex][way]
+            if (line[0] == 1):
+                tags[line[2]] = way
+    cache.pending = dict((block, ready) for block, ready in saved["pending"])
+    version, internal, gauss = saved["rng"]
+    cache.rng.setstate((version, tuple(internal), gauss))
+    cache.hits = saved["hits"]
+    cache.misses = saved["misses"]
+    cache.evictions = saved["evictions"]
+    cache.writebacks = saved["writebacks"]
+    cache.prefetched = dict((block, ready) for block, ready in saved.get("prefetched", []))
+    cache.strideTable = dict((index, entry) for index, entry in saved.get("strideTable", []))
+    cache.victims = dict((block, line) for block, line in saved.get("victims", []))
+    cache.writeBuffer = list(saved.get("writeBuffer", []))
+    counters = saved.get("extensionCounters", {})
+    for name in EXTENSION_COUNTERS:
+        setattr(cache, name, counters.get(name, 0))
+
+
+#============================================================
+# Writes the complete state of a Simulator to a file
+#============================================================
+def save(sim, path):
+    state = simulatorState(sim)
+    if (isinstance(sim.memory, array)):
+        memory = array(WORD_TYPECODE, sim.memory)
+    else:
+        # sparse memory: only the allocated pages, in page order
+        numbers = sorted(sim.memory.pages)
+        state["pagedMemory"] = {"size": len(sim.memory), "pages": numbers}
+        memory = array(WORD_TYPECODE)
+        for number in numbers:
+            memory += sim.memory.pages[number]
+    state = json.dumps(state, separators=(",", ":")).encode("ascii")
+    if (sys.byteorder != "little"):
+        memory.byteswap()
+
+    compressor = zlib.compressobj(6)
+    body = compressor.compress(state) + compressor.compress(memory.tobytes()) + compressor.flush()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(state), len(memory)))
+        f.write(body)
+
+
+#============================================================
+# Reads a checkpoint and returns a Simulator that continues
+# from it
+#
+# program, when given, must have the same text section as the
+# checkpointed one and is shared instead of decoded again;
+# config overrides the saved one (the cache geometry must match)
+#============================================================
+def load(path, program=None, config=None):
+    with open(path, "rb") as f:
+        data = f.read()
+    if (len(data) < HEADER.size):
+        raise ValueError(path + " is not a checkpoint")
+    magic, version, stateLength, memoryWords = HEADER.unpack_from(data)
+    if (magic != MAGIC):
+        raise ValueError(path + " is not a checkpoint")
+    if (version != VERSION):
+        raise ValueError("unsupported checkpoint version " + str(version))
+
+    body = zlib.decompress(data[HEADER.size:])
+    if (len(body) != stateLength + memoryWords * 4):
+        raise ValueError(path + " is truncated")
+    state = json.loads(body[:stateLength].decode("ascii"))
+    memory = array(WORD_TYPECODE)
+    memory.frombytes(body[stateLength:])
+    if (sys.byteorder != "little"):
+        memory.byteswap()
+    paged = state.get("pagedMemory")
+    if (paged is not None):
+        import pagedmemory
+        words = memory
+        memory = pagedmemory.PagedMemory(paged["size"])
+        for i in range(len(paged["pages"])):
+            memory.allocate(paged["pages"][i])[:] = words[i * pagedmemory.PAGE_WORDS:
+                                                          (i + 1) * pagedmemory.PAGE_WORDS]
+
+    if (program is None):
+        program = Disassembler(memory[:] if (paged is None) else
+                               memory.dump(0, state["imageWords"])).disassemble()
+    if (textHash(program) != state["textHash"]):
+        raise ValueError("checkpoint was taken from a different program")
+    if (config is None):
+        config = Config(**state["config"])
+
+    sim = Simulator(program, config, memory=memory)
+    applyState(sim, state)
+    return sim
@@ -0,0 +1,155 @@
+"""Microarchitectural performance counters.
+
+Attach a PerformanceCounters to a Simulator and every simulated cycle
+is accounted for:
+
+  - for each stage (Fetch, Issue, ALU, MEM, WB), the cycles it was busy,
+    empty, or stalled, and why it stalled (full Pre-Issue Buffer, full
+    Pre-ALU Queue, I-cache miss, D-cache miss, structural or data hazard,
+    waiting on a predicted branch)
+  - occupancy histograms of every buffer, sampled at the end of a cycle
+  - instruction and data cache misses per PC
+
+toDict() / write() export everything, together with instructions
+retired, IPC, CPI, the cache statistics and the branch predictor
+counters, as JSON.
+"""
+
+import json
+
+from team23_project2 import (TEXT_BASE, STAGE_EMPTY, STAGE_BUSY, STALL_ICACHE_MISS,
+                             STALL_DCACHE_MISS, STATUS_NAMES)
+
+STAGES = ("Fetch", "Issue", "ALU", "MEM", "WB")
+
+
+#========================================
+# Performance Counters Class
+#========================================
+class PerformanceCounters(object):
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.cycles = 0
+        self.startRetired = sim.instructionsRetired
+
+        # status counts per stage, indexed by the STAGE_/STALL_ constants
+        self.statusCounts = [[0] * len(STATUS_NAMES) for stage in STAGES]
+
+        self.buffers = (("preIssue", sim.fetch.preIssueBuffer),
+                        ("preALU", sim.ALU.preALUBuff),
+                        ("preMEM", sim.MEM.preMEMBuff),
+                        ("postALU", sim.ALU.postALUBuff),
+                        ("postMEM", sim.MEM.postMEMBuff))
+        # occupancy[b][n] = cycles buffer b ended holding n entries
+        self.occupancy = [[0] * (len(buffer) + 1) for name, buffer in self.buffers]
+
+        self.instructionMisses = {}     # PC -> I-cache misses
+        self.dataMisses = {}            # PC of the LW/SW -> D-cache misses
+        self.lastInstructionMiss = None     # PC stalled on an I-cache miss last cycle
+        self.lastDataMiss = None
+
+    #############
+    # Attaches new counters to a Simulator and returns them
+    @classmethod
+    def attach(cls, sim):
+        sim.counters = cls(sim)
+        return sim.counters
+
+    #############
+    # Called by Simulator.step() with the status of every stage
+    def record(self, fetchStatus, issueStatus, aluStatus, memStatus, wbStatus):
+        self.cycles += 1
+        counts = self.statusCounts
+        counts[0][fetchStatus] += 1
+        counts[1][issueStatus] += 1
+        counts[2][aluStatus] += 1
+        counts[3][memStatus] += 1
+        counts[4][wbStatus] += 1
+
+        # a miss stalls its stage until the block arrives; count it once
+        if (fetchStatus == STALL_ICACHE_MISS):
+            PC = self.sim.PC
+            if (PC != self.lastInstructionMiss):
+                self.instructionMisses[PC] = self.instructionMisses.get(PC, 0) + 1
+            self.lastInstructionMiss = PC
+        else:
+            self.lastInstructionMiss = None
+        if (memStatus == STALL_DCACHE_MISS):
+            PC = TEXT_BASE + self.sim.MEM.preMEMBuff[0][0] * 4
+            if (PC != self.lastDataMiss):
+                self.dataMisses[PC] = self.dataMisses.get(PC, 0) + 1
+            self.lastDataMiss = PC
+        else:
+            self.lastDataMiss = None
+
+        self.recordOccupancy(1)
+
+    #############
+    # Called by the Simulator for `cycles` skipped idle cycles, each of
+    # which would have ended with the given statuses
+    def recordIdle(self, cycles, statuses):
+        self.cycles += cycles
+        for i in range(len(STAGES)):
+            self.statusCounts[i][statuses[i]] += cycles
+        self.recordOccupancy(cycles)
+
+    def recordOccupancy(self, cycles):
+        for i in range(len(self.buffers)):
+            buffer = self.buffers[i][1]
+            used = 0
+            for entry in buffer:
+                if (entry != -1):
+                    used += 1
+            self.occupancy[i][used] += cycles
+
+    #############
+    # Instructions retired since the counters were attached
+    def instructions(self):
+        return self.sim.instructionsRetired - self.startRetired
+
+    #############
+    # Returns every counter as a dictionary of plain values
+    def toDict(self):
+        instructions = self.instructions()
+        stages = {}
+        stallTotals = dict.fromkeys(STATUS_NAMES[2:], 0)
+        for i in range(len(STAGES)):
+            counts = self.statusCounts[i]
+            stalls = {}
+            for status in range(2, len(STATUS_NAMES)):
+                if (counts[status]):
+                    stalls[STATUS_NAMES[status]] = counts[status]
+                    stallTotals[STATUS_NAMES[status]] += counts[status]
+            stages[STAGES[i]] = {"busy": counts[STAGE_BUSY],
+                                 "empty": counts[STAGE_EMPTY],
+                                 "stalled": self.cycles - counts[STAGE_BUSY] - counts[STAGE_EMPTY],
+                                 "stalls": stalls}
+
+        return {"cycles": self.cycles,
+                "instructions": instructions,
+                "IPC": (float(instructions) / self.cycles) if self.cycles else 0.0,
+                "CPI": (float(self.cycles) / instructions) if instructions else None,
+                "stages": stages,
+                "stallReasons": stallTotals,
+                "occupancy": dict((self.buffers[i][0], self.occupancy[i])
+                                  for i in range(len(self.buffers))),
+                "misses": {"instruction": missTable(self.instructionMisses),
+                           "data": missTable(self.dataMisses)},
+                "cache": self.sim.cache.stats(),
+                "branchPredictor": (None if (self.sim.fetch.predictor is None) else
+                                    self.sim.fetch.predictor.stats())}
+
+    #############
+    # Writes the counters to a JSON file
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.toDict(), f, indent=2)
+            f.write("\n")
+
+
+#############
+# Per-PC miss counts, worst first, with the PCs as JSON object keys
+def missTable(misses):
+    order = sorted(misses, key=lambda PC: (-misses[PC], PC))
+    return dict((str(PC), misses[PC]) for PC in order)
@@ -0,0 +1,249 @@
+"""Content-addressed on-disk cache of decoded programs.
+
+Sweeps disassemble the same image once per configuration. With a cache
+directory, the first run stores the decoded program in a file named by
+a hash of the image and DECODER_VERSION, and every later run of the same
+image maps that file instead of parsing the image again. The columns
+of the Disassembler it gives are read-only views of the mapping, so
+nothing is copied, and the file stays mapped while any of them is in
+use. The rendered _dis.txt is stored too, so writing it is a plain
+copy.
+
+File layout (little endian), every section starting on an 8 byte
+boundary:
+
+  8 bytes   magic "MIPSDECO"
+  4 bytes   decoder version
+  32 bytes  SHA-256 key of the entry
+  4 bytes   number of sections
+  then per section: 8 byte name, 8 byte offset, 8 byte length
+
+  instrs    valid words of the text section (u32)
+  opcodes   their opcodes (u8)
+  valids    valid bit of every word of the image (u8)
+  addrs     addresses of the valid words (u32)
+  args1-3   Disassembler argument columns (i32)
+  unique    the distinct words of the text section (u32)
+  texts     the formatted instruction of every word in unique, one per line
+  index     for every word of the text section, its place in unique (u32)
+  output    the _dis.txt text (ASCII)
+
+The data section is the image past the text section, which the caller
+already holds, so it is not stored again. Instruction records are built
+for the distinct words only, with their stored text, and shared by
+their copies.
+
+Bump DECODER_VERSION whenever decoding or the _dis.txt format changes;
+entries of other versions are then never looked at again.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from team23_project2 import TEXT_BASE, WORD_TYPECODE, Disassembler, Instruction
+import batchdecode
+
+MAGIC = b"MIPSDECO"
+DECODER_VERSION = 1
+HEADER = struct.Struct("<8sI32sI")
+SECTION = struct.Struct("<8sQQ")
+
+# (section name, Disassembler column, typecode) of every stored column
+COLUMNS = ((b"instrs", "instructions", WORD_TYPECODE),
+           (b"opcodes", "opcodes", "B"),
+           (b"valids", "valids", "B"),
+           (b"addrs", "addrs", WORD_TYPECODE),
+           (b"args1", "args1", "i"),
+           (b"args2", "args2", "i"),
+           (b"args3", "args3", "i"))
+
+COPY_CHUNK = 1 << 20    # bytes of output copied at once
+
+
+#############
+# SHA-256 of the decoder version and the image, as bytes
+def imageKey(words):
+    words = array(WORD_TYPECODE, words)
+    if (sys.byteorder != "little"):
+        words.byteswap()
+    digest = hashlib.sha256(MAGIC + struct.pack("<I", DECODER_VERSION))
+    digest.update(words.tobytes())
+    return digest.digest()
+
+
+def entryPath(directory, key):
+    return os.path.join(directory, key.hex() + ".dec")
+
+
+#############
+# Packs an array as little endian bytes
+def littleEndian(values):
+    if (sys.byteorder != "little" and values.itemsize > 1):
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+#========================================
+# Cache Entry Class
+#========================================
+class Entry(object):
+    """The rendered output of a cached program, copied on demand."""
+
+    def __init__(self, path, offset, length):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def writeOutput(self, file):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            left = self.length
+            while (left > 0):
+                chunk = f.read(min(COPY_CHUNK, left))
+                if (not chunk):
+                    raise ValueError(self.path + " is truncated")
+                file.write(chunk.decode("ascii"))
+                left -= len(chunk)
+
+
+#============================================================
+# Writes a decoded program to the cache and returns the Entry
+# of its output
+#
+# The file is written under a temporary name of its own and
+# renamed into place, so concurrent runs, in other processes
+# or threads, never see or write into half an entry
+#============================================================
+def store(directory, key, dis):
+    if (not os.path.isdir(directory)):
+        os.makedirs(directory, exist_ok=True)
+    path = entryPath(directory, key)
+
+    unique = {}
+    texts = []
+    index = array(WORD_TYPECODE)
+    for record in dis.decoded:
+        position = unique.get(record.word)
+        if (position is None):
+            position = unique[record.word] = len(texts)
+            texts.append(record.text)
+        index.append(position)
+    sections = [(name, littleEndian(getattr(dis, column))) for name, column, typecode in COLUMNS]
+    sections.append((b"unique", littleEndian(array(WORD_TYPECODE, list(unique)))))
+    sections.append((b"texts", "\n".join(texts).encode("ascii")))
+    sections.append((b"index", littleEndian(index)))
+
+    count = len(sections) + 1
+    offset = HEADER.size + SECTION.size * count
+    table = []
+    descriptor, temporary = tempfile.mkstemp(".tmp", os.path.basename(path) + ".", directory)
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(b"\0" * offset)
+            for name, data in sections:
+                offset = (offset + 7) & ~7
+                f.seek(offset)
+                f.write(data)
+                table.append((name, offset, len(data)))
+                offset += len(data)
+
+            # the output goes straight to the file through a text layer
+            offset = (offset + 7) & ~7
+            f.seek(offset)
+            text = io.TextIOWrapper(f, encoding="ascii", newline="\n")
+            batchdecode.writeOutput(dis, text)
+            text.flush()
+            text.detach()
+            table.append((b"output", offset, f.tell() - offset))
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, DECODER_VERSION, key, count))
+            for entry in table:
+                f.write(SECTION.pack(*entry))
+        os.replace(temporary, path)
+    finally:
+        if (os.path.exists(temporary)):
+            os.remove(temporary)
+    return Entry(path, table[-1][1], table[-1][2])
+
+
+#============================================================
+# Reads a cached program; returns None when there is no entry
+# for the key or the entry is not usable. Its columns are
+# views of the mapped file (copies on big endian hosts)
+#============================================================
+def load(directory, key, words):
+    path = entryPath(directory, key)
+    try:
+        f = open(path, "rb")
+    except IOError:
+        return None
+    with f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None         # empty file
+    try:
+        if (len(mapped) < HEADER.size):
+            return None
+        magic, version, storedKey, count = HEADER.unpack_from(mapped)
+        if (magic != MAGIC or version != DECODER_VERSION or storedKey != key):
+            return None
+        sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(mapped, HEADER.size + SECTION.size * i)
+            if (offset + length > len(mapped)):
+                return None
+            sections[name.rstrip(b"\0")] = (offset, length)
+
+        def column(name, typecode):
+            offset, length = sections[name]
+            values = memoryview(mapped)[offset:offset + length].cast(typecode)
+            if (sys.byteorder != "little" and values.itemsize > 1):
+                values = array(typecode, values)
+                values.byteswap()
+            return values
+
+        dis = Disassembler(words)
+        for name, attribute, typecode in COLUMNS:
+            setattr(dis, attribute, column(name, typecode))
+        unique = column(b"unique", WORD_TYPECODE)
+        offset, length = sections[b"texts"]
+        texts = mapped[offset:offset + length].decode("ascii").split("\n") if (unique) else []
+        if (len(texts) != len(unique)):
+            return None
+        records = list(map(Instruction, unique, texts))
+        index = column(b"index", WORD_TYPECODE)
+        dis.decoded = list(map(records.__getitem__, index))
+        dis.instStrings = list(map(texts.__getitem__, index))
+        dis.numInstrs = len(dis.instructions)
+
+        textEnd = len(dis.decoded)
+        dis.dataAddress = TEXT_BASE + textEnd * 4
+        dis.mem.frombytes(dis.words[textEnd:].tobytes())
+        dis.cacheEntry = Entry(path, *sections[b"output"])
+        return dis
+    except (KeyError, IndexError, TypeError, struct.error):
+        return None         # a section is missing, misaligned or the table is damaged
+
+
+#============================================================
+# Disassembles words through the cache in `directory`: loads
+# the entry when there is one, otherwise decodes and stores it
+#============================================================
+def disassemble(words, directory):
+    if (not isinstance(words, array) or words.typecode != WORD_TYPECODE):
+        words = array(WORD_TYPECODE, words)
+    key = imageKey(words)
+    dis = load(directory, key, words)
+    if (dis is None):
+        dis = batchdecode.decode(words)
+        dis.cacheEntry = store(directory, key, dis)
+    return dis
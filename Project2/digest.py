@@ -0,0 +1,586 @@
+"""Per-cycle state digests and streaming trace comparison.
+
+A DigestWriter is a tracer like tracing.TraceWriter. At the end of
+every cycle it reduces the state of the Simulator to one CRC-32 per
+field:
+
+  PC          the PC itself
+  buffers     every entry of the five pipeline buffers
+  registers   R0-R31
+  cache       the XOR of one CRC-32 per set, of its lines (valid, dirty,
+              tag, words) and replacement order, so a cycle only rehashes
+              the sets it accessed
+  memory      main memory past the text section: the XOR of one CRC-32
+              per region of REGION_WORDS words (0 for a region of zeros),
+              so a write-back only rehashes the regions it touched
+
+The incremental fields need to hear about changes: a StateDigest puts a
+set on the cache's writeWatchers for the blocks written to memory, and
+wraps that one Cache's accessMem and flush to learn the sets they touch,
+until detach().
+
+A run of cycles with the same fields is kept as one record, so idle
+stretches take one record whether the Simulator skipped them or not.
+Each record also carries a rolling digest chained through every record
+before it, so the chain of the last record fingerprints the whole run.
+
+File layout (little endian):
+
+  8 bytes   magic "MIPSDGST"
+  4 bytes   format version
+  then one record per run of identical cycles:
+  8 bytes   first cycle
+  4 bytes   cycles it covers
+  4 bytes   rolling digest
+  20 bytes  PC, buffers, registers, cache and memory digests (4 each)
+
+compare() reads two digest files, or two text traces (_pipeline.txt,
+_dis.txt, plain or compressed), a chunk at a time in constant memory and
+returns the first Divergence: the cycle and field where they part, with
+both sides. A DigestChecker is a tracer that checks a run against a
+golden digest file as it goes and raises the Divergence at the first
+cycle that differs, so a bad run stops at once.
+"""
+
+import gzip
+import io
+import struct
+import sys
+import zlib
+from array import array
+
+from team23_project2 import TEXT_BASE
+import tracing
+
+MAGIC = b"MIPSDGST"
+FORMAT_VERSION = 3
+HEADER = struct.Struct("<8sI")
+RECORD = struct.Struct("<QII5I")
+
+FIELDS = ("PC", "buffers", "registers", "cache", "memory")
+
+REGION_WORDS = 256          # words of memory behind each region CRC
+BUFFER_RECORDS = 1 << 14    # records buffered before they are written
+READ_RECORDS = 1 << 14      # records read at once
+CHUNK_BYTES = 1 << 20       # bytes of a text trace read at once
+
+CYCLE_HEADER = tracing.HEADER.encode("ascii")     # starts the dump of every cycle
+
+
+#========================================
+# Divergence Class
+#========================================
+class Divergence(Exception):
+    """The first point at which two runs differ.
+
+    cycle is None where there are no cycles (a _dis.txt); field names
+    what differs, expected and actual are the two sides.
+    """
+
+    def __init__(self, cycle, field, expected, actual):
+        self.cycle = cycle
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+        where = ("cycle " + str(cycle) + ", ") if (cycle is not None) else ""
+        Exception.__init__(self, "first divergence at " + where + field + ":\n  expected: " +
+                           str(expected) + "\n  actual:   " + str(actual))
+
+
+#############
+# CRC-32 of an array's items, in little endian order on any machine
+def arrayDigest(values, crc=0):
+    if (sys.byteorder != "little"):
+        values = array(values.typecode, values)
+        values.byteswap()
+    return zlib.crc32(values, crc)
+
+
+#========================================
+# State Digest Class
+#========================================
+class StateDigest(object):
+    """Reduces the state of one Simulator to the digest of every field."""
+
+    def __init__(self, sim):
+        self.buffers = (sim.fetch.preIssueBuffer, sim.ALU.preALUBuff, sim.ALU.postALUBuff,
+                        sim.MEM.preMEMBuff, sim.MEM.postMEMBuff)
+        self.regions = {}           # region number -> CRC, of the regions holding anything but zeros
+        self.memoryDigest = 0       # XOR of every region CRC
+        self.written = set()        # blocks the cache wrote to memory since the regions were updated
+        sim.cache.writeWatchers.append(self.written)
+        self.hashMemory(sim)
+
+        cache = sim.cache
+        self.sets = [0] * cache.numSets     # CRC of every set
+        self.cacheDigest = 0                # XOR of them all
+        self.touched = set(range(cache.numSets))    # sets accessed since they were hashed
+        self.updateCache(sim)
+        self.wrapped = {}           # name -> what accessMem / flush were on the cache before
+        touched = self.touched
+        offsetBits = cache.offsetBits
+        setMask = cache.setMask
+
+        def accessMem(memIndex, *args):
+            touched.add(((TEXT_BASE + memIndex * 4) >> offsetBits) & setMask)
+            return access(memIndex, *args)
+
+        def flush():
+            touched.update(range(cache.numSets))
+            return flushAll()
+        access = self.wrap(cache, "accessMem", accessMem)
+        flushAll = self.wrap(cache, "flush", flush)
+
+    #############
+    # Replaces a method of the cache by a wrapper; returns the method
+    # it replaced
+    def wrap(self, cache, name, wrapper):
+        original = getattr(cache, name)
+        self.wrapped[name] = vars(cache).get(name)
+        setattr(cache, name, wrapper)
+        return original
+
+    #############
+    # Stops watching the cache; whatever wrapped its methods after
+    # this digest has to be taken off first
+    def detach(self, sim):
+        cache = sim.cache
+        cache.writeWatchers[:] = [watcher for watcher in cache.writeWatchers
+                                  if (watcher is not self.written)]    # not remove(): empty sets are equal
+        for name, original in self.wrapped.items():
+            if (original is None):
+                delattr(cache, name)
+            else:
+                setattr(cache, name, original)
+
+    #############
+    # Returns the (PC, buffers, registers, cache, memory) digests
+    def fields(self, sim):
+        if (self.written):
+            self.updateMemory(sim)
+        if (self.touched):
+            self.updateCache(sim)
+        return (sim.PC & 0xFFFFFFFF,
+                zlib.crc32(repr(self.buffers).encode("ascii")),
+                arrayDigest(array('q', sim.registers)),
+                self.cacheDigest,
+                self.memoryDigest)
+
+    #############
+    # Rehashes the sets accessed since the last call
+    def updateCache(self, sim):
+        cache = sim.cache
+        for set in self.touched:
+            crc = zlib.crc32(repr((cache.cacheSets[set], cache.order[set])).encode("ascii"),
+                             zlib.crc32(struct.pack("<Q", set)))
+            self.cacheDigest ^= self.sets[set] ^ crc
+            self.sets[set] = crc
+        self.touched.clear()
+
+    #############
+    # Hashes every region of memory that may hold anything but zeros
+    def hashMemory(self, sim):
+        memory = sim.memory
+        if (isinstance(memory, array)):
+            numbers = range(sim.dataStart // REGION_WORDS, -(-len(memory) // REGION_WORDS))
+        else:
+            # sparse memory: only the regions of allocated pages
+            import pagedmemory
+            perPage = pagedmemory.PAGE_WORDS // REGION_WORDS
+            numbers = [number * perPage + i for number in sorted(memory.pages) for i in range(perPage)]
+        for number in numbers:
+            self.hashRegion(sim, number)
+
+    #############
+    # Rehashes the regions of the blocks written since the last call
+    def updateMemory(self, sim):
+        cache = sim.cache
+        numbers = set()
+        for block in self.written:
+            first = ((block << cache.offsetBits) - TEXT_BASE) >> 2
+            for index in range(first, first + cache.blockWords, REGION_WORDS):
+                numbers.add(index // REGION_WORDS)
+        self.written.clear()
+        for number in numbers:
+            self.hashRegion(sim, number)
+
+    def hashRegion(self, sim, number):
+        memory = sim.memory
+        start = max(number * REGION_WORDS, sim.dataStart)
+        end = min((number + 1) * REGION_WORDS, len(memory))
+        crc = 0
+        if (start < end):
+            if (isinstance(memory, array)):
+                words = memory[start:end]
+            else:
+                words = memory.dump(start, end - start)
+            if (words.count(0) != len(words)):
+                crc = arrayDigest(words, zlib.crc32(struct.pack("<Q", number)))
+        self.memoryDigest ^= self.regions.pop(number, 0) ^ crc
+        if (crc):
+            self.regions[number] = crc
+
+
+#========================================
+# Digest Writer Class
+#========================================
+class DigestWriter(object):
+
+    def __init__(self, file, sim, next=None):
+        self.file = file
+        self.next = next            # tracer also told about every cycle, e.g. the text trace
+        self.state = StateDigest(sim)
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        self.buffer = bytearray()
+        self.first = None           # first cycle and fields of the record being built
+        self.count = 0
+        self.fields = None
+        self.chain = 0              # rolling digest of every record written
+        self.records = 0
+
+    #############
+    # Opens a new digest file for a Simulator
+    @classmethod
+    def open(cls, path, sim, next=None):
+        return cls(open(path, "wb"), sim, next)
+
+    #############
+    # Adds `count` cycles from `cycle` on with the given fields
+    def add(self, cycle, count, fields):
+        if (fields == self.fields and cycle == self.first + self.count and
+                self.count + count <= 0xFFFFFFFF):
+            self.count += count
+            return
+        self.writeRecord()
+        self.first = cycle
+        self.count = count
+        self.fields = fields
+
+    def writeRecord(self):
+        if (self.fields is None):
+            return
+        self.chain = zlib.crc32(struct.pack("<QI5I", self.first, self.count, *self.fields), self.chain)
+        self.buffer += RECORD.pack(self.first, self.count, self.chain, *self.fields)
+        self.records += 1
+        if (len(self.buffer) >= BUFFER_RECORDS * RECORD.size):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        del self.buffer[:]
+
+    #############
+    # Called by the Simulator at the end of every cycle
+    def cycle(self, sim):
+        self.add(sim.cycle, 1, self.state.fields(sim))
+        if (self.next is not None):
+            self.next.cycle(sim)
+
+    #############
+    # Called by the Simulator for cycles first..last, skipped because
+    # they repeat the state it is in now
+    def idle(self, sim, first, last):
+        self.add(first, last - first + 1, self.state.fields(sim))
+        if (self.next is not None):
+            self.next.idle(sim, first, last)
+
+    def close(self, sim=None):
+        self.writeRecord()
+        self.fields = None
+        self.flush()
+        self.file.close()
+        if (sim is not None):
+            self.state.detach(sim)      # before the tracers it wraps, which watched first
+        if (self.next is not None):
+            self.next.close(sim)
+
+
+#============================================================
+# Reads a digest file in chunks, yielding (first cycle, cycles,
+# chain, fields) for every record
+#============================================================
+def readDigests(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if (len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC):
+            raise ValueError(path + " is not a digest file")
+        version = HEADER.unpack(header)[1]
+        if (version != FORMAT_VERSION):
+            raise ValueError(path + " is digest version " + str(version) + "; expected " +
+                             str(FORMAT_VERSION))
+        while (True):
+            chunk = f.read(RECORD.size * READ_RECORDS)
+            if (not chunk):
+                break
+            if (len(chunk) % RECORD.size):
+                raise ValueError(path + " ends in the middle of a record")
+            for record in RECORD.iter_unpack(chunk):
+                yield record[0], record[1], record[2], record[3:]
+
+
+#############
+# Rolling digest of a whole run: the chain of its last record
+def fingerprint(path):
+    chain = 0
+    for first, count, chain, fields in readDigests(path):
+        pass
+    return chain
+
+
+#############
+# The first field two digest tuples differ in, with both values
+def fieldDivergence(cycle, expected, actual):
+    for i in range(len(FIELDS)):
+        if (expected[i] != actual[i]):
+            return Divergence(cycle, FIELDS[i], format(expected[i], "08x"), format(actual[i], "08x"))
+    return None
+
+
+#============================================================
+# Walks two digest files side by side; returns the first
+# Divergence, or None if they describe the same run
+#============================================================
+def compareDigests(expectedPath, actualPath):
+    expected = readDigests(expectedPath)
+    actual = readDigests(actualPath)
+    a = next(expected, None)
+    b = next(actual, None)
+    while (a is not None and b is not None):
+        if (a[0] != b[0]):
+            return Divergence(min(a[0], b[0]), "cycle", "cycle " + str(a[0]), "cycle " + str(b[0]))
+        divergence = fieldDivergence(a[0], a[3], b[3])
+        if (divergence is not None):
+            return divergence
+        # the records agree up to the end of the shorter one
+        if (a[1] < b[1]):
+            end = a[0] + a[1]
+            b = (end, b[1] - a[1], b[2], b[3])
+            a = next(expected, None)
+        elif (b[1] < a[1]):
+            end = b[0] + b[1]
+            a = (end, a[1] - b[1], a[2], a[3])
+            b = next(actual, None)
+        else:
+            a = next(expected, None)
+            b = next(actual, None)
+    if (a is not None):
+        return Divergence(a[0], "cycle", "cycle " + str(a[0]), "end of run")
+    if (b is not None):
+        return Divergence(b[0], "cycle", "end of run", "cycle " + str(b[0]))
+    return None
+
+
+#############
+# Opens a text trace for reading bytes, decompressing it if needed
+def openText(path):
+    if (path.endswith(".gz")):
+        return gzip.open(path, "rb")
+    if (path.endswith(".zst")):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd traces need the zstandard package")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")))
+    return open(path, "rb")
+
+
+#############
+# The line holding `position` of text, or a note that the text ends there
+def lineText(text, position):
+    if (position >= len(text)):
+        return "end of file"
+    start = text.rfind(b"\n", 0, position) + 1
+    end = text.find(b"\n", position)
+    return text[start:end if (end >= 0) else len(text)].decode("ascii", "replace")
+
+
+#############
+# Names the line holding `position` of dump, the text of one cycle
+# from its header on: "Registers R08", "Cache Set 2 Entry 1",
+# "Data 160", ...
+def lineField(dump, position):
+    start = dump.rfind(b"\n", 0, position) + 1
+    if (start < len(CYCLE_HEADER)):
+        return "Cycle"
+    line = lineText(dump, start) if (start < len(dump)) else ""
+    label = line.strip().split(":")[0].split("\t")[0]
+    if (line in ("Registers", "Cache", "Data") or
+            (line.endswith(":") and not line.startswith("\t"))):
+        return label            # a section heading itself
+    section = None
+    set = None
+    for previous in dump[:start].decode("ascii", "replace").split("\n"):
+        if (previous in ("Registers", "Cache", "Data") or
+                (previous.endswith(":") and not previous.startswith("\t"))):
+            section = previous.rstrip(":")
+            set = None
+        elif (previous.startswith("Set ")):
+            set = previous.split(":")[0]
+    if (section is None):
+        return label
+    if (set is not None and label.startswith("Entry")):
+        return section + " " + set + " " + label
+    return section + " " + label
+
+
+#############
+# Index of the first byte two chunks differ in
+def firstDifference(a, b):
+    length = min(len(a), len(b))
+    block = 4096
+    offset = 0
+    while (offset < length and a[offset:offset + block] == b[offset:offset + block]):
+        offset += block
+    end = min(offset + block, length)
+    while (offset < end and a[offset] == b[offset]):
+        offset += 1
+    return offset
+
+
+#============================================================
+# Compares two text traces a chunk at a time; returns the first
+# Divergence, or None if they are the same. Only the text of the
+# current cycle (or line, in a _dis.txt) is held, so memory does
+# not grow with the length of the run
+#============================================================
+def compareText(expectedPath, actualPath):
+    with openText(expectedPath) as fa, openText(actualPath) as fb:
+        dump = b""              # the current cycle, or line, up to the chunks being compared
+        lines = 0               # lines before dump
+        while (True):
+            a = fa.read(CHUNK_BYTES)
+            b = fb.read(CHUNK_BYTES)
+            if (a == b):
+                if (not a):
+                    return None
+                dump += a
+                cut = dump.rfind(CYCLE_HEADER)
+                if (cut < 0 and not dump.startswith(CYCLE_HEADER)):
+                    cut = dump.rfind(b"\n") + 1
+                cut = max(cut, 0)
+                lines += dump.count(b"\n", 0, cut)
+                dump = dump[cut:]
+                continue
+
+            # finish the lines the first difference is on
+            position = len(dump) + firstDifference(a, b)
+            if (a.find(b"\n", position - len(dump)) < 0):
+                a += fa.readline()
+            if (b.find(b"\n", position - len(dump)) < 0):
+                b += fb.readline()
+            textA = dump + a
+            textB = dump + b
+            # the cycle is the one whose header starts last at or
+            # before the difference, in either trace (one may go on
+            # to a cycle the other does not have)
+            end = position + len(CYCLE_HEADER)
+            cut = max(textA.rfind(CYCLE_HEADER, 0, end), textB.rfind(CYCLE_HEADER, 0, end), 0)
+            lines += textA.count(b"\n", 0, cut)
+            textA = textA[cut:]
+            textB = textB[cut:]
+            position -= cut
+
+            header = textA if (textA.startswith(CYCLE_HEADER)) else textB
+            if (header.startswith(CYCLE_HEADER)):
+                cycle = int(header[len(CYCLE_HEADER):header.find(b"\n", len(CYCLE_HEADER))])
+                field = lineField(header, position)
+            else:
+                cycle = None
+                field = "line " + str(lines + textA.count(b"\n", 0, position) + 1)
+            return Divergence(cycle, field, lineText(textA, position), lineText(textB, position))
+
+
+#############
+# Compares two digest files or two text traces
+def compare(expectedPath, actualPath):
+    with open(expectedPath, "rb") as f:
+        isDigest = (f.read(len(MAGIC)) == MAGIC)
+    if (isDigest):
+        return compareDigests(expectedPath, actualPath)
+    return compareText(expectedPath, actualPath)
+
+
+#========================================
+# Digest Checker Class
+#========================================
+class DigestChecker(object):
+    """Checks a run against a golden digest file cycle by cycle.
+
+    The first cycle that differs raises its Divergence out of the
+    Simulator's run; close() notes the golden run going on past the end
+    of this one. Either way the Divergence is kept in `divergence`.
+    """
+
+    def __init__(self, path, sim, next=None):
+        self.next = next            # tracer also told about every cycle, e.g. the text trace
+        self.state = StateDigest(sim)
+        self.records = readDigests(path)
+        self.record = (0, 0, 0, None)   # covers no cycles: the first check moves on to the first record
+        self.checked = 0            # cycles found equal
+        self.divergence = None
+
+    @classmethod
+    def open(cls, path, sim, next=None):
+        return cls(path, sim, next)
+
+    #############
+    # Raises the Divergence if cycles first..last, all with the given
+    # fields, are not what the golden run had
+    def check(self, first, last, fields):
+        cycle = first
+        while (cycle <= last):
+            record = self.record
+            while (record is not None and record[0] + record[1] <= cycle):
+                record = self.record = next(self.records, None)
+            if (record is None):
+                divergence = Divergence(cycle, "cycle", "end of run", "cycle " + str(cycle))
+            elif (record[0] > cycle):
+                divergence = Divergence(cycle, "cycle", "cycle " + str(record[0]), "cycle " + str(cycle))
+            else:
+                divergence = fieldDivergence(cycle, record[3], fields)
+            if (divergence is not None):
+                self.divergence = divergence
+                raise divergence
+            cycle = min(last + 1, record[0] + record[1])
+        self.checked += last - first + 1
+
+    def cycle(self, sim):
+        self.check(sim.cycle, sim.cycle, self.state.fields(sim))
+        if (self.next is not None):
+            self.next.cycle(sim)
+
+    def idle(self, sim, first, last):
+        self.check(first, last, self.state.fields(sim))
+        if (self.next is not None):
+            self.next.idle(sim, first, last)
+
+    def close(self, sim=None):
+        if (sim is not None):
+            self.state.detach(sim)      # before the tracers it wraps, which watched first
+        if (self.next is not None):
+            self.next.close(sim)
+        if (sim is not None and self.divergence is None):
+            end = sim.cycle
+            record = self.record
+            while (record is not None and record[0] + record[1] <= end):
+                record = self.record = next(self.records, None)
+            if (record is not None):
+                self.divergence = Divergence(end, "cycle", "cycle " + str(end), "end of run")
+        self.records.close()
+
+
+def main(args):
+    paths = [arg for arg in args[1:] if (not arg.startswith("-"))]
+    if (len(paths) != 2):
+        print("usage: digest.py <expected trace or digest> <actual trace or digest>")
+        return 2
+    divergence = compare(paths[0], paths[1])
+    if (divergence is None):
+        print("identical")
+        return 0
+    print(str(divergence))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
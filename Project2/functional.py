@@ -0,0 +1,320 @@
+"""Functional (ISA-level) execution of MIPS programs.
+
+The FunctionalExecutor runs the Instruction records produced by the
+Disassembler straight against registers and memory: no pipeline buffers,
+no cache timing. It is used to fast-forward through the uninteresting
+part of a program and then hand the architectural state over to the
+cycle-accurate Simulator, or to sample short detailed regions of a long
+run to estimate its CPI.
+
+Hot basic blocks are compiled into Python functions by the
+BlockTranslator (translator.py) unless config.translateBlocks is off.
+"""
+
+from team23_project2 import (Config, Simulator, TEXT_BASE, MASK32, KIND_ALU,
+                             KIND_MEM, KIND_BRANCH, KIND_BREAK, OP_LW,
+                             aluResult, branchTarget, signed, initialMemory, imageInstruction)
+
+
+#========================================
+# Functional Executor Class
+#========================================
+class FunctionalExecutor(object):
+
+    def __init__(self, program, config=None, memory=None):
+        if (config is None):
+            config = Config()
+        if (memory is None):
+            memory = initialMemory(program, config)
+        self.config = config
+        self.program = program
+        self.decoded = list(program.decoded)
+        self.dataStart = len(program.decoded)   # index of the first data word; SWs below it are dropped
+        self.memory = memory
+        self.registers = [0] * 32
+
+        self.PC = TEXT_BASE
+        self.instructionCount = 0   # instructions executed, by either model
+        self.cycles = 0             # cycles elapsed, estimated while running functionally
+        self.halted = False
+
+        self.translator = None
+        if (config.translateBlocks):
+            import translator
+            self.translator = translator.BlockTranslator(self, config.translateThreshold)
+
+    #############
+    # Returns the decoded instruction at a word index,
+    # decoding words of the image past the text section on first use
+    def instructionAt(self, index):
+        while (len(self.decoded) <= index):
+            self.decoded.append(imageInstruction(self.program, len(self.decoded)))
+        return self.decoded[index]
+
+    #############
+    # Executes instructions until the BREAK, until maxInstructions have
+    # run or until the next instruction is the one at untilPC
+    #
+    # Returns the number of instructions executed by this call
+    def run(self, maxInstructions=None, untilPC=None):
+        if (self.translator is None):
+            count = self.interpret(maxInstructions, untilPC, False)
+        else:
+            count = self.runTranslated(maxInstructions, untilPC)
+        self.instructionCount += count
+        self.cycles += count * self.config.functionalCPI
+        return count
+
+    #############
+    # Runs compiled blocks where it can, and interprets the blocks that
+    # are not hot yet or would overrun maxInstructions or untilPC
+    def runTranslated(self, maxInstructions, untilPC):
+        import translator
+        blocks = self.translator
+        compiled = blocks.blocks
+        registers = self.registers
+        memory = self.memory
+        if (maxInstructions is None):
+            budget = float("inf")
+        else:
+            budget = maxInstructions
+        count = 0
+        PC = self.PC
+
+        while (not self.halted and count < budget and PC != untilPC):
+            block = compiled.get(PC)
+            if (block is None):
+                block = blocks.lookup(PC)
+            if (block is None or block.length > budget - count or
+                    (untilPC is not None and PC < untilPC < block.end)):
+                self.PC = PC
+                limit = None if (maxInstructions is None) else (maxInstructions - count)
+                count += self.interpret(limit, untilPC, True)
+                PC = self.PC
+                continue
+
+            PC, executed, exit, detail = block.function(registers, memory)
+            count += executed
+            if (exit):
+                self.PC = PC
+                if (exit == translator.EXIT_BREAK):
+                    self.halted = True
+                elif (exit == translator.EXIT_FAULT):
+                    raise IndexError("address " + str(detail) + " is outside the program image")
+        self.PC = PC
+        return count
+
+    #############
+    # Interprets instructions one at a time; with singleBlock it stops
+    # after the first J/JR/BEQ/BLTZ
+    #
+    # Returns the number of instructions executed
+    def interpret(self, maxInstructions, untilPC, singleBlock):
+        decoded = self.decoded
+        memory = self.memory
+        registers = self.registers
+        memSize = len(memory)
+        dataStart = self.dataStart
+        PC = self.PC
+        count = 0
+
+        while (not self.halted):
+            if (maxInstructions is not None and count >= maxInstructions):
+                break
+            if (PC == untilPC):
+                break
+
+            index = (PC - TEXT_BASE) >> 2
+            if (index < len(decoded)):
+                inst = decoded[index]
+            else:
+                inst = self.instructionAt(index)
+            kind = inst.kind
+
+            if (kind == KIND_ALU):
+                if (inst.dest != -1):
+                    registers[inst.dest] = aluResult(inst, registers)
+                PC += 4
+            elif (kind == KIND_MEM):
+                address = registers[inst.rs] + inst.imm
+                memIndex = (address - TEXT_BASE) >> 2
+                if (memIndex < 0 or memIndex >= memSize):
+                    self.PC = PC
+                    raise IndexError("address " + str(address) +
+                                     " is outside the program image")
+                if (inst.op == OP_LW):
+                    if (inst.dest != -1):
+                        registers[inst.dest] = signed(memory[memIndex])
+                elif (memIndex >= dataStart):     # SWs into the text are dropped
+                    memory[memIndex] = registers[inst.rt] & MASK32
+                PC += 4
+            elif (kind == KIND_BRANCH):
+                PC = branchTarget(inst, PC, registers)
+                if (singleBlock):
+                    count += 1
+                    break
+            elif (kind == KIND_BREAK):
+                self.halted = True
+                break
+            else:
+                PC += 4
+            count += 1
+
+        self.PC = PC
+        return count
+
+    #############
+    # Returns a cycle-accurate Simulator that continues from the current
+    # architectural state. Memory is handed over, not copied, so the
+    # executor must not run again until resume() takes it back
+    def handoff(self, config=None):
+        if (config is None):
+            config = self.config
+        sim = Simulator(self.program, config, memory=self.memory)
+        sim.decoded[:] = self.decoded       # the stages share sim.decoded, so fill it in place
+        sim.registers[:] = self.registers
+        sim.PC = self.PC
+        sim.cycle = int(self.cycles) + 1
+        return sim
+
+    #############
+    # Takes the architectural state back from a Simulator created by
+    # handoff(), draining its pipeline first if needed
+    def resume(self, sim):
+        if (not sim.halted):
+            sim.drain()
+        else:
+            sim.cache.flush()
+        self.registers[:] = sim.registers
+        self.memory = sim.memory
+        self.PC = sim.PC
+        self.halted = sim.fetch.breakFound
+        self.instructionCount += sim.instructionsRetired
+        self.cycles = sim.cycle - 1
+
+
+#============================================================
+# Runs a program functionally up to a chosen point and returns
+# a Simulator ready to continue from there cycle by cycle
+#
+# The switch happens at the first of: the next instruction is
+# at untilPC, `instructions` instructions have run, or the
+# estimated cycle count (config.functionalCPI per instruction)
+# reaches `cycle`
+#============================================================
+def fastForward(program, config=None, untilPC=None, instructions=None, cycle=None):
+    executor = FunctionalExecutor(program, config)
+    if (cycle is not None):
+        byCycle = int((cycle - 1) / executor.config.functionalCPI)
+        if (instructions is None or byCycle < instructions):
+            instructions = byCycle
+    executor.run(maxInstructions=instructions, untilPC=untilPC)
+    return executor.handoff()
+
+
+#========================================
+# Sampling Results Class
+#========================================
+class SamplingResult(object):
+
+    def __init__(self):
+        self.instructions = 0           # instructions in the whole run
+        self.samples = 0                # detailed regions simulated
+        self.sampledCycles = 0          # cycles measured in detailed regions
+        self.sampledInstructions = 0    # instructions retired in those cycles
+        self.warmupCycles = 0           # detailed cycles run before each measurement, not counted
+        self.drainCycles = 0            # cycles spent draining after each measurement, not counted
+
+    #############
+    # CPI measured over the detailed regions (None if nothing was sampled)
+    def CPI(self):
+        if (self.sampledInstructions == 0):
+            return None
+        return float(self.sampledCycles) / self.sampledInstructions
+
+    #############
+    # Estimated cycle count of the whole run
+    def estimatedCycles(self):
+        cpi = self.CPI()
+        if (cpi is None):
+            return None
+        return cpi * self.instructions
+
+
+#############
+# Number of instructions in the pipeline buffers of a Simulator
+def inFlight(sim):
+    count = 0
+    for buffer in (sim.fetch.preIssueBuffer, sim.ALU.preALUBuff, sim.MEM.preMEMBuff,
+                   sim.ALU.postALUBuff, sim.MEM.postMEMBuff):
+        count += len(buffer) - buffer.count(-1)
+    if (sim.fetch.pendingBranch is not None):
+        count += 1
+    return count
+
+
+#============================================================
+# Runs a Simulator for at most maxCycles cycles, and stops
+# fetching as soon as the instructions retired or still in
+# the pipeline reach maxInstructions, so that draining it
+# afterwards goes past that by at most the instructions
+# fetched in the last cycle
+#============================================================
+def runDetailed(sim, maxCycles, maxInstructions=None):
+    if (maxInstructions is None):
+        return sim.run(maxCycles=maxCycles)
+    startCycle = sim.cycle
+    stopCycle = startCycle + maxCycles
+    while (not sim.halted and sim.cycle < stopCycle and
+           sim.instructionsRetired + inFlight(sim) < maxInstructions):
+        sim.run(maxCycles=1)
+    return sim.cycle - startCycle
+
+
+#============================================================
+# Estimates the CPI of a long run by simulating `detailCycles`
+# cycles in detail after every `interval` functionally
+# executed instructions
+#
+# Every detailed region starts with a fresh pipeline and a cold
+# cache, so it first runs `warmupCycles` cycles (detailCycles
+# by default) that are not measured. Only the cycles and the
+# instructions retired in the measured window count towards
+# the CPI; the pipeline is then drained, uncounted, before
+# going back to functional execution. With maxInstructions,
+# every kind of region is cut short so the run stops at about
+# that many instructions
+#============================================================
+def sample(program, detailCycles, interval, config=None, maxInstructions=None, warmupCycles=None):
+    if (warmupCycles is None):
+        warmupCycles = detailCycles
+    executor = FunctionalExecutor(program, config)
+    result = SamplingResult()
+
+    while (not executor.halted):
+        remaining = None
+        if (maxInstructions is not None):
+            remaining = maxInstructions - executor.instructionCount
+            if (remaining <= 0):
+                break
+        executor.run(maxInstructions=interval if (remaining is None) else min(interval, remaining))
+        if (executor.halted):
+            break
+        if (remaining is not None):
+            remaining = maxInstructions - executor.instructionCount
+            if (remaining <= 0):
+                break
+
+        sim = executor.handoff()
+        result.warmupCycles += runDetailed(sim, warmupCycles, remaining)
+        startRetired = sim.instructionsRetired
+        if (not sim.halted and (remaining is None or startRetired + inFlight(sim) < remaining)):
+            cycles = runDetailed(sim, detailCycles, remaining)
+            result.samples += 1
+            result.sampledCycles += cycles
+            result.sampledInstructions += sim.instructionsRetired - startRetired
+        result.drainCycles += sim.drain()
+        executor.resume(sim)
+
+    result.instructions = executor.instructionCount
+    return result
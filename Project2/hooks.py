@@ -0,0 +1,311 @@
+"""Hooks: observers called from inside the pipeline.
+
+A HookRegistry collects listeners for these events, each called with
+the Simulator first:
+
+  fetch       (sim, index, PC)        Fetch took the instruction at PC (word
+                                      index `index`): into the Pre-Issue
+                                      Buffer, or a branch, NOP or BREAK it
+                                      handles itself
+  issue       (sim, index)            the instruction moved to the Pre-ALU Queue
+  execute     (sim, index, result)    the ALU is done with it; result is the
+                                      (index, register, value) it hands to the
+                                      Post-ALU Queue, or the (index, address,
+                                      value to store) of a LW/SW
+  memAccess   (sim, index, address, isWrite, value)
+                                      a LW/SW completed; value is what was
+                                      loaded or stored
+  cacheFill   (sim, set, way, address)
+                                      a block arrived in the cache
+  cacheEvict  (sim, set, way, address, dirty)
+                                      a valid block was replaced
+  writeback   (sim, index, register, value)
+                                      an instruction retired from WB (register
+                                      -1 when it writes none)
+  cycleEnd    (sim, first, last)      cycles first..last are over; first ==
+                                      last except for idle cycles the
+                                      Simulator skipped
+
+A Simulator built without hooks runs the plain stage methods, which do not
+test for listeners anywhere. install() binds instrumented methods over the
+plain ones, on the stages of that one Simulator and only for the events
+that have listeners:
+
+  fetch       Fetch.run                   cacheFill   Cache.fill
+  issue       Issue.run                   cacheEvict  Cache.evict
+  execute     LogicUnit.run               writeback   WriteBack.run
+  memAccess   MemoryUnit.run              cycleEnd    Simulator.step and
+                                                      skipIdleCycles
+
+Each instrumented method calls the plain one and works out the events
+from the buffers, counters and PC it leaves behind (WriteBack.run and
+Cache.evict from what they are about to consume), so the events of one
+call are raised together, in program order.
+"""
+
+import functools
+
+from team23_project2 import TEXT_BASE, KIND_ALU, KIND_MEM, KIND_NONE, KIND_BRANCH, OP_LW, \
+    branchTarget
+
+EVENTS = ("fetch", "issue", "execute", "memAccess", "cacheFill", "cacheEvict",
+          "writeback", "cycleEnd")
+
+#========================================
+# Hook Registry Class
+#========================================
+class HookRegistry(object):
+
+    def __init__(self):
+        self.listeners = dict((event, []) for event in EVENTS)
+
+    #############
+    # Adds a listener for an event; returns it, so this works as a
+    # decorator: @hooks.on("writeback")
+    def on(self, event, listener=None):
+        if (event not in self.listeners):
+            raise ValueError("unknown hook event '" + str(event) + "'; expected one of " +
+                             ", ".join(EVENTS))
+        if (listener is None):
+            return functools.partial(self.on, event)
+        self.listeners[event].append(listener)
+        return listener
+
+    #############
+    # Events that have at least one listener
+    def events(self):
+        return frozenset(event for event in EVENTS if self.listeners[event])
+
+    #############
+    # Returns the emitter of an event for a Simulator
+    def emitter(self, sim, event):
+        listeners = tuple(self.listeners[event])
+        if (len(listeners) == 1):
+            return functools.partial(listeners[0], sim)
+
+        def emit(*args):
+            for listener in listeners:
+                listener(sim, *args)
+        return emit
+
+    #############
+    # Binds the instrumented stage methods of the events that have
+    # listeners into a Simulator. Listeners added afterwards are not
+    # seen by it
+    def install(self, sim):
+        if (sim.hooks is not None):
+            raise ValueError("the Simulator already has hooks installed")
+        sim.hooks = self
+        for event in EVENTS:
+            if (self.listeners[event]):
+                INSTRUMENTS[event](sim, self.emitter(sim, event))
+
+
+#############
+# Fetch raises fetch for every instruction it took: each new Pre-Issue
+# entry, each NOP retired (or dropped past a pending branch), the
+# branch it resolved or predicted and the BREAK, walking from the PC
+# the fetch group started at
+def instrumentFetch(sim, emit):
+    fetch = sim.fetch
+    run = fetch.run
+    decoded = fetch.decoded
+    buffer = fetch.preIssueBuffer
+
+    def instrumented():
+        pending = fetch.pendingBranch
+        PC = sim.PC
+        kept = len(buffer) - buffer.count(-1)
+        olderCount = fetch.olderCount
+        speculativeNops = fetch.speculativeNops
+        retired = sim.instructionsRetired
+        breakFound = fetch.breakFound
+        status = run()
+
+        if (pending is not None and fetch.pendingBranch is pending):
+            nops = fetch.speculativeNops - speculativeNops
+        else:
+            nops = sim.instructionsRetired - retired    # NOPs, and one more for a branch it resolved
+            if (pending is not None):
+                index, branchPC, predicted = pending
+                actual = branchTarget(decoded[index], branchPC, sim.registers)
+                nops -= 1
+                if (actual == predicted):
+                    nops -= speculativeNops
+                else:
+                    PC = actual                 # squashed back to the older entries
+                    kept = olderCount
+        entries = buffer[kept:]
+        position = 0
+        while ((PC - TEXT_BASE) // 4 < len(decoded)):
+            index = (PC - TEXT_BASE) // 4
+            kind = decoded[index].kind
+            if (kind == KIND_ALU or kind == KIND_MEM):
+                if (position == len(entries) or entries[position] == -1):
+                    break
+                position += 1
+            elif (kind == KIND_NONE):
+                if (nops == 0):
+                    break
+                nops -= 1
+            else:
+                predicted = fetch.pendingBranch is not None and fetch.pendingBranch is not pending
+                if ((kind == KIND_BRANCH and (nops == 1 or predicted)) or
+                        (kind != KIND_BRANCH and fetch.breakFound and not breakFound)):
+                    emit(index, PC)
+                break
+            emit(index, PC)
+            PC += 4
+        return status
+    fetch.run = instrumented
+
+
+#############
+# Issue raises issue for every entry it added to the Pre-ALU Queue
+def instrumentIssue(sim, emit):
+    issue = sim.issue
+    run = issue.run
+    preALUBuff = issue.preALUBuff
+
+    def instrumented():
+        first = len(preALUBuff) - preALUBuff.count(-1)
+        status = run()
+        for index in preALUBuff[first:]:
+            if (index == -1):
+                break
+            emit(index)
+        return status
+    issue.run = instrumented
+
+
+#############
+# The ALU raises execute for the oldest Pre-ALU entries, pairing each
+# with the result it added to the Pre-MEM or Post-ALU Queue, in order
+def instrumentExecute(sim, emit):
+    ALU = sim.ALU
+    run = ALU.run
+    decoded = ALU.decoded
+    preMEMBuff = ALU.preMEMBuff
+    postALUBuff = ALU.postALUBuff
+
+    def instrumented():
+        waiting = list(ALU.preALUBuff)
+        memFirst = len(preMEMBuff) - preMEMBuff.count(-1)
+        aluFirst = len(postALUBuff) - postALUBuff.count(-1)
+        status = run()
+        results = {KIND_MEM: iter(preMEMBuff[memFirst:]), KIND_ALU: iter(postALUBuff[aluFirst:])}
+        for index in waiting:
+            result = -1 if (index == -1) else next(results[decoded[index].kind], -1)
+            if (result == -1):
+                break
+            emit(index, result)
+        return status
+    ALU.run = instrumented
+
+
+#############
+# The MEM unit raises memAccess for the Pre-MEM entries it completed,
+# with the value of a LW from the Post-MEM entry it added
+def instrumentMemAccess(sim, emit):
+    MEM = sim.MEM
+    run = MEM.run
+    decoded = MEM.decoded
+    preMEMBuff = MEM.preMEMBuff
+    postMEMBuff = MEM.postMEMBuff
+
+    def instrumented():
+        waiting = list(preMEMBuff)
+        loaded = len(postMEMBuff) - postMEMBuff.count(-1)
+        status = run()
+        done = preMEMBuff.count(-1) - waiting.count(-1)
+        loads = iter(postMEMBuff[loaded:])
+        for index, address, value in waiting[:done]:
+            if (decoded[index].op == OP_LW):
+                emit(index, address, False, next(loads)[2])
+            else:
+                emit(index, address, True, value)
+        return status
+    MEM.run = instrumented
+
+
+#############
+# WB raises writeback for every entry it is about to write back
+def instrumentWriteback(sim, emit):
+    WB = sim.WB
+    run = WB.run
+
+    def instrumented(postALUBuff, postMEMBuff):
+        for buffer in (postALUBuff, postMEMBuff):
+            for entry in buffer:
+                if (entry != -1):
+                    emit(entry[0], entry[1], entry[2])
+        return run(postALUBuff, postMEMBuff)
+    WB.run = instrumented
+
+
+def instrumentCacheFill(sim, emit):
+    cache = sim.cache
+    fill = cache.fill
+
+    def instrumented(set, way, line, block, saved, isWriteToMem):
+        fill(set, way, line, block, saved, isWriteToMem)
+        emit(set, way, block << cache.offsetBits)
+    cache.fill = instrumented
+
+
+def instrumentCacheEvict(sim, emit):
+    cache = sim.cache
+    evict = cache.evict
+
+    def instrumented(set, way, line, block):
+        emit(set, way, (line[2] << cache.tagShift) + (set << cache.offsetBits), line[1] == 1)
+        return evict(set, way, line, block)
+    cache.evict = instrumented
+
+
+#############
+# cycleEnd follows every simulated cycle and every run of idle cycles
+# skipped
+def instrumentCycleEnd(sim, emit):
+    step = sim.step
+    skipIdleCycles = sim.skipIdleCycles
+
+    def instrumentedStep():
+        idle = step()
+        emit(sim.cycle - 1, sim.cycle - 1)
+        return idle
+
+    def instrumentedSkip(stopCycle):
+        first = sim.cycle
+        skipIdleCycles(stopCycle)
+        if (sim.cycle != first):
+            emit(first, sim.cycle - 1)
+    sim.step = instrumentedStep
+    sim.skipIdleCycles = instrumentedSkip
+
+
+INSTRUMENTS = {"fetch": instrumentFetch,
+               "issue": instrumentIssue,
+               "execute": instrumentExecute,
+               "memAccess": instrumentMemAccess,
+               "cacheFill": instrumentCacheFill,
+               "cacheEvict": instrumentCacheEvict,
+               "writeback": instrumentWriteback,
+               "cycleEnd": instrumentCycleEnd}
+
+
+#############
+# Watchpoints: call callback(sim, index, value) whenever the register
+# is written back, or a SW stores to the word at `address`
+def watchRegister(registry, register, callback):
+    def listener(sim, index, dest, value):
+        if (dest == register):
+            callback(sim, index, value)
+    return registry.on("writeback", listener)
+
+
+def watchMemory(registry, address, callback):
+    def listener(sim, index, accessed, isWrite, value):
+        if (isWrite and accessed == address):
+            callback(sim, index, value)
+    return registry.on("memAccess", listener)
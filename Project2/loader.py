@@ -0,0 +1,153 @@
+"""Program image loading.
+
+Programs can be given as:
+
+  text   lines of '0'/'1' characters, one 32-bit word per line (the
+         original course format, kept for compatibility)
+  raw    a packed image of 32-bit words, little or big endian
+  elf    an ELF32 file; its PT_LOAD segments are placed at their virtual
+         addresses, which must start at TEXT_BASE
+
+Binary images are read through mmap straight into an array of words, so
+a multi-megabyte image loads in milliseconds and costs 4 bytes per word.
+Large images are disassembled by batchdecode when NumPy is installed.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+from team23_project2 import TEXT_BASE, WORD_TYPECODE, Disassembler
+import batchdecode
+
+ELF_MAGIC = b"\x7fELF"
+PT_LOAD = 1
+
+TEXT_CHARS = frozenset(b"01 \t\r\n")
+
+
+#############
+# Maps a whole file read-only; returns None for an empty file
+def mapFile(f):
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return None         # mmap refuses zero-length files
+
+
+#############
+# Converts a buffer of packed words into an array of words
+def wordsFromBuffer(buf, byteorder):
+    if (len(buf) % 4 != 0):
+        raise ValueError("image size " + str(len(buf)) + " is not a multiple of 4 bytes")
+    words = array(WORD_TYPECODE)
+    words.frombytes(buf)
+    if (byteorder != sys.byteorder):
+        words.byteswap()
+    return words
+
+
+#############
+# Guesses the format of an image from its first bytes
+def detectFormat(head):
+    if (head[:4] == ELF_MAGIC):
+        return "elf"
+    if (len(head) > 0 and all(b in TEXT_CHARS for b in bytearray(head))):
+        return "text"
+    return "raw"
+
+
+#############
+# Parses the '0'/'1' text format
+def loadText(data):
+    return Disassembler.fromLines(data.splitlines()).words
+
+
+#############
+# Places the PT_LOAD segments of an ELF32 image into one word image
+def loadElf(view):
+    if (len(view) < 52 or view[4] != 1):
+        raise ValueError("only 32-bit ELF images are supported")
+    if (view[5] == 1):
+        byteorder, prefix = "little", "<"
+    elif (view[5] == 2):
+        byteorder, prefix = "big", ">"
+    else:
+        raise ValueError("unknown ELF data encoding " + str(view[5]))
+
+    phoff, = struct.unpack_from(prefix + "I", view, 28)
+    phentsize, phnum = struct.unpack_from(prefix + "HH", view, 42)
+
+    segments = []
+    for i in range(phnum):
+        (pType, offset, vaddr, paddr,
+         filesz, memsz, flags, align) = struct.unpack_from(prefix + "8I", view, phoff + i * phentsize)
+        if (pType == PT_LOAD and memsz > 0):
+            segments.append((vaddr, offset, filesz, memsz))
+    if (not segments):
+        raise ValueError("ELF image has no loadable segments")
+
+    segments.sort()
+    if (segments[0][0] != TEXT_BASE):
+        raise ValueError("ELF image must be linked at address " + str(TEXT_BASE))
+
+    end = max(vaddr + memsz for vaddr, offset, filesz, memsz in segments)
+    image = bytearray((end - TEXT_BASE + 3) & ~3)
+    for vaddr, offset, filesz, memsz in segments:
+        if (vaddr % 4 != 0):
+            raise ValueError("ELF segment at " + str(vaddr) + " is not word aligned")
+        start = vaddr - TEXT_BASE
+        image[start:start + filesz] = view[offset:offset + filesz]
+    return wordsFromBuffer(image, byteorder)
+
+
+#============================================================
+# Returns the words of a program image held in memory (bytes
+# or a memoryview)
+#
+# format is "text", "raw", "elf" or None to detect it;
+# byteorder applies to raw images only
+#============================================================
+def parseImage(view, format=None, byteorder="little"):
+    if (format is None):
+        format = detectFormat(bytes(view[:64]))
+    if (format == "text"):
+        return loadText(bytes(view).decode("ascii"))
+    elif (format == "raw"):
+        return wordsFromBuffer(view, byteorder)
+    elif (format == "elf"):
+        return loadElf(view)
+    raise ValueError("unknown program format '" + str(format) + "'")
+
+
+#============================================================
+# Loads the words of a program image file
+#============================================================
+def loadWords(path, format=None, byteorder="little"):
+    with open(path, "rb") as f:
+        mapped = mapFile(f)
+        if (mapped is None):
+            return array(WORD_TYPECODE)
+        try:
+            view = memoryview(mapped)
+            try:
+                return parseImage(view, format, byteorder)
+            finally:
+                view.release()
+        finally:
+            mapped.close()
+
+
+#============================================================
+# Loads and disassembles a program image
+#
+# With a cacheDirectory the decoded program is taken from, or
+# stored in, the decode cache there (see decodecache.py)
+#============================================================
+def loadProgram(path, format=None, byteorder="little", cacheDirectory=None):
+    words = loadWords(path, format, byteorder)
+    if (cacheDirectory is not None):
+        import decodecache
+        return decodecache.disassemble(words, cacheDirectory)
+    return batchdecode.decode(words)
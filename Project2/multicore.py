@@ -0,0 +1,383 @@
+"""Multicore systems: pipelined cores with coherent private caches.
+
+A System builds N Simulators over one shared main memory. Each core has
+a private CoherentCache, a Cache (same lines: valid, dirty, tag, data)
+that keeps itself coherent with the others by snooping a shared Bus:
+
+  M  valid and dirty: the only copy, newer than memory
+  E  valid, clean and in no other cache (MESI only)
+  S  valid and clean, maybe in other caches too
+  I  not valid
+
+Every miss is a bus transaction, a read (BusRd) or, for a SW, a read for
+ownership (BusRdX); a SW that hits an S line sends an upgrade (BusUpgr).
+The bus serves one transaction every config.busCycles cycles, so a core
+whose request finds it busy waits its turn, and the miss latency runs
+from the cycle it is granted. When the block is filled (or the upgrade
+done), the other caches snoop it: an M copy is written back to memory
+first, then the copy is dropped for a BusRdX or BusUpgr, or kept as S
+for a BusRd. Under MESI a read that finds no other copy fills in E, and
+a later SW to it goes to M without using the bus.
+
+The cores are stepped in lockstep, one cycle of every core per system
+cycle, starting with a different core each cycle so none of them always
+wins the bus. Cycles in which every running core waits on the bus or
+memory are skipped over as a Simulator does alone. Each core starts with
+its number in $k0 (R26) and the number of cores in $k1 (R27), so one
+program image can split its work between them (see
+workloads.parallelSum). The system is done when every core has run into
+its BREAK.
+
+The write-back policy is required, and the prefetcher, victim cache and
+write buffer are not modelled for coherent caches.
+"""
+
+import json
+
+from team23_project2 import Cache, Config, Simulator, initialMemory, TEXT_BASE
+import tracing
+
+CORE_ID_REGISTER = 26       # $k0: number of the core, from 0
+CORE_COUNT_REGISTER = 27    # $k1: number of cores
+
+PROTOCOLS = ("msi", "mesi")
+
+# bus transactions
+BUS_READ = 0
+BUS_READ_EXCLUSIVE = 1
+BUS_UPGRADE = 2
+TRANSACTION_NAMES = ("BusRd", "BusRdX", "BusUpgr")
+
+
+#========================================
+# Bus Class
+#========================================
+class Bus(object):
+    """The snooping bus shared by the caches of a System."""
+
+    def __init__(self, busCycles=1):
+        self.busCycles = busCycles
+        self.caches = []            # every cache on the bus, in core order
+        self.freeAt = 0             # first cycle the bus can be granted again
+        self.writebacks = 0         # blocks written back to the shared memory by any cache
+
+        # Statistics
+        self.transactions = [0, 0, 0]   # per transaction kind
+        self.busyCycles = 0
+        self.waitCycles = 0         # cycles requests waited for the bus
+        self.contended = 0          # requests that found the bus busy
+        self.interventions = 0      # M copies written back for another cache
+        self.invalidations = 0      # copies dropped for another cache
+
+    #############
+    # Queues a transaction made by `cache` in its current cycle and
+    # returns the cycle the bus is granted
+    def request(self, cache, kind):
+        cycle = cache.cycle
+        start = max(cycle, self.freeAt)
+        self.freeAt = start + self.busCycles
+        self.transactions[kind] += 1
+        self.busyCycles += self.busCycles
+        if (start > cycle):
+            self.contended += 1
+            self.waitCycles += start - cycle
+            cache.busWaitCycles += start - cycle
+        return start
+
+    #############
+    # Makes every other cache give up, or share, its copy of a block
+    # that `requester` is filling or about to write. Returns True if
+    # another cache keeps a copy
+    def snoop(self, requester, block, exclusive):
+        shared = False
+        for cache in self.caches:
+            if (cache is requester):
+                continue
+            set = block & cache.setMask
+            tags = cache.tagMaps[set]
+            way = tags.get(block >> cache.blockTagShift)
+            if (way is None):
+                continue
+            line = cache.cacheSets[set][way]
+            if (line[1] == 1):
+                cache.writeBack(set, line)
+                cache.interventions += 1
+                self.interventions += 1
+            cache.exclusive.discard(block)
+            if (exclusive):
+                line[0] = 0
+                del tags[line[2]]
+                cache.pending.pop(block, None)  # an upgrade it was waiting for is moot
+                cache.invalidations += 1
+                self.invalidations += 1
+            else:
+                shared = True
+        return shared
+
+    #############
+    # Returns the bus counters as a dictionary
+    def stats(self, cycles):
+        return {"transactions": dict(zip(TRANSACTION_NAMES, self.transactions)),
+                "busyCycles": self.busyCycles,
+                "utilization": (float(self.busyCycles) / cycles) if cycles else 0.0,
+                "contended": self.contended,
+                "waitCycles": self.waitCycles,
+                "interventions": self.interventions,
+                "invalidations": self.invalidations}
+
+
+#========================================
+# Coherent Cache Class
+#========================================
+class CoherentCache(Cache):
+
+    def __init__(self, memory, dataStart, config, bus, core):
+        Cache.__init__(self, memory, dataStart, config)
+        if (config.coherenceProtocol not in PROTOCOLS):
+            raise ValueError("unknown coherence protocol '" + str(config.coherenceProtocol) + "'")
+        if (self.writeThrough):
+            raise ValueError("coherent caches need the writeback policy")
+        if (self.extended):
+            raise ValueError("the prefetcher, victim cache and write buffer are not supported "
+                             "by coherent caches")
+        self.bus = bus
+        self.core = core
+        self.mesi = (config.coherenceProtocol == "mesi")
+        self.blockTagShift = self.tagShift - self.offsetBits    # block -> tag
+        self.exclusive = set()      # blocks held in E
+        bus.caches.append(self)
+
+        # Statistics
+        self.upgrades = 0           # SW hits on S lines that went to the bus
+        self.busWaitCycles = 0      # cycles this cache's requests waited for the bus
+        self.interventions = 0      # M lines written back for another cache
+        self.invalidations = 0      # lines dropped for another cache
+
+    #############
+    # Cache.accessMem does the rest: these are the coherence transitions
+    #
+    # A SW that hits an S line waits for an upgrade, which is pending
+    # from the bus grant on
+    def hit(self, set, way, memIndex, slot, isWriteToMem, dataToWrite, dataAccess):
+        if (isWriteToMem and self.cacheSets[set][way][1] == 0):
+            block = (TEXT_BASE + (memIndex * 4)) >> self.offsetBits
+            if (block not in self.exclusive):
+                # S: the other copies have to go before the write
+                ready = self.pending.get(block)
+                if (ready is None):
+                    self.pending[block] = self.bus.request(self, BUS_UPGRADE)
+                    self.upgrades += 1
+                    return False, 0
+                if (self.cycle < ready):
+                    return False, 0
+                del self.pending[block]
+                self.bus.snoop(self, block, True)
+        return Cache.hit(self, set, way, memIndex, slot, isWriteToMem, dataToWrite, dataAccess)
+
+    #############
+    # A miss is a BusRd, or a BusRdX for a SW; the miss latency runs
+    # from the bus grant
+    def missArrival(self, isWriteToMem):
+        kind = BUS_READ_EXCLUSIVE if isWriteToMem else BUS_READ
+        return self.bus.request(self, kind) + self.missLatency - 1
+
+    #############
+    # An evicted line leaves E, and an upgrade still pending for it
+    # is dropped with it
+    def evict(self, set, way, line, block):
+        evicted = (line[2] << self.blockTagShift) | set
+        self.exclusive.discard(evicted)
+        self.pending.pop(evicted, None)
+        return Cache.evict(self, set, way, line, block)
+
+    #############
+    # The other caches see the block go by before it is read, so
+    # memory holds their latest copy; under MESI, a block no other
+    # cache keeps is filled in E
+    def fill(self, set, way, line, block, saved, isWriteToMem):
+        shared = self.bus.snoop(self, block, isWriteToMem)
+        Cache.fill(self, set, way, line, block, saved, isWriteToMem)
+        if (self.mesi and not shared):
+            self.exclusive.add(block)
+
+    #############
+    # Every cache on the bus writes back to the same memory, so its
+    # version counts all of their write-backs
+    def writeBack(self, set, line):
+        Cache.writeBack(self, set, line)
+        self.bus.writebacks += 1
+
+    def memoryVersion(self):
+        return self.bus.writebacks
+
+    #############
+    # A write makes the line M
+    def writeWord(self, memIndex, line, value):
+        line[1] = 1
+        self.exclusive.discard((TEXT_BASE + (memIndex * 4)) >> self.offsetBits)
+
+    #############
+    # MESI state of the block holding a byte address
+    def state(self, address):
+        block = address >> self.offsetBits
+        way = self.tagMaps[block & self.setMask].get(block >> self.blockTagShift)
+        if (way is None):
+            return "I"
+        if (self.cacheSets[block & self.setMask][way][1] == 1):
+            return "M"
+        return "E" if (block in self.exclusive) else "S"
+
+    def stats(self):
+        stats = Cache.stats(self)
+        stats["upgrades"] = self.upgrades
+        stats["busWaitCycles"] = self.busWaitCycles
+        stats["interventions"] = self.interventions
+        stats["invalidations"] = self.invalidations
+        return stats
+
+
+#========================================
+# System Class
+#========================================
+class System(object):
+
+    def __init__(self, program, cores=2, config=None):
+        if (config is None):
+            config = Config()
+        if (cores < 1):
+            raise ValueError("a system needs at least one core")
+        self.config = config
+        self.program = program
+        self.memory = initialMemory(program, config)
+        self.bus = Bus(config.busCycles)
+        self.cores = []
+        for core in range(cores):
+            cache = CoherentCache(self.memory, len(program.decoded), config, self.bus, core)
+            sim = Simulator(program, config, memory=self.memory, cache=cache)
+            sim.registers[CORE_ID_REGISTER] = core
+            sim.registers[CORE_COUNT_REGISTER] = cores
+            self.cores.append(sim)
+        self.cycle = 1
+        self.halted = False
+
+    #############
+    # Simulates one cycle of every core still running. Returns True
+    # if none of them moved an instruction
+    def step(self):
+        count = len(self.cores)
+        first = self.cycle % count
+        idle = True
+        for i in range(count):
+            sim = self.cores[(first + i) % count]
+            if (not sim.halted and not sim.step()):
+                idle = False
+        self.cycle += 1
+        self.halted = all(sim.halted for sim in self.cores)
+        return idle
+
+    #############
+    # Runs every core to its BREAK (or for maxCycles system cycles);
+    # tracers, when given, holds one tracer per core. Returns the
+    # number of cycles run
+    def run(self, maxCycles=None, tracers=None):
+        if (maxCycles is None):
+            maxCycles = self.config.maxCycles
+        if (tracers is not None):
+            for sim, tracer in zip(self.cores, tracers):
+                sim.setTracer(None, tracer)
+
+        startCycle = self.cycle
+        stopCycle = None if (maxCycles is None) else (startCycle + maxCycles)
+        skipIdle = self.config.skipIdle
+        while (not self.halted):
+            if (stopCycle is not None and self.cycle >= stopCycle):
+                break
+            if (self.step() and skipIdle):
+                self.skipIdleCycles(stopCycle)
+        return self.cycle - startCycle
+
+    #############
+    # Called after a cycle in which no running core moved: each waits
+    # on its own bus request or miss, so all of them jump to the
+    # earliest cycle one of those completes
+    def skipIdleCycles(self, stopCycle):
+        running = [sim for sim in self.cores if (not sim.halted)]
+        arrival = None
+        for sim in running:
+            next = sim.cache.nextArrival(self.cycle - 1)
+            if (next is None):
+                return
+            if (arrival is None or next < arrival):
+                arrival = next
+        if (stopCycle is not None and arrival > stopCycle):
+            arrival = stopCycle
+        if (arrival is None or arrival <= self.cycle):
+            return
+        for sim in running:
+            sim.skipIdleCycles(arrival)
+        self.cycle = arrival
+
+    #############
+    # Writes every M line back so main memory is up to date
+    def flush(self):
+        for sim in self.cores:
+            sim.cache.flush()
+
+    #############
+    # Returns the per-core and bus counters as a dictionary (with the
+    # PerformanceCounters of every core they are attached to)
+    def stats(self):
+        cycles = self.cycle - 1
+        instructions = sum(sim.instructionsRetired for sim in self.cores)
+        cores = []
+        for sim in self.cores:
+            coreCycles = sim.cycle - 1
+            entry = {"core": sim.cache.core,
+                     "halted": sim.halted,
+                     "cycles": coreCycles,
+                     "instructions": sim.instructionsRetired,
+                     "IPC": (float(sim.instructionsRetired) / coreCycles) if coreCycles else 0.0,
+                     "cache": sim.cache.stats()}
+            if (sim.counters is not None):
+                entry["counters"] = sim.counters.toDict()
+            cores.append(entry)
+        return {"cores": cores,
+                "protocol": self.config.coherenceProtocol,
+                "cycles": cycles,
+                "instructions": instructions,
+                "IPC": (float(instructions) / cycles) if cycles else 0.0,
+                "bus": self.bus.stats(cycles)}
+
+
+#============================================================
+# Runs a program on a System as the command line tool does:
+# one trace per core in <prefix>_core<N>_pipeline.txt, and the
+# System's counters in countersFileName when given
+#============================================================
+def runToFiles(program, config, cores, prefix, traceLevel="full", compression=None,
+               countersFileName=None):
+    system = System(program, cores, config)
+    if (countersFileName is not None):
+        import counters
+        for sim in system.cores:
+            counters.PerformanceCounters.attach(sim)
+
+    tracers = []
+    for sim in system.cores:
+        pipelineName = prefix + "_core" + str(sim.cache.core) + "_pipeline.txt"
+        if (compression == "gzip"):
+            pipelineName += ".gz"
+        elif (compression == "zstd"):
+            pipelineName += ".zst"
+        tracers.append(tracing.TraceWriter.fromSpec(tracing.openTrace(pipelineName, compression),
+                                                    traceLevel))
+    system.run(tracers=tracers)
+    for sim, tracer in zip(system.cores, tracers):
+        tracer.close(sim)
+    system.flush()
+
+    if (countersFileName is not None):
+        with open(countersFileName, "w") as f:
+            json.dump(system.stats(), f, indent=2)
+            f.write("\n")
+    return system
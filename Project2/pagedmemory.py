@@ -0,0 +1,189 @@
+"""Sparse paged main memory.
+
+PagedMemory stands in for the flat array of words when a program needs
+an address space larger than its image. Memory is split into 4 KiB
+pages (1024 words), each an array of unsigned 32-bit words allocated on
+first write; reading a page that was never written gives zeros. Pages
+are unsigned like the flat array, the cache lines and the checkpoint
+format, so words move between them without a sign conversion; LW makes
+a word signed on its way into a register, whichever memory it came from.
+
+Like the flat array it is indexed by word index, (address - TEXT_BASE) >> 2,
+so the Cache, the functional executor and compiled blocks use it
+unchanged. On top of that it offers byte-address accessors, bulk
+load/dump, and a per-page dirty bitmap that makes snapshots and diffs
+cost only the pages written since the snapshot they start from.
+"""
+
+from array import array
+
+from team23_project2 import TEXT_BASE, WORD_TYPECODE, MASK32
+
+PAGE_BYTES = 4096
+PAGE_WORDS = PAGE_BYTES // 4
+PAGE_SHIFT = 10             # word index -> page number
+WORD_MASK = PAGE_WORDS - 1  # word index -> word within its page
+
+
+#========================================
+# Paged Memory Class
+#========================================
+class PagedMemory(object):
+
+    def __init__(self, size):
+        self.size = size                    # words in the address space
+        self.pages = {}                     # page number -> array of PAGE_WORDS words
+        self.dirty = bytearray((size + PAGE_WORDS - 1) >> PAGE_SHIFT)  # 1 = written since the last snapshot
+        self.zeroPage = array(WORD_TYPECODE, [0]) * PAGE_WORDS
+        self.lastSnapshot = Snapshot(0)     # page copies of the last snapshot()
+        self.changedIn = {}                 # page number -> first snapshot holding its latest writes
+
+    #############
+    # A memory of `size` words holding a copy of `words` at index 0
+    @classmethod
+    def fromWords(cls, words, size):
+        memory = cls(max(size, len(words)))
+        memory.load(0, words)
+        return memory
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if (index < 0 or index >= self.size):
+            raise IndexError("memory index " + str(index) + " out of range")
+        page = self.pages.get(index >> PAGE_SHIFT)
+        if (page is None):
+            return 0
+        return page[index & WORD_MASK]
+
+    def __setitem__(self, index, value):
+        if (index < 0 or index >= self.size):
+            raise IndexError("memory index " + str(index) + " out of range")
+        number = index >> PAGE_SHIFT
+        page = self.pages.get(number)
+        if (page is None):
+            page = self.allocate(number)
+        page[index & WORD_MASK] = value
+        self.dirty[number] = 1
+
+    def allocate(self, number):
+        page = self.zeroPage[:]
+        self.pages[number] = page
+        return page
+
+    #############
+    # Word and byte accessors by byte address. Words must be aligned;
+    # bytes are numbered from the most significant end of their word,
+    # the way the trace prints words
+    def readWord(self, address):
+        if (address & 3):
+            raise ValueError("unaligned word address " + str(address))
+        return self[(address - TEXT_BASE) >> 2]
+
+    def writeWord(self, address, value):
+        if (address & 3):
+            raise ValueError("unaligned word address " + str(address))
+        self[(address - TEXT_BASE) >> 2] = value & MASK32
+
+    def readByte(self, address):
+        shift = (3 - ((address - TEXT_BASE) & 3)) << 3
+        return (self[(address - TEXT_BASE) >> 2] >> shift) & 0xFF
+
+    def writeByte(self, address, value):
+        index = (address - TEXT_BASE) >> 2
+        shift = (3 - ((address - TEXT_BASE) & 3)) << 3
+        self[index] = (self[index] & ~(0xFF << shift) & MASK32) | ((value & 0xFF) << shift)
+
+    #############
+    # Copies words into memory starting at a word index, a page at a time
+    def load(self, index, words):
+        if (index < 0 or index + len(words) > self.size):
+            raise IndexError("load of " + str(len(words)) + " words at " + str(index) +
+                             " does not fit in memory")
+        done = 0
+        while (done < len(words)):
+            number = (index + done) >> PAGE_SHIFT
+            offset = (index + done) & WORD_MASK
+            count = min(PAGE_WORDS - offset, len(words) - done)
+            chunk = words[done:done + count]
+            page = self.pages.get(number)
+            if (page is None):
+                if (not any(chunk)):
+                    done += count
+                    continue        # all zeros: leave the page unallocated
+                page = self.allocate(number)
+            page[offset:offset + count] = array(WORD_TYPECODE, chunk)
+            self.dirty[number] = 1
+            done += count
+
+    #############
+    # Returns `count` words starting at a word index as an array
+    def dump(self, index, count):
+        if (index < 0 or index + count > self.size):
+            raise IndexError("dump of " + str(count) + " words at " + str(index) +
+                             " is outside memory")
+        words = array(WORD_TYPECODE)
+        done = 0
+        while (done < count):
+            number = (index + done) >> PAGE_SHIFT
+            offset = (index + done) & WORD_MASK
+            take = min(PAGE_WORDS - offset, count - done)
+            page = self.pages.get(number, self.zeroPage)
+            words += page[offset:offset + take]
+            done += take
+        return words
+
+    #############
+    # Page numbers written since the last snapshot() or clearDirty()
+    def dirtyPages(self):
+        return [number for number in sorted(self.pages) if self.dirty[number]]
+
+    def clearDirty(self):
+        self.dirty[:] = bytes(len(self.dirty))
+
+    #############
+    # Returns a Snapshot of every allocated page, as page number ->
+    # array, and clears the dirty bitmap. Only pages dirtied since the
+    # previous snapshot are copied; the others are shared with it
+    def snapshot(self):
+        pages = Snapshot(self.lastSnapshot.number + 1, self.lastSnapshot)
+        for number in self.dirtyPages():
+            pages[number] = self.pages[number][:]
+            self.changedIn[number] = pages.number
+        self.clearDirty()
+        self.lastSnapshot = pages
+        return pages
+
+    #############
+    # Returns (index, old, new) for every word that differs from a
+    # snapshot, looking only at pages written since it was taken
+    def diff(self, snapshot):
+        changes = []
+        for number in sorted(self.pages):
+            if (not self.dirty[number] and self.changedIn.get(number, 0) <= snapshot.number):
+                continue
+            old = snapshot.get(number, self.zeroPage)
+            new = self.pages[number]
+            if (old == new):
+                continue
+            base = number << PAGE_SHIFT
+            for i in range(PAGE_WORDS):
+                if (old[i] != new[i]):
+                    changes.append((base + i, old[i], new[i]))
+        return changes
+
+
+#========================================
+# Snapshot Class
+#========================================
+class Snapshot(dict):
+    """Page copies taken by PagedMemory.snapshot(), page number -> array.
+
+    number counts the snapshots of the memory, so diff() can tell which
+    pages were written after this one was taken.
+    """
+
+    def __init__(self, number, pages=()):
+        dict.__init__(self, pages)
+        self.number = number
@@ -0,0 +1,225 @@
+"""Branch prediction for the Fetch stage.
+
+Fetch resolves a branch as soon as none of its operands are still being
+computed. With a predictor configured (Config.branchPredictor), a branch
+whose operands are not ready no longer stalls fetch: the BranchUnit
+predicts where it goes, fetch carries on from there into the Pre-Issue
+Buffer, and nothing fetched after the branch may issue until it is
+resolved. A correct prediction costs nothing; a mispredict squashes the
+Pre-Issue entries fetched after the branch and restarts fetch at the
+real target.
+
+Direction predictors, indexed by the branch PC:
+
+  nottaken  static: conditional branches are never taken
+  onebit    one bit per entry: the last outcome
+  twobit    2-bit saturating counters
+  gshare    2-bit counters indexed by the PC xor the global history
+
+The branch target buffer is direct mapped and holds the target of every
+taken branch. A branch predicted taken (J and JR always are) is only
+redirected when the BTB knows its target; otherwise fetch falls through.
+
+Every branch is predicted and then checked against its outcome, so the
+accuracy counters cover all branches, while only those that were
+actually speculated past can cost cycles.
+"""
+
+from team23_project2 import OP_J, OP_JR
+
+PREDICTORS = ("nottaken", "onebit", "twobit", "gshare")
+
+
+#========================================
+# Direction Predictors
+#========================================
+class NotTaken(object):
+
+    def __init__(self, entries, historyBits):
+        pass
+
+    def predict(self, PC):
+        return False
+
+    def update(self, PC, taken):
+        pass
+
+    def getState(self):
+        return {}
+
+    def setState(self, state):
+        pass
+
+
+class OneBit(object):
+
+    def __init__(self, entries, historyBits):
+        self.mask = entries - 1
+        self.table = bytearray(entries)     # 1 = taken last time
+
+    def predict(self, PC):
+        return self.table[(PC >> 2) & self.mask] == 1
+
+    def update(self, PC, taken):
+        self.table[(PC >> 2) & self.mask] = 1 if taken else 0
+
+    def getState(self):
+        return {"table": list(self.table)}
+
+    def setState(self, state):
+        self.table[:] = bytearray(state["table"])
+
+
+class TwoBit(object):
+
+    def __init__(self, entries, historyBits):
+        self.mask = entries - 1
+        self.table = bytearray([1]) * entries  # 0-1 predict not taken, 2-3 taken
+
+    def index(self, PC):
+        return (PC >> 2) & self.mask
+
+    def predict(self, PC):
+        return self.table[self.index(PC)] >= 2
+
+    def update(self, PC, taken):
+        i = self.index(PC)
+        if (taken):
+            if (self.table[i] < 3):
+                self.table[i] += 1
+        elif (self.table[i] > 0):
+            self.table[i] -= 1
+
+    def getState(self):
+        return {"table": list(self.table)}
+
+    def setState(self, state):
+        self.table[:] = bytearray(state["table"])
+
+
+class Gshare(TwoBit):
+
+    def __init__(self, entries, historyBits):
+        TwoBit.__init__(self, entries, historyBits)
+        self.historyMask = (1 << historyBits) - 1
+        self.history = 0        # outcomes of the last historyBits branches, newest lowest
+
+    def index(self, PC):
+        return ((PC >> 2) ^ self.history) & self.mask
+
+    def update(self, PC, taken):
+        TwoBit.update(self, PC, taken)
+        self.history = ((self.history << 1) | (1 if taken else 0)) & self.historyMask
+
+    def getState(self):
+        return {"table": list(self.table), "history": self.history}
+
+    def setState(self, state):
+        TwoBit.setState(self, state)
+        self.history = state["history"]
+
+
+DIRECTION = {"nottaken": NotTaken, "onebit": OneBit, "twobit": TwoBit, "gshare": Gshare}
+
+
+#========================================
+# Branch Target Buffer Class
+#========================================
+class BranchTargetBuffer(object):
+
+    def __init__(self, entries):
+        self.mask = entries - 1
+        self.tags = [-1] * entries      # PC of the branch held in each entry
+        self.targets = [0] * entries
+
+    def lookup(self, PC):
+        i = (PC >> 2) & self.mask
+        if (self.tags[i] == PC):
+            return self.targets[i]
+        return None
+
+    def insert(self, PC, target):
+        i = (PC >> 2) & self.mask
+        self.tags[i] = PC
+        self.targets[i] = target
+
+
+#========================================
+# Branch Unit Class
+#========================================
+class BranchUnit(object):
+
+    def __init__(self, config):
+        kind = config.branchPredictor
+        if (kind not in DIRECTION):
+            raise ValueError("unknown branch predictor '" + str(kind) + "'; expected one of " +
+                             ", ".join(PREDICTORS))
+        for name in ("predictorEntries", "btbEntries"):
+            entries = getattr(config, name)
+            if (entries < 1 or entries & (entries - 1)):
+                raise ValueError(name + " must be a power of two")
+        self.kind = kind
+        self.direction = DIRECTION[kind](config.predictorEntries, config.predictorHistoryBits)
+        self.btb = BranchTargetBuffer(config.btbEntries)
+
+        self.branches = 0           # branches predicted
+        self.correct = 0
+        self.speculated = 0         # branches fetch went past before they were resolved
+        self.mispredicts = 0        # speculated branches that were predicted wrong
+        self.squashed = 0           # Pre-Issue entries thrown away by mispredicts
+        self.btbHits = 0
+        self.btbMisses = 0
+
+    #############
+    # Returns the predicted address of the instruction after the
+    # branch at PC
+    def predict(self, inst, PC):
+        if (inst.op == OP_J or inst.op == OP_JR):
+            taken = True
+        else:
+            taken = self.direction.predict(PC)
+        if (taken):
+            target = self.btb.lookup(PC)
+            if (target is not None):
+                self.btbHits += 1
+                return target
+            self.btbMisses += 1
+        return PC + 4
+
+    #############
+    # Trains on the real outcome of the branch at PC and counts
+    # whether `predicted` was right
+    def resolve(self, inst, PC, actual, predicted):
+        self.branches += 1
+        if (actual == predicted):
+            self.correct += 1
+        taken = actual != PC + 4
+        if (inst.op != OP_J and inst.op != OP_JR):
+            self.direction.update(PC, taken)
+        if (taken):
+            self.btb.insert(PC, actual)
+
+    def stats(self):
+        return {"predictor": self.kind,
+                "branches": self.branches,
+                "correct": self.correct,
+                "accuracy": (float(self.correct) / self.branches) if self.branches else 0.0,
+                "speculated": self.speculated,
+                "mispredicts": self.mispredicts,
+                "squashed": self.squashed,
+                "btbHits": self.btbHits,
+                "btbMisses": self.btbMisses}
+
+    def getState(self):
+        state = self.stats()
+        state["direction"] = self.direction.getState()
+        state["btb"] = {"tags": self.btb.tags, "targets": self.btb.targets}
+        return state
+
+    def setState(self, state):
+        for name in ("branches", "correct", "speculated", "mispredicts", "squashed",
+                     "btbHits", "btbMisses"):
+            setattr(self, name, state[name])
+        self.direction.setState(state["direction"])
+        self.btb.tags[:] = state["btb"]["tags"]
+        self.btb.targets[:] = state["btb"]["targets"]
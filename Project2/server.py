@@ -0,0 +1,485 @@
+"""Local simulation service.
+
+Every run of team23_project2.py pays for starting Python, importing the
+simulator and going through files. The server pays for that once: it
+starts a pool of worker processes that have already imported everything
+and keep the programs they have decoded and one Simulator each, reset
+for every job, and takes jobs over a Unix socket or a localhost TCP
+port.
+
+The protocol is JSON, one object per line. A client sends
+
+  {"op": "run", "id": "job1",
+   "image": "<base64 of the image>"  or  "text": "<'0'/'1' lines>",
+   "format": "raw", "byteorder": "little",     (as the -t / -e options)
+   "config": {"cacheSets": 8, ...},            (Config options)
+   "maxCycles": 100000,
+   "trace": "off",                             (a -l level; default off)
+   "disassembly": true, "counters": false}
+
+  {"op": "cancel", "id": "job1"}
+
+and gets back, tagged with the job's id:
+
+  {"id": ..., "type": "queued", "position": n}   every worker is busy
+  {"id": ..., "type": "started"}
+  {"id": ..., "type": "disassembly", "text": ...}
+  {"id": ..., "type": "trace", "text": ...}      any number, in order
+  {"id": ..., "type": "summary", "stats": {...}}
+  {"id": ..., "type": "cancelled"}  or  {"id": ..., "type": "error", "message": ...}
+
+The last message of every job is a summary, cancelled or error. Jobs
+wait in a queue, in the order they arrive, until a worker is free. A
+worker simulates in slices of about SLICE_SECONDS, sizing each from the
+speed of the one before, and sends the trace written so far and looks
+for a cancel after every slice, so a long job is streamed and stopped
+within tens of milliseconds however fast it runs. Every job is limited to the
+server's maxCycles, whatever it asks for. Closing the connection
+cancels the jobs it submitted.
+
+submit() is a small blocking client for scripts and CI.
+"""
+
+import asyncio
+import base64
+import collections
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+from team23_project2 import Config, Simulator
+import loader
+import tracing
+
+SLICE_SECONDS = 0.02        # time simulated between two looks at the connection
+FIRST_SLICE = 1000          # cycles of the first slice of a job, and the fewest of any
+PROGRAM_CACHE = 32          # decoded programs a worker keeps
+HIGH_WATER = 1 << 20        # bytes waiting for a client before its workers are throttled
+DEFAULT_MAX_CYCLES = 10000000
+
+
+#========================================
+# Worker Side
+#========================================
+class TraceBuffer(object):
+    """A file-like target for a TraceWriter that is emptied by take()."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def take(self):
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
+    def close(self):
+        pass
+
+
+#############
+# True if a cancel for the job has arrived; anything else sent to a
+# busy worker is dropped
+def cancelRequested(conn, number):
+    cancelled = False
+    while (conn.poll()):
+        message = conn.recv()
+        if (message[0] == "cancel" and message[1] == number):
+            cancelled = True
+    return cancelled
+
+
+#############
+# Returns the decoded program of a job, from the worker's cache when
+# the same image was decoded before
+def decodedProgram(programs, job):
+    if ("image" in job):
+        data = base64.b64decode(job["image"])
+        format = job.get("format")
+    else:
+        data = job.get("text", "").encode("ascii")
+        format = "text"
+    byteorder = job.get("byteorder", "little")
+    key = hashlib.sha1(data + b"\0" + str(format).encode() + b"\0" + byteorder.encode()).digest()
+    program = programs.pop(key, None)
+    if (program is None):
+        program = loader.batchdecode.decode(loader.parseImage(data, format, byteorder))
+    programs[key] = program         # most recently used last
+    if (len(programs) > PROGRAM_CACHE):
+        del programs[next(iter(programs))]
+    return program
+
+
+#############
+# Returns the worker's Simulator loaded with a program: built
+# for the first job, reset for every one after it
+def loadSimulator(sim, program, config):
+    if (sim is None):
+        return Simulator(program, config)
+    sim.reset(program, config)
+    return sim
+
+
+#============================================================
+# Runs one job on the worker's Simulator, sending its
+# messages over conn
+#
+# Returns the Simulator
+#============================================================
+def runJob(conn, programs, sim, number, job, maxCycles):
+    dis = decodedProgram(programs, job)
+    if (job.get("disassembly", True)):
+        text = io.StringIO()
+        loader.batchdecode.writeOutput(dis, text)
+        conn.send(("disassembly", number, text.getvalue()))
+
+    options = dict(job.get("config", {}))
+    options.pop("decodeCache", None)
+    limit = options.pop("maxCycles", None)
+    if (job.get("maxCycles") is not None):
+        limit = job["maxCycles"]
+    limit = maxCycles if (limit is None) else min(int(limit), maxCycles)
+    sim = loadSimulator(sim, dis, Config(**options))
+
+    out = TraceBuffer()
+    tracer = tracing.TraceWriter.fromSpec(out, job.get("trace", "off"))
+    if (job.get("counters")):
+        import counters
+        perf = counters.PerformanceCounters.attach(sim)
+    ran = 0
+    cycles = FIRST_SLICE
+    while (not sim.halted and ran < limit):
+        start = time.perf_counter()
+        simulated = sim.run(maxCycles=min(cycles, limit - ran), tracer=tracer)
+        elapsed = time.perf_counter() - start
+        ran += simulated
+        text = out.take()
+        if (text):
+            conn.send(("trace", number, text))
+        if (cancelRequested(conn, number)):
+            conn.send(("cancelled", number, None))
+            return sim
+        # at most four times the last slice, in case it was all idle cycles skipped
+        cycles = max(FIRST_SLICE, min(4 * simulated, int(simulated * SLICE_SECONDS / max(elapsed, 1e-6))))
+    tracer.close(sim)
+    text = out.take()
+    if (text):
+        conn.send(("trace", number, text))
+
+    sim.cache.flush()
+    stats = {"cycles": ran,
+             "instructions": sim.instructionsRetired,
+             "IPC": (float(sim.instructionsRetired) / ran) if ran else 0.0,
+             "halted": sim.halted,
+             "cache": sim.cache.stats(),
+             "registers": sim.registers}
+    if (job.get("counters")):
+        stats["counters"] = perf.toDict()
+    conn.send(("summary", number, stats))
+    return sim
+
+
+#############
+# Main loop of a worker process
+def workerMain(conn, maxCycles):
+    programs = collections.OrderedDict()
+    sim = None
+    while (True):
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if (message[0] == "stop"):
+            return
+        if (message[0] != "run"):
+            continue        # a cancel for a job that already finished
+        number, job = message[1], message[2]
+        try:
+            sim = runJob(conn, programs, sim, number, job, maxCycles)
+        except Exception as e:
+            conn.send(("error", number, type(e).__name__ + ": " + str(e)))
+
+
+#========================================
+# Server Side
+#========================================
+class Job(object):
+
+    def __init__(self, number, client, id, options):
+        self.number = number        # unique within the server
+        self.client = client
+        self.id = id                # the client's name for it
+        self.options = options
+        self.worker = None
+
+
+class Worker(object):
+
+    def __init__(self, maxCycles):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=workerMain, args=(child, maxCycles))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.job = None
+
+
+class Client(object):
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.jobs = {}              # id -> Job not finished yet
+        self.closed = False
+
+    def send(self, message):
+        if (not self.closed):
+            self.writer.write((json.dumps(message) + "\n").encode("utf-8"))
+
+
+#========================================
+# Simulation Server Class
+#========================================
+class SimulationServer(object):
+
+    def __init__(self, workers=None, maxCycles=DEFAULT_MAX_CYCLES):
+        self.workerCount = workers or os.cpu_count() or 1
+        self.maxCycles = maxCycles
+        self.workers = []
+        self.queue = collections.deque()    # Jobs waiting for a worker
+        self.nextNumber = 0
+        self.loop = None
+
+    #############
+    # Starts the workers and listens on a Unix socket path or a
+    # (host, port) pair; returns the asyncio server
+    async def start(self, address):
+        self.loop = asyncio.get_running_loop()
+        for i in range(self.workerCount):
+            self.addWorker()
+        if (isinstance(address, str)):
+            return await asyncio.start_unix_server(self.handleClient, address)
+        return await asyncio.start_server(self.handleClient, address[0], address[1])
+
+    def addWorker(self):
+        worker = Worker(self.maxCycles)
+        self.workers.append(worker)
+        self.loop.add_reader(worker.conn.fileno(), self.readWorker, worker)
+        return worker
+
+    def stop(self):
+        for worker in self.workers:
+            self.loop.remove_reader(worker.conn.fileno())
+            try:
+                worker.conn.send(("stop",))
+            except (OSError, EOFError):
+                pass
+            worker.process.join(1)
+            if (worker.process.is_alive()):
+                worker.process.terminate()
+        self.workers = []
+
+    async def handleClient(self, reader, writer):
+        client = Client(writer)
+        try:
+            while (True):
+                line = await reader.readline()
+                if (not line):
+                    break
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    client.send({"type": "error", "message": "request is not JSON"})
+                    continue
+                self.handleRequest(client, request)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            client.closed = True
+            for job in list(client.jobs.values()):
+                self.cancel(job)
+            writer.close()
+
+    def handleRequest(self, client, request):
+        op = request.get("op")
+        id = request.get("id")
+        if (op == "run"):
+            if (id is None):
+                id = self.nextNumber
+            if (id in client.jobs):
+                client.send({"id": id, "type": "error", "message": "job id already in use"})
+                return
+            job = Job(self.nextNumber, client, id, request)
+            self.nextNumber += 1
+            client.jobs[id] = job
+            self.queue.append(job)
+            self.dispatch()
+            if (job.worker is None):
+                client.send({"id": id, "type": "queued", "position": len(self.queue)})
+        elif (op == "cancel"):
+            job = client.jobs.get(id)
+            if (job is None):
+                client.send({"id": id, "type": "error", "message": "no such job"})
+            else:
+                self.cancel(job)
+        else:
+            client.send({"id": id, "type": "error", "message": "unknown op '" + str(op) + "'"})
+
+    #############
+    # Hands queued jobs to idle workers; returns the number started
+    def dispatch(self):
+        started = 0
+        for worker in self.workers:
+            if (not self.queue):
+                break
+            if (worker.job is None):
+                job = self.queue.popleft()
+                worker.job = job
+                job.worker = worker
+                worker.conn.send(("run", job.number, job.options))
+                job.client.send({"id": job.id, "type": "started"})
+                started += 1
+        return started
+
+    def cancel(self, job):
+        if (job.worker is None):
+            self.queue.remove(job)
+            self.finish(job, {"id": job.id, "type": "cancelled"})
+        else:
+            job.worker.conn.send(("cancel", job.number))
+
+    def finish(self, job, message):
+        job.client.send(message)
+        job.client.jobs.pop(job.id, None)
+        if (job.worker is not None):
+            job.worker.job = None
+            job.worker = None
+        self.dispatch()
+
+    #############
+    # Called when a worker has something to say
+    def readWorker(self, worker):
+        try:
+            while (worker.conn.poll()):
+                kind, number, payload = worker.conn.recv()
+                job = worker.job
+                if (job is None or job.number != number):
+                    continue
+                if (kind == "summary"):
+                    self.finish(job, {"id": job.id, "type": "summary", "stats": payload})
+                elif (kind == "error"):
+                    self.finish(job, {"id": job.id, "type": "error", "message": payload})
+                elif (kind == "cancelled"):
+                    self.finish(job, {"id": job.id, "type": "cancelled"})
+                else:
+                    job.client.send({"id": job.id, "type": kind, "text": payload})
+                    if (job.client.writer.transport.get_write_buffer_size() > HIGH_WATER):
+                        self.throttle(worker, job.client)
+                        return
+        except (EOFError, OSError):
+            self.replaceWorker(worker)
+
+    #############
+    # Stops reading from a worker until its client has caught up
+    def throttle(self, worker, client):
+        self.loop.remove_reader(worker.conn.fileno())
+
+        async def resume():
+            try:
+                await client.writer.drain()
+            except ConnectionError:
+                pass
+            if (worker in self.workers):
+                self.loop.add_reader(worker.conn.fileno(), self.readWorker, worker)
+                self.readWorker(worker)
+        asyncio.ensure_future(resume())
+
+    #############
+    # A worker died: fail its job and start another in its place
+    def replaceWorker(self, worker):
+        self.loop.remove_reader(worker.conn.fileno())
+        self.workers.remove(worker)
+        worker.process.join(1)
+        job = worker.job
+        self.addWorker()
+        if (job is not None):
+            job.worker = None
+            self.finish(job, {"id": job.id, "type": "error", "message": "worker process died"})
+        else:
+            self.dispatch()
+
+
+#============================================================
+# Sends one job to a server and yields every message about
+# it, the last being its summary, cancelled or error. address
+# is a Unix socket path or a (host, port) pair
+#============================================================
+def submit(address, job):
+    if (isinstance(address, str)):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    try:
+        request = dict(job)
+        request.setdefault("op", "run")
+        request.setdefault("id", 0)
+        stream = sock.makefile("rwb")
+        stream.write((json.dumps(request) + "\n").encode("utf-8"))
+        stream.flush()
+        for line in stream:
+            message = json.loads(line.decode("utf-8"))
+            yield message
+            if (message["type"] in ("summary", "cancelled", "error")):
+                break
+    finally:
+        sock.close()
+
+
+async def serve(address, workers, maxCycles):
+    server = SimulationServer(workers, maxCycles)
+    listener = await server.start(address)
+    try:
+        await listener.serve_forever()
+    finally:
+        listener.close()
+        server.stop()
+
+
+def main(args):
+    socketPath = None
+    port = None
+    workers = None
+    maxCycles = DEFAULT_MAX_CYCLES
+
+    for i in range(len(args)):
+        if (args[i] == '-u' and i < (len(args) - 1)):
+            socketPath = args[i + 1]
+        elif (args[i] == '-p' and i < (len(args) - 1)):
+            port = int(args[i + 1])
+        elif (args[i] == '-j' and i < (len(args) - 1)):
+            workers = int(args[i + 1])
+        elif (args[i] == '-c' and i < (len(args) - 1)):
+            maxCycles = int(args[i + 1])
+
+    if ((socketPath is None) == (port is None)):
+        print("usage: server.py -u <socket path> | -p <localhost port> [-j <workers>] [-c <max cycles per job>]")
+        return 2
+
+    address = socketPath if (socketPath is not None) else ("127.0.0.1", port)
+    try:
+        asyncio.run(serve(address, workers, maxCycles))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,240 @@
+"""Host-side profiling of the simulator.
+
+A StageProfiler times every call the Simulator.run loop makes into the
+machine, with time.perf_counter_ns accumulators wrapped around the
+bound methods of one Simulator (others run untimed):
+
+  step                     one simulated cycle, and inside it
+    WB, MEM, ALU, Issue, Fetch     the stages
+      Cache.accessMem              cache accesses, under the stage making them
+    Tracer                 formatting and writing the trace (printState)
+    Counters               performance counter bookkeeping
+  skipIdle                 idle cycles jumped over, with their tracer call
+
+Time is kept per call path, so the same method called from two places
+(the cache from Fetch and from MEM) is reported twice. "self" time is
+a path's time minus its children's; the Simulator.run line is the loop
+itself, outside any timed call.
+
+Modes:
+
+  stages    the timers only
+  sample    plus a sampling profiler: a thread records the Python stack
+            of the simulation every `interval` seconds
+  cprofile  plus cProfile, saved for pstats / snakeviz
+
+profileRun() writes <prefix>_profile.txt, the per-stage breakdown (and the
+top cProfile entries), and <prefix>_profile.folded, a collapsed-stack
+file for flamegraph.pl, speedscope or inferno: the stage paths weighted
+by microseconds of self time, or with "sample" the sampled stacks
+weighted by sample counts. cprofile adds <prefix>_profile.prof.
+
+The timers cost a few hundred nanoseconds per call, so shares are
+accurate but absolute times run a little high; cProfile adds far more.
+"""
+
+import io
+import sys
+import threading
+import time
+
+MODES = ("stages", "sample", "cprofile")
+ROOT = "Simulator.run"
+
+
+#========================================
+# Stage Profiler Class
+#========================================
+class StageProfiler(object):
+
+    def __init__(self, sim, tracer=None):
+        self.sim = sim
+        self.path = (ROOT,)
+        self.totals = {}            # call path -> nanoseconds
+        self.calls = {}             # call path -> calls
+        self.wall = 0
+        self.cycles = 0
+
+        self.wrap(sim, "step", "step")
+        self.wrap(sim, "skipIdleCycles", "skipIdle")
+        for attribute, label in (("WB", "WB"), ("MEM", "MEM"), ("ALU", "ALU"),
+                                 ("issue", "Issue"), ("fetch", "Fetch")):
+            self.wrap(getattr(sim, attribute), "run", label)
+        self.wrap(sim.cache, "accessMem", "Cache.accessMem")
+        if (tracer is not None):
+            self.wrap(tracer, "cycle", "Tracer")
+            self.wrap(tracer, "idle", "Tracer")
+        if (sim.counters is not None):
+            self.wrap(sim.counters, "record", "Counters")
+            self.wrap(sim.counters, "recordIdle", "Counters")
+
+    #############
+    # Replaces a bound method of one object by a timed one
+    def wrap(self, owner, name, label):
+        original = getattr(owner, name)
+        totals = self.totals
+        calls = self.calls
+        clock = time.perf_counter_ns
+
+        def timed(*args):
+            parent = self.path
+            path = self.path = parent + (label,)
+            start = clock()
+            try:
+                return original(*args)
+            finally:
+                totals[path] = totals.get(path, 0) + clock() - start
+                calls[path] = calls.get(path, 0) + 1
+                self.path = parent
+        self.wrapperCode = timed.__code__
+        setattr(owner, name, timed)
+
+    #############
+    # Runs the Simulator, timing the whole run too
+    def run(self, **options):
+        start = time.perf_counter_ns()
+        startCycle = self.sim.cycle
+        try:
+            return self.sim.run(**options)
+        finally:
+            self.wall += time.perf_counter_ns() - start
+            self.cycles += self.sim.cycle - startCycle
+
+    #############
+    # Returns (path, calls, total ns, self ns) of every path, the root
+    # first and every path before its children
+    def rows(self):
+        totals = dict(self.totals)
+        totals[(ROOT,)] = self.wall
+        selfTimes = dict(totals)
+        for path in totals:
+            if (len(path) > 1):
+                parent = path[:-1]
+                selfTimes[parent] = selfTimes.get(parent, 0) - totals[path]
+        return [(path, self.calls.get(path, 1), totals[path], selfTimes[path])
+                for path in sorted(totals)]
+
+    #############
+    # Writes the per-stage breakdown
+    def report(self, out):
+        seconds = self.wall / 1e9
+        out.write("Profile of " + str(self.cycles) + " cycles in " + format(seconds, ".3f") + " s")
+        if (seconds > 0):
+            out.write(" (" + str(int(self.cycles / seconds)) + " cycles/s)")
+        out.write("\n\n")
+        out.write("%-40s %10s %12s %12s %10s %7s\n" % ("call path", "calls", "total ms", "self ms",
+                                                    "ns/call", "self %"))
+        for path, calls, total, selfTime in self.rows():
+            name = "  " * (len(path) - 1) + path[-1]
+            share = (100.0 * selfTime / self.wall) if self.wall else 0.0
+            out.write("%-40s %10d %12.3f %12.3f %10d %6.1f%%\n" %
+                      (name, calls, total / 1e6, selfTime / 1e6, total // max(calls, 1), share))
+
+    #############
+    # Writes the self time of every path in collapsed-stack format,
+    # in microseconds
+    def writeCollapsed(self, out):
+        for path, calls, total, selfTime in self.rows():
+            if (selfTime > 0):
+                out.write(";".join(path) + " " + str(selfTime // 1000) + "\n")
+
+
+#========================================
+# Sampling Profiler Class
+#========================================
+class Sampler(object):
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, interval=0.001, thread=None, hidden=()):
+        self.interval = interval
+        self.hidden = frozenset(hidden)     # code of frames left out of the stacks
+        self.threadId = (thread or threading.current_thread()).ident
+        self.counts = {}            # collapsed stack -> samples
+        self.samples = 0
+        self.stopping = threading.Event()
+        self.thread = None
+        self.switchInterval = None
+
+    def start(self):
+        # let the sampler in about as often as it wants to sample
+        self.switchInterval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switchInterval, self.interval))
+        self.thread = threading.Thread(target=self.loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switchInterval)
+
+    def loop(self):
+        while (not self.stopping.wait(self.interval)):
+            frame = sys._current_frames().get(self.threadId)
+            if (frame is None):
+                continue
+            names = []
+            while (frame is not None):
+                code = frame.f_code
+                if (code in self.hidden):
+                    frame = frame.f_back
+                    continue
+                names.append(code.co_name + " (" + code.co_filename.replace("\\", "/").split("/")[-1] +
+                             ":" + str(code.co_firstlineno) + ")")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.counts[stack] = self.counts.get(stack, 0) + 1
+            self.samples += 1
+
+    def writeCollapsed(self, out):
+        for stack in sorted(self.counts):
+            out.write(stack + " " + str(self.counts[stack]) + "\n")
+
+
+#============================================================
+# Runs a Simulator under the profiler in the given mode and
+# writes <prefix>_profile.txt and <prefix>_profile.folded
+# (and <prefix>_profile.prof for cprofile). Returns the
+# StageProfiler
+#============================================================
+def profileRun(sim, prefix, mode="stages", tracer=None, interval=0.001):
+    if (mode not in MODES):
+        raise ValueError("unknown profile mode '" + str(mode) + "'; expected one of " +
+                         ", ".join(MODES))
+    profiler = StageProfiler(sim, tracer)
+    sampler = None
+    cprofiler = None
+    if (mode == "sample"):
+        sampler = Sampler(interval, hidden=(profiler.wrapperCode,))
+        sampler.start()
+    elif (mode == "cprofile"):
+        import cProfile
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+    try:
+        profiler.run(tracer=tracer)
+    finally:
+        if (sampler is not None):
+            sampler.stop()
+        if (cprofiler is not None):
+            cprofiler.disable()
+
+    with open(prefix + "_profile.txt", "w") as out:
+        profiler.report(out)
+        if (sampler is not None):
+            out.write("\n" + str(sampler.samples) + " samples every " + str(interval * 1000) +
+                      " ms in " + prefix + "_profile.folded\n")
+        if (cprofiler is not None):
+            import pstats
+            text = io.StringIO()
+            pstats.Stats(cprofiler, stream=text).sort_stats("tottime").print_stats(25)
+            out.write("\ncProfile, by own time (all of it in " + prefix + "_profile.prof):\n")
+            out.write(text.getvalue())
+    with open(prefix + "_profile.folded", "w") as out:
+        if (sampler is not None):
+            sampler.writeCollapsed(out)
+        else:
+            profiler.writeCollapsed(out)
+    if (cprofiler is not None):
+        cprofiler.dump_stats(prefix + "_profile.prof")
+    return profiler
@@ -0,0 +1,411 @@
+"""Binary per-cycle state trace with random access by cycle number.
+
+A StateTraceWriter is a tracer like tracing.TraceWriter: it is handed
+the Simulator at the end of every cycle and records everything the
+_pipeline.txt dump shows, plus the PC, as one row of fixed-width 32-bit
+columns:
+
+  PC
+  every entry of every pipeline buffer (instruction index + 1, 0 = empty)
+  R0-R31
+  per cache set: the LRU way, then per way valid, dirty, tag and data words
+  the data words of the image, dataStart up to dataEnd
+
+Rows go into chunks of up to CHUNK_ROWS. The first row of a chunk is
+stored whole; every later row only as the columns that differ from the
+row before it. A row covers a run of cycles with the same state, so idle
+stretches (skipped or not) take a single row.
+
+File layout (little endian):
+
+  8 bytes   magic "MIPSSTAT"
+  4 bytes   format version
+  4 bytes   length of the layout
+  layout    JSON: buffer names and sizes, cache geometry and data words,
+            padded to 4 bytes
+  chunks    each an array of u32:
+              rows, then per row the first cycle (from the chunk's first
+              cycle) and the cycles it covers, the first row, per later
+              row the number of changed columns, then the changed column
+              numbers and their new values
+  texts     JSON: the text of every instruction decoded during the run,
+            padded to 4 bytes; written at the end, since Fetch decodes
+            words past the text section as it reaches them
+  index     per chunk: first cycle, last cycle, offset, length (u64 each)
+  trailer   texts offset, index offset and chunk count (u64 each),
+            magic "MIPSSTAT"
+
+StateTrace maps a file and finds the state of any cycle by a binary
+search of the index and the rows of a single chunk, so the cost does not
+grow with the length of the run. State.format() renders it exactly as
+Simulator.formatState() did at that cycle.
+"""
+
+import bisect
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from team23_project2 import TEXT_BASE, MASK32, signed
+
+MAGIC = b"MIPSSTAT"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sII")
+INDEX_ENTRY = struct.Struct("<QQQQ")
+TRAILER = struct.Struct("<QQQ8s")
+
+CHUNK_ROWS = 1024
+
+
+#############
+# Packs a list of u32 as little endian bytes
+def packWords(values):
+    words = array('I', values)
+    if (sys.byteorder != "little"):
+        words.byteswap()
+    return words.tobytes()
+
+
+#############
+# Packs a value as JSON text padded to a multiple of 4 bytes
+def packJSON(value):
+    text = json.dumps(value, separators=(",", ":")).encode("ascii")
+    return text + b" " * (-len(text) & 3)
+
+
+#========================================
+# State Trace Writer Class
+#========================================
+class StateTraceWriter(object):
+
+    def __init__(self, file, sim, next=None):
+        self.file = file
+        self.next = next            # tracer also told about every cycle, e.g. the text trace
+        self.buffers = (("Pre-Issue Buffer", sim.fetch.preIssueBuffer),
+                        ("Pre_ALU Queue", sim.ALU.preALUBuff),
+                        ("Post_ALU Queue", sim.ALU.postALUBuff),
+                        ("Pre_MEM Queue", sim.MEM.preMEMBuff),
+                        ("Post_MEM Queue", sim.MEM.postMEMBuff))
+        cache = sim.cache
+        layout = {"buffers": [[name, len(buffer)] for name, buffer in self.buffers],
+                  "sets": cache.numSets,
+                  "ways": cache.ways,
+                  "blockWords": cache.blockWords,
+                  "dataStart": sim.dataStart,
+                  "dataEnd": sim.dataEnd}
+        text = packJSON(layout)
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(text)))
+        self.file.write(text)
+        self.offset = HEADER.size + len(text)
+        self.decoded = sim.decoded  # grows while the run goes on; its texts are written by close()
+
+        self.data = None            # data words as of dataVersion
+        self.dataVersion = None
+        self.index = []             # (first cycle, last cycle, offset, length) per chunk
+        self.startChunk()
+
+    #############
+    # Opens a new state trace file for a Simulator
+    @classmethod
+    def open(cls, path, sim, next=None):
+        return cls(open(path, "wb"), sim, next)
+
+    def startChunk(self):
+        self.firstCycle = None
+        self.cycles = []            # first cycle of every row, from firstCycle
+        self.repeats = []           # cycles every row covers
+        self.keyframe = None
+        self.counts = []
+        self.columns = []
+        self.values = []
+        self.last = None            # the previous row
+
+    #############
+    # The columns of the current state, with the data words last
+    def capture(self, sim):
+        row = [sim.PC]
+        for name, buffer in self.buffers:
+            for entry in buffer:
+                if (entry == -1):
+                    row.append(0)
+                elif (isinstance(entry, tuple)):
+                    row.append(entry[0] + 1)
+                else:
+                    row.append(entry + 1)
+        for value in sim.registers:
+            row.append(value & MASK32)
+        cache = sim.cache
+        for set in range(cache.numSets):
+            row.append(cache.lruWay(set))
+            for line in cache.cacheSets[set]:
+                row.extend(line)
+
+        # data memory only changes on write-backs
+        version = cache.memoryVersion()
+        if (self.dataVersion != version):
+            if (hasattr(sim.memory, "dump")):
+                self.data = list(sim.memory.dump(sim.dataStart, sim.dataEnd - sim.dataStart))
+            else:
+                self.data = list(sim.memory[sim.dataStart:sim.dataEnd])
+            self.dataVersion = version
+        return row, self.data
+
+    #############
+    # Adds a row for `count` cycles from `cycle` on
+    def addRow(self, cycle, count, core, data):
+        if (self.firstCycle is not None and cycle - self.firstCycle > MASK32):
+            self.writeChunk()
+        if (self.last is None):
+            self.firstCycle = cycle
+            self.keyframe = core + data
+        else:
+            lastCore, lastData = self.last
+            changes = [i for i in range(len(core)) if core[i] != lastCore[i]]
+            if (data is not lastData):
+                changes += [len(core) + i for i in range(len(data)) if data[i] != lastData[i]]
+            end = self.firstCycle + self.cycles[-1] + self.repeats[-1]
+            if (not changes and cycle == end and self.repeats[-1] + count <= MASK32):
+                self.repeats[-1] += count       # the same state for longer
+                return
+            self.counts.append(len(changes))
+            for i in changes:
+                self.columns.append(i)
+                self.values.append(core[i] if i < len(core) else data[i - len(core)])
+        self.cycles.append(cycle - self.firstCycle)
+        self.repeats.append(count)
+        self.last = (core, data)
+        if (len(self.cycles) == CHUNK_ROWS):
+            self.writeChunk()
+
+    def writeChunk(self):
+        if (self.last is None):
+            return
+        rows = len(self.cycles)
+        chunk = packWords([rows] + self.cycles + self.repeats + self.keyframe +
+                          self.counts + self.columns + self.values)
+        lastCycle = self.firstCycle + self.cycles[-1] + self.repeats[-1] - 1
+        self.index.append((self.firstCycle, lastCycle, self.offset, len(chunk)))
+        self.file.write(chunk)
+        self.offset += len(chunk)
+        self.startChunk()
+
+    #############
+    # Called by the Simulator at the end of every cycle
+    def cycle(self, sim):
+        core, data = self.capture(sim)
+        self.addRow(sim.cycle, 1, core, data)
+        if (self.next is not None):
+            self.next.cycle(sim)
+
+    #############
+    # Called by the Simulator for cycles first..last, skipped because
+    # they repeat the state it is in now
+    def idle(self, sim, first, last):
+        core, data = self.capture(sim)
+        self.addRow(first, last - first + 1, core, data)
+        if (self.next is not None):
+            self.next.idle(sim, first, last)
+
+    def close(self, sim=None):
+        self.writeChunk()
+        texts = packJSON([record.text for record in self.decoded])
+        self.file.write(texts)
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(TRAILER.pack(self.offset, self.offset + len(texts), len(self.index), MAGIC))
+        self.file.close()
+        if (self.next is not None):
+            self.next.close(sim)
+
+
+#========================================
+# State Class
+#========================================
+class State(object):
+    """The machine state of one cycle, read back from a trace."""
+
+    def __init__(self, trace, cycle, row):
+        self.cycle = cycle
+        self.layout = trace.layout
+        self.PC = row[0]
+        position = 1
+        self.buffers = []           # (name, entries), an entry being an instruction index or -1
+        for name, size in trace.layout["buffers"]:
+            self.buffers.append((name, [value - 1 for value in row[position:position + size]]))
+            position += size
+        self.registers = [signed(value) for value in row[position:position + 32]]
+        position += 32
+        self.cacheSets = []         # (LRU way, lines), a line being [valid, dirty, tag, words...]
+        lineWords = 3 + trace.layout["blockWords"]
+        for set in range(trace.layout["sets"]):
+            lru = row[position]
+            position += 1
+            lines = []
+            for way in range(trace.layout["ways"]):
+                lines.append(list(row[position:position + lineWords]))
+                position += lineWords
+            self.cacheSets.append((lru, lines))
+        self.data = [signed(value) for value in row[position:]]
+
+    #****************************************************
+    # Returns the state as Simulator.formatState() wrote it
+    #****************************************************
+    def format(self):
+        texts = self.layout["texts"]
+        parts = ["--------------------\nCycle:" + str(self.cycle) + "\n", "\n"]
+        for name, entries in self.buffers:
+            parts.append(name + ":\n")
+            for i in range(len(entries)):
+                text = "" if (entries[i] == -1) else texts[entries[i]]
+                parts.append("\tEntry " + str(i) + ":\t" + text + "\n")
+        parts.append("\nRegisters\n")
+        for row in range(0, 32, 8):
+            parts.append("R" + str(row).zfill(2) + ":\t")
+            for value in self.registers[row:row + 8]:
+                parts.append(str(value) + "\t")
+            parts.append("\n")
+        parts.append("\nCache")
+        for set in range(len(self.cacheSets)):
+            lru, lines = self.cacheSets[set]
+            parts.append("\nSet " + str(set) + ": LRU=" + str(lru))
+            for way in range(len(lines)):
+                line = lines[way]
+                if (line[0] == 0):
+                    words = [str(word) for word in line[3:]]
+                else:
+                    words = [format(word, "032b") for word in line[3:]]
+                parts.append("\n\tEntry " + str(way) + ":[(" + str(line[0]) + "," +
+                             str(line[1]) + "," + str(line[2]) + ")<" +
+                             ",".join(words) + ">]")
+        parts.append("\n\nData")
+        dataStart = self.layout["dataStart"]
+        for i in range(len(self.data)):
+            if (i % 8 == 0):
+                parts.append("\n" + str(TEXT_BASE + (dataStart + i) * 4) + ":\t")
+            parts.append(str(self.data[i]) + "\t")
+        parts.append("\n")
+        return "".join(parts)
+
+
+#========================================
+# State Trace Class
+#========================================
+class StateTrace(object):
+    """A state trace file, mapped for reading."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mapped = self.mapped
+        if (len(mapped) < HEADER.size + TRAILER.size):
+            raise ValueError(path + " is not a state trace")
+        magic, version, layoutLength = HEADER.unpack_from(mapped)
+        if (magic != MAGIC):
+            raise ValueError(path + " is not a state trace")
+        if (version != FORMAT_VERSION):
+            raise ValueError(path + " is state trace version " + str(version) +
+                             "; expected " + str(FORMAT_VERSION))
+        textsOffset, indexOffset, chunks, magic = TRAILER.unpack_from(mapped, len(mapped) - TRAILER.size)
+        if (magic != MAGIC):
+            raise ValueError(path + " has no index; the run that wrote it did not finish")
+        self.layout = json.loads(mapped[HEADER.size:HEADER.size + layoutLength].decode("ascii"))
+        self.layout["texts"] = json.loads(mapped[textsOffset:indexOffset].decode("ascii"))
+        self.index = [INDEX_ENTRY.unpack_from(mapped, indexOffset + INDEX_ENTRY.size * i)
+                      for i in range(chunks)]
+        self.firsts = [entry[0] for entry in self.index]
+        self.chunk = None           # (number, decoded rows) of the chunk read last
+
+    def close(self):
+        self.mapped.close()
+
+    #############
+    # First and last cycle in the trace
+    def cycleRange(self):
+        if (not self.index):
+            return None
+        return self.index[0][0], self.index[-1][1]
+
+    #############
+    # Returns a chunk split into its columns: (first cycle of every
+    # row, cycles of every row, first row, changed column counts,
+    # changed columns, new values)
+    def readChunk(self, number):
+        if (self.chunk is not None and self.chunk[0] == number):
+            return self.chunk[1]
+        first, last, offset, length = self.index[number]
+        words = array('I')
+        words.frombytes(self.mapped[offset:offset + length])
+        if (sys.byteorder != "little"):
+            words.byteswap()
+        rows = words[0]
+        starts = [first + cycle for cycle in words[1:1 + rows]]
+        repeats = words[1 + rows:1 + 2 * rows]
+        position = 1 + 2 * rows
+        width = self.rowWidth()
+        keyframe = words[position:position + width]
+        position += width
+        counts = words[position:position + rows - 1]
+        position += rows - 1
+        changed = sum(counts)
+        columns = words[position:position + changed]
+        values = words[position + changed:position + 2 * changed]
+        self.chunk = (number, (starts, repeats, keyframe, counts, columns, values))
+        return self.chunk[1]
+
+    def rowWidth(self):
+        layout = self.layout
+        return (1 + sum(size for name, size in layout["buffers"]) + 32 +
+                layout["sets"] * (1 + layout["ways"] * (3 + layout["blockWords"])) +
+                layout["dataEnd"] - layout["dataStart"])
+
+    #############
+    # Returns the State of a cycle: the first row of its chunk with
+    # the changes of the rows up to the cycle's applied
+    def state(self, cycle):
+        number = bisect.bisect_right(self.firsts, cycle) - 1
+        if (number < 0 or cycle > self.index[number][1]):
+            raise KeyError("cycle " + str(cycle) + " is not in " + self.path)
+        starts, repeats, keyframe, counts, columns, values = self.readChunk(number)
+        r = bisect.bisect_right(starts, cycle) - 1
+        if (cycle >= starts[r] + repeats[r]):
+            raise KeyError("cycle " + str(cycle) + " is not in " + self.path)
+        row = keyframe[:]
+        for i in range(sum(counts[:r])):
+            row[columns[i]] = values[i]
+        return State(self, cycle, row)
+
+
+def main(args):
+    traceName = None
+    cycles = []
+
+    for i in range(len(args)):
+        if (args[i] == '-i' and i < (len(args) - 1)):
+            traceName = args[i + 1]
+        elif ((args[i] == '--cycle' or args[i] == '-n') and i < (len(args) - 1)):
+            cycles.append(int(args[i + 1]))
+
+    if (traceName is None or not cycles):
+        print("usage: statetrace.py -i <state trace> --cycle <cycle> [--cycle <cycle>]...")
+        return 2
+
+    trace = StateTrace(traceName)
+    try:
+        for cycle in cycles:
+            try:
+                sys.stdout.write(trace.state(cycle).format())
+            except KeyError:
+                first, last = trace.cycleRange() or (None, None)
+                print("cycle " + str(cycle) + " is not in the trace (cycles " +
+                      str(first) + "-" + str(last) + ")")
+                return 1
+    finally:
+        trace.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,206 @@
+"""Sweeps of many programs under many configurations.
+
+A manifest is a JSON file:
+
+  {
+    "programs": ["t1test_bin.txt", {"path": "big.bin", "format": "raw"}],
+    "configs":  [{"name": "base"},
+                 {"name": "8x4", "cacheSets": 8, "cacheWays": 4},
+                 {"name": "wide", "fetchWidth": 2, "issueWidth": 2,
+                  "outOfOrderIssue": true, "aluUnits": 2}],
+    "maxCycles": 1000000,
+    "decodeCache": "decoded"
+  }
+
+Every program is run under every config on a pool of worker processes
+(one per core by default). Program paths are relative to the manifest.
+A worker keeps the programs it has decoded, and runs are handed out
+program by program, so each image is decoded about once per worker
+rather than once per run. With "decodeCache", a directory relative to
+the manifest, decoded programs are also kept on disk and shared by every
+worker and later sweep (see decodecache.py). One summary per run is streamed to the output
+file as soon as it finishes, as CSV or, for a .jsonl file, JSON lines:
+
+  program, config, cycles, instructions, IPC, cache hit rate, halted,
+  and a hash of the final registers
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from array import array
+
+from team23_project2 import Config, Simulator
+
+FIELDS = ("program", "config", "cycles", "instructions", "IPC", "hitRate",
+          "halted", "registerHash", "error")
+
+decodedPrograms = {}        # per worker process: (path, format, byteorder, cache) -> Disassembler
+
+
+#############
+# Returns a short stable hash of a register file
+def registerHash(registers):
+    return hashlib.sha1(array("i", registers).tobytes()).hexdigest()[:16]
+
+
+#############
+# Returns the decoded program, loading it on first use in this process
+def decodedProgram(path, format, byteorder, cacheDirectory=None):
+    key = (path, format, byteorder, cacheDirectory)
+    program = decodedPrograms.get(key)
+    if (program is None):
+        import loader
+        program = loader.loadProgram(path, format, byteorder, cacheDirectory)
+        decodedPrograms[key] = program
+    return program
+
+
+#############
+# Simulates one program under one config and returns its summary
+def runOne(task):
+    program, options, maxCycles = task
+    options = dict(options)
+    name = options.pop("name", "")
+    summary = dict.fromkeys(FIELDS, "")
+    summary["program"] = program["path"]
+    summary["config"] = name
+    try:
+        dis = decodedProgram(program["path"], program.get("format"),
+                             program.get("byteorder", "little"), program.get("decodeCache"))
+        config = Config(maxCycles=options.pop("maxCycles", maxCycles), **options)
+        sim = Simulator(dis, config)
+        cycles = sim.run()
+        sim.cache.flush()
+        stats = sim.cache.stats()
+        summary["cycles"] = cycles
+        summary["instructions"] = sim.instructionsRetired
+        summary["IPC"] = round(float(sim.instructionsRetired) / cycles, 6) if cycles else 0.0
+        summary["hitRate"] = round(stats["hitRate"], 6)
+        summary["halted"] = sim.halted
+        summary["registerHash"] = registerHash(sim.registers)
+    except Exception as e:
+        summary["error"] = type(e).__name__ + ": " + str(e)
+    return summary
+
+
+#############
+# Reads a manifest and returns the list of run tasks
+def readManifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+
+    decodeCache = manifest.get("decodeCache")
+    if (decodeCache is not None):
+        decodeCache = os.path.join(base, decodeCache)
+
+    programs = []
+    for entry in manifest["programs"]:
+        if (not isinstance(entry, dict)):
+            entry = {"path": entry}
+        entry = dict(entry)
+        entry["path"] = os.path.join(base, entry["path"])
+        entry.setdefault("decodeCache", decodeCache)
+        programs.append(entry)
+
+    configs = manifest.get("configs") or [{"name": "default"}]
+    for i in range(len(configs)):
+        if ("name" not in configs[i]):
+            configs[i] = dict(configs[i], name="config" + str(i))
+    maxCycles = manifest.get("maxCycles")
+
+    # program-major, so consecutive tasks on a worker share a decoded program
+    return [(program, config, maxCycles) for program in programs for config in configs]
+
+
+#========================================
+# Summary Writer Class
+#========================================
+class SummaryWriter(object):
+
+    def __init__(self, out, jsonLines=False):
+        self.out = out
+        self.jsonLines = jsonLines
+        if (not jsonLines):
+            self.out.write(",".join(FIELDS) + "\n")
+
+    def write(self, summary):
+        if (self.jsonLines):
+            self.out.write(json.dumps(summary, sort_keys=True) + "\n")
+        else:
+            self.out.write(",".join(csvField(summary[field]) for field in FIELDS) + "\n")
+        self.out.flush()
+
+
+def csvField(value):
+    value = str(value)
+    if (any(c in value for c in ',"\n')):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+#============================================================
+# Runs every task on `processes` workers (all cores if None),
+# passing each summary to `callback` as soon as it is ready
+#
+# Returns the number of runs that raised an error
+#============================================================
+def sweep(tasks, callback, processes=None):
+    if (processes is None):
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(tasks)))
+    errors = 0
+
+    if (processes == 1):
+        results = map(runOne, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        # chunks keep runs of the same program on the same worker
+        chunksize = max(1, len(tasks) // (processes * 4))
+        results = pool.imap_unordered(runOne, tasks, chunksize)
+    try:
+        for summary in results:
+            if (summary["error"]):
+                errors += 1
+            callback(summary)
+    finally:
+        if (pool is not None):
+            pool.close()
+            pool.join()
+    return errors
+
+
+#========================================
+# Main Code
+#========================================
+def main(args):
+    manifestName = None
+    outputFileName = None
+    processes = None
+
+    for i in range(len(args)):
+        if (args[i] == '-m' and i < (len(args) - 1)):
+            manifestName = args[i + 1]
+        elif (args[i] == '-o' and i < (len(args) - 1)):
+            outputFileName = args[i + 1]
+        elif (args[i] == '-j' and i < (len(args) - 1)):
+            processes = int(args[i + 1])
+
+    if (manifestName is None or outputFileName is None):
+        print("usage: sweep.py -m <manifest.json> -o <summary.csv|summary.jsonl> [-j <processes>]")
+        return 2
+
+    tasks = readManifest(manifestName)
+    with open(outputFileName, "w") as out:
+        writer = SummaryWriter(out, jsonLines=outputFileName.endswith(".jsonl"))
+        errors = sweep(tasks, writer.write, processes)
+    print(str(len(tasks)) + " runs, " + str(errors) + " errors")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
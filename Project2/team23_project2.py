@@ -1,208 +1,414 @@
 from sys import argv
-import math
+from array import array
+import random
+import sys
 
-mainMemory = []
-registers = [0] * 33
+import tracing
+
+TEXT_BASE = 96      # address of the first word of every program image
+
+# array typecode holding one unsigned 32-bit word per item
+WORD_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+# maps a byte to its top bit, used to pull valid bits out of a word image
+TOP_BIT = bytes(bytearray([b >> 7 for b in range(256)]))
 
 #========================================
-# Command Line Arguments
+# Configuration
 #========================================
-for i in range(len(argv)):
-    if (argv[i] == '-i' and i < (len(argv) - 1)):  # make sure there are at least 2 args
-        inputFileName = argv[i + 1]		    
-    elif (argv[i] == '-o' and i < (len(argv) - 1)):
-        outputFileName = argv[i + 1]
-
-inFile = open(inputFileName, "r")
-disFile = open(outputFileName + "_dis.txt", "w")
-pipelineFile = open(outputFileName + "_pipeline.txt", "w")
+class Config(object):
+    """Run options for a Simulator.
+
+    Every attribute has a default matching the command line tool, so
+    Config() alone describes a plain run.
+    """
+
+    def __init__(self, **options):
+        self.maxCycles = None       # stop after this many cycles (None = run to the BREAK)
+        self.functionalCPI = 1.0    # cycles charged per instruction run by the functional executor
+        self.translateBlocks = True     # compile hot basic blocks in the functional executor
+        self.translateThreshold = 2     # times a block is entered before it is compiled
+
+        # Cache geometry and policies
+        self.cacheSets = 4              # number of sets (power of two)
+        self.cacheWays = 2              # associativity
+        self.cacheBlockWords = 2        # words per block (power of two)
+        self.cacheSize = None           # total bytes; when set, overrides cacheSets
+        self.cacheReplacement = "lru"   # "lru", "fifo" or "random"
+        self.cacheWritePolicy = "writeback"     # "writeback" or "writethrough"
+        self.cacheSeed = 0              # seed for random replacement
+        self.cacheMissLatency = 1       # cycles a missing block takes to arrive
+
+        # Memory hierarchy extensions, all off by default
+        self.prefetcher = "none"        # "none", "nextline" or "stride" (next line for fetches, stride for LW/SW)
+        self.prefetchDegree = 1         # blocks prefetched ahead on each trigger
+        self.prefetchBufferEntries = 4  # prefetched blocks held beside the cache until used
+        self.prefetchTableEntries = 16  # stride table entries, one per LW/SW
+        self.victimCacheEntries = 0     # fully associative victim cache lines (0 = none)
+        self.writeBufferEntries = 0     # dirty blocks queued for main memory (0 = none)
+        self.writebackLatency = 0       # cycles main memory takes to absorb a dirty block (0 = free)
+
+        # Multicore systems (see multicore.py)
+        self.coherenceProtocol = "mesi" # "msi" or "mesi"
+        self.busCycles = 1              # cycles one transaction holds the shared bus (0 = never contended)
+
+        self.memorySize = None      # bytes of address space from TEXT_BASE (None = the program image)
+
+        # Pipeline widths, buffer depths and functional units
+        self.fetchWidth = 1             # instructions fetched per cycle
+        self.issueWidth = 1             # instructions issued per cycle
+        self.outOfOrderIssue = False    # let younger Pre-Issue entries issue past a stalled one
+        self.preIssueSize = 4           # Pre-Issue Buffer entries
+        self.preALUSize = 2             # Pre-ALU Queue entries
+        self.preMEMSize = 2             # Pre-MEM Queue entries
+        self.aluUnits = 1               # Pre-ALU entries executed per cycle (Post-ALU entries)
+        self.memUnits = 1               # Pre-MEM entries accessed per cycle (Post-MEM entries)
+
+        # Branch prediction (see predictors.py)
+        self.branchPredictor = "none"   # "none" (stall until resolved), "nottaken", "onebit", "twobit" or "gshare"
+        self.predictorEntries = 1024    # direction table entries (power of two)
+        self.predictorHistoryBits = 8   # gshare global history length
+        self.btbEntries = 64            # branch target buffer entries (power of two)
+
+        self.skipIdle = True        # jump over cycles in which the whole machine waits on a miss
+
+        self.decodeCache = None     # directory of decoded programs reused by fromWords (None = decode every time)
+
+        for name in options:
+            if (not hasattr(self, name)):
+                raise TypeError("unknown config option '" + name + "'")
+            setattr(self, name, options[name])
+
+#############
+# Evaluates the 2's Complement form of a 32-bit word
+def signed(word):
+    return word - ((word & 0x80000000) << 1)
 
 #========================================
-# Disassembler Class
+# Decoded Instruction Records
 #========================================
-class Disassembler:
 
-    binaryList = []
+# Operation handler indices, one per instruction the pipeline understands
+OP_UNKNOWN = 0
+OP_NOP = 1
+OP_ADD = 2
+OP_SUB = 3
+OP_MUL = 4
+OP_AND = 5
+OP_OR = 6
+OP_MOVZ = 7
+OP_SLL = 8
+OP_SRL = 9
+OP_JR = 10
+OP_BREAK = 11
+OP_J = 12
+OP_BEQ = 13
+OP_BLTZ = 14
+OP_ADDI = 15
+OP_SW = 16
+OP_LW = 17
+
+# R-type function codes (opcode 0 or 28)
+R_TYPE_OPS = {8: OP_JR, 32: OP_ADD, 34: OP_SUB, 0: OP_SLL, 2: OP_SRL,
+              36: OP_AND, 37: OP_OR, 10: OP_MOVZ, 13: OP_BREAK}
+
+# I-type and J-type opcodes
+I_TYPE_OPS = {4: OP_BEQ, 1: OP_BLTZ, 8: OP_ADDI, 11: OP_SW, 3: OP_LW}
+
+# Where an instruction goes once it has been fetched
+KIND_NONE = 0       # NOPs, invalid and unknown words: dropped by Fetch
+KIND_ALU = 1        # computed by the ALU and written back from Post_ALU
+KIND_MEM = 2        # LW/SW: address computed by the ALU, then the MEM unit
+KIND_BRANCH = 3     # J, JR, BEQ, BLTZ: resolved by Fetch
+KIND_BREAK = 4      # stops Fetch
+
+OP_KINDS = {OP_ADD: KIND_ALU, OP_SUB: KIND_ALU, OP_MUL: KIND_ALU, OP_AND: KIND_ALU,
+            OP_OR: KIND_ALU, OP_MOVZ: KIND_ALU, OP_SLL: KIND_ALU, OP_SRL: KIND_ALU,
+            OP_ADDI: KIND_ALU, OP_LW: KIND_MEM, OP_SW: KIND_MEM, OP_J: KIND_BRANCH,
+            OP_JR: KIND_BRANCH, OP_BEQ: KIND_BRANCH, OP_BLTZ: KIND_BRANCH,
+            OP_BREAK: KIND_BREAK}
+
+class Instruction(object):
+    """One pre-decoded instruction word.
+
+    Every field is extracted once by the Disassembler so the pipeline
+    stages never have to slice or re-parse the binary string again.
+    text, when given, is the already formatted instruction.
+    """
+
+    __slots__ = ('word', 'valid', 'opcode', 'rs', 'rt', 'rd', 'shamt',
+                 'funct', 'imm', 'target', 'op', 'kind', 'dest',
+                 'readMask', 'writeMask', 'text')
+
+    def __init__(self, word, text=None):
+        self.word = word
+        self.valid = word >> 31
+        self.opcode = (word >> 26) & 31
+        self.rs = (word >> 21) & 31
+        self.rt = (word >> 16) & 31
+        self.rd = (word >> 11) & 31
+        self.shamt = (word >> 6) & 31
+        self.funct = word & 63
+        self.imm = (word & 0xFFFF) - ((word & 0x8000) << 1)    # sign-extended
+        self.target = word & 0x3FFFFFF
+
+        if (word == 0):
+            self.op = OP_NOP
+        elif (self.opcode == 0 or self.opcode == 28):
+            if (self.opcode == 28 and self.funct == 2):
+                self.op = OP_MUL
+            else:
+                self.op = R_TYPE_OPS.get(self.funct, OP_UNKNOWN)
+        elif (self.opcode == 2):
+            self.op = OP_J
+        else:
+            self.op = I_TYPE_OPS.get(self.opcode, OP_UNKNOWN)
+
+        op = self.op
+        self.kind = KIND_NONE
+        if (self.valid):
+            self.kind = OP_KINDS.get(op, KIND_NONE)
+
+        # destination register (-1 = none) and the registers read, as bitmasks
+        self.dest = -1
+        self.readMask = 0
+        if (self.kind != KIND_NONE):
+            if (op == OP_ADDI or op == OP_LW):
+                self.dest = self.rt
+                self.readMask = 1 << self.rs
+            elif (op == OP_SLL or op == OP_SRL):
+                self.dest = self.rd
+                self.readMask = 1 << self.rt
+            elif (op == OP_MOVZ):
+                self.dest = self.rd
+                self.readMask = (1 << self.rs) | (1 << self.rt) | (1 << self.rd)
+            elif (self.kind == KIND_ALU):
+                self.dest = self.rd
+                self.readMask = (1 << self.rs) | (1 << self.rt)
+            elif (op == OP_SW or op == OP_BEQ):
+                self.readMask = (1 << self.rs) | (1 << self.rt)
+            elif (op == OP_JR or op == OP_BLTZ):
+                self.readMask = 1 << self.rs
+        if (self.dest == 0):
+            self.dest = -1      # R0 is hard-wired, writes to it are dropped
+        self.readMask &= ~1
+        self.writeMask = 0 if (self.dest == -1) else (1 << self.dest)
+
+        self.text = self.format() if (text is None) else text
+
+    ############
+    # returns the instruction as a formatted string
+    def format(self):
+        op = self.op
+        rs = "R" + str(self.rs)
+        rt = "R" + str(self.rt)
+        rd = "R" + str(self.rd)
+
+        if (op == OP_NOP):
+            return "NOP"
+        elif (op == OP_MUL):
+            return "MUL\t" + rd + ", " + rs + ", " + rt
+        elif (op == OP_JR):
+            return "JR\t" + rs
+        elif (op == OP_ADD):
+            return "ADD\t" + rd + ", " + rs + ", " + rt
+        elif (op == OP_SUB):
+            return "SUB\t" + rd + ", " + rs + ", " + rt
+        elif (op == OP_SLL):
+            return "SLL\t" + rd + ", " + rt + ", #" + str(self.shamt)
+        elif (op == OP_SRL):
+            return "SRL\t" + rd + ", " + rt + ", #" + str(self.shamt)
+        elif (op == OP_AND):
+            return "AND\t" + rd + ", " + rs + ", " + rt
+        elif (op == OP_OR):
+            return "OR\t" + rd + ", " + rs + ", " + rt
+        elif (op == OP_MOVZ):
+            return "MOVZ\t" + rd + ", " + rs + ", " + rt
+        elif (op == OP_BREAK):
+            return "BREAK"
+        elif (op == OP_J):
+            return "J\t#" + str(self.target * 4)
+        elif (op == OP_BEQ):
+            return "BEQ\t" + rs + ", " + rt + ", #" + str(self.imm)
+        elif (op == OP_BLTZ):
+            return "BLTZ\t" + rs + ", #" + str(self.imm)
+        elif (op == OP_ADDI):
+            return "ADDI\t" + rt + ", " + rs + ", #" + str(self.imm)
+        elif (op == OP_SW):
+            return "SW\t" + rt + ", " + str(self.imm) + "(" + rs + ")"
+        elif (op == OP_LW):
+            return "LW\t" + rt + ", " + str(self.imm) + "(" + rs + ")"
+        return " "
 
-    instructions = []   # the list of all INSTRUCTIONS, without data
-    opcodes = []        # the opcode of every instruction in order
-    mem = []            # values stored in memory after the BREAK instruction
-    valids = []         # indecies of valid instructions
-    addrs = []          # addresses of the instructions in their respective order
-    args1 = []          # list of all first args in order of instructions (-1 = N/A)
-    args2 = []          # list of all second args in order of instructions (-1 = N/A)
-    args3 = []          # list of all third args in order of instructions (-1 = N/A)
-                        # arg3 INCLUDES IMMEDIATE VALUES
-    instStrings = []    # the formatted string of the instruction
+#========================================
+# Instruction Semantics
+#========================================
 
-    numInstrs = 0       # the total number of instructions
+MASK32 = 0xFFFFFFFF
+
+#############
+# Returns the value an ALU instruction writes to its destination register
+def aluResult(inst, registers):
+    op = inst.op
+    if (op == OP_ADDI):
+        return signed((registers[inst.rs] + inst.imm) & MASK32)
+    elif (op == OP_ADD):
+        return signed((registers[inst.rs] + registers[inst.rt]) & MASK32)
+    elif (op == OP_SUB):
+        return signed((registers[inst.rs] - registers[inst.rt]) & MASK32)
+    elif (op == OP_MUL):
+        return signed((registers[inst.rs] * registers[inst.rt]) & MASK32)
+    elif (op == OP_AND):
+        return registers[inst.rs] & registers[inst.rt]
+    elif (op == OP_OR):
+        return registers[inst.rs] | registers[inst.rt]
+    elif (op == OP_SLL):
+        return signed((registers[inst.rt] << inst.shamt) & MASK32)
+    elif (op == OP_SRL):
+        return signed((registers[inst.rt] & MASK32) >> inst.shamt)
+    elif (op == OP_MOVZ):
+        if (registers[inst.rt] == 0):
+            return registers[inst.rs]
+        return registers[inst.rd]
+    return 0
+
+#############
+# Returns the address of the instruction after a J/JR/BEQ/BLTZ at PC
+#
+# Branch offsets are byte offsets from the next instruction, exactly as
+# the disassembler prints them
+def branchTarget(inst, PC, registers):
+    op = inst.op
+    if (op == OP_J):
+        return inst.target * 4
+    elif (op == OP_JR):
+        return registers[inst.rs]
+    elif (op == OP_BEQ):
+        if (registers[inst.rs] == registers[inst.rt]):
+            return PC + 4 + inst.imm
+    elif (op == OP_BLTZ):
+        if (registers[inst.rs] < 0):
+            return PC + 4 + inst.imm
+    return PC + 4
 
+#========================================
+# Disassembler Class
+#========================================
+class Disassembler:
 
+    def __init__(self, words):
+        if (not isinstance(words, array) or words.typecode != WORD_TYPECODE):
+            words = array(WORD_TYPECODE, words)
+        self.words = words          # every 32-bit word of the program image
+
+        self.instructions = array(WORD_TYPECODE)    # the list of all INSTRUCTIONS, without data
+        self.opcodes = array('B')   # the opcode of every instruction in order
+        self.mem = array('i')       # values stored in memory after the BREAK instruction
+        self.valids = array('B')    # indecies of valid instructions
+        self.addrs = array(WORD_TYPECODE)   # addresses of the instructions in their respective order
+                                            # (data word i lives at dataAddress + 4 * i)
+        self.dataAddress = TEXT_BASE        # address of the first word after the BREAK
+        self.args1 = array('i')     # list of all first args in order of instructions (-1 = N/A)
+        self.args2 = array('i')     # list of all second args in order of instructions (-1 = N/A)
+        self.args3 = array('i')     # list of all third args in order of instructions (-1 = N/A)
+                                    # arg3 INCLUDES IMMEDIATE VALUES
+        self.instStrings = []       # the formatted string of the instruction
+        self.decoded = []           # pre-decoded Instruction record for every word up to the BREAK
+
+        self.numInstrs = 0          # the total number of instructions
+        self.cacheEntry = None      # decodecache.Entry it was loaded from, which holds its rendered output
 
-    def __init__(self, binaryList):
-        # Trim new line characters off of strings
-        for i in range(len(binaryList)):
-            self.binaryList.append(binaryList[i][:32])
-    
     #############
-    # Evaluates the 2's Complement form of a binary number
-    def twosComp(self, binString):
-        return (int(binString[1:], 2) - ((int(binString[0], 2)) << (len(binString) - 1)))
+    # Builds a Disassembler from lines of '0'/'1' text, one word per line
+    @classmethod
+    def fromLines(cls, lines):
+        words = array(WORD_TYPECODE)
+        for line in lines:
+            line = line.strip()
+            if (line):
+                words.append(int(line[:32], 2))
+        return cls(words)
 
     #############
-    # Disassembles the list of binary strings
+    # Disassembles the list of words
     def disassemble(self):
         breakFound = False
-        PC = 96
+        PC = TEXT_BASE
+        index = 0
+
+        while (index < len(self.words) and breakFound == False):
+            record = Instruction(self.words[index])
+            breakFound = self.determineInstruction(record, PC)
+            self.decoded.append(record)
+            self.instStrings.append(record.text)
+            PC += 4
+            index += 1
 
-        for i in range(len(self.binaryList)):
-            if (breakFound == False):
-                breakFound = self.determineInstruction(self.binaryList[i], PC)
-                self.instStrings.append(self.toString(self.binaryList[i]))
-                PC += 4
-            else:
-                self.valids.append(int(self.binaryList[i][:1], 2))
-                self.addrs.append(PC)
-                self.mem.append(self.twosComp(self.binaryList[i]))
-                PC += 4
+        # Everything after the BREAK is data, converted a whole block at a time
+        self.dataAddress = PC
+        data = self.words[index:].tobytes()
+        if (sys.byteorder == 'little'):
+            self.valids.frombytes(data[3::4].translate(TOP_BIT))
+        else:
+            self.valids.frombytes(data[0::4].translate(TOP_BIT))
+        self.mem.frombytes(data)
+        return self
     
     ############
     # Breaks up the instruction and stores it in the appropriate list
     #
     # Returns TRUE if break instruction was found
-    def determineInstruction(self, inst, PC):
+    def determineInstruction(self, record, PC):
 
-        if (int(inst[:1], 2) == 0):
+        if (record.valid == 0):
             self.valids.append(0)
             return False
 
         self.valids.append(1)
         self.addrs.append(PC)
-        self.instructions.append(inst)
+        self.instructions.append(record.word)
         self.numInstrs += 1
-        opcode = int(inst[1:6], 2)
+        opcode = record.opcode
         self.opcodes.append(opcode)
         
         if (opcode == 0 or opcode == 28):
-            self.args1.append(int(inst[6:11], 2))
-            self.args2.append(int(inst[11:16], 2))
-            self.args3.append(int(inst[16:21], 2))
-
-            functionCode = int(inst[-6:], 2)
+            self.args1.append(record.rs)
+            self.args2.append(record.rt)
+            self.args3.append(record.rd)
 
             # BREAK found
-            if (functionCode == 13):
+            if (record.funct == 13):
                 return True
         
         elif (opcode == 2):
-            self.args1.append(-(int(inst[6:11], 2)))
-            self.args2.append(-(int(inst[11:16], 2)))
-            self.args3.append(-(int(inst[16:21], 2)))
+            self.args1.append(-record.rs)
+            self.args2.append(-record.rt)
+            self.args3.append(-record.rd)
 
         else:
-            self.args1.append(int(inst[6:11], 2))
-            self.args2.append(int(inst[11:16], 2))
-            self.args3.append(self.twosComp(inst[16:]))
+            self.args1.append(record.rs)
+            self.args2.append(record.rt)
+            self.args3.append(record.imm)
 
         return False
 
     ############
     # returns the binary instruction as a formatted string
     def toString(self, inst):
-        instString = " "
-
-        # determine opcode
-        opcode = int(inst[1:6], 2)
-
-
-        if (int(inst, 2) == 0):
-            instString = "NOP"
-
-        # r-types
-        elif (opcode == 0 or opcode == 28):
-
-            # gather all parts of instruction for R-Types
-            rs = "R" + str(int(inst[6:11], 2))
-            rt = "R" + str(int(inst[11:16], 2))
-            rd = "R" + str(int(inst[16:21], 2))
-            functionCode = int(inst[-6:], 2)
-
-            # MUL
-            if (opcode == 28 and functionCode == 2):
-                instString = "MUL\t" + rd + ", " + rs + ", " + rt
-            # JR
-            elif (functionCode == 8):
-                instString = "JR\t" + rs
-            # ADD
-            elif (functionCode == 32):
-                instString = "ADD\t" + rd + ", " + rs + ", " + rt
-            # SUB
-            elif (functionCode == 34):
-                instString = "SUB\t" + rd + ", " + rs + ", " + rt
-            # SLL
-            elif (functionCode == 0):
-                shiftAmount = str(int(inst[21:26], 2))
-                instString = "SLL\t" + rd + ", " + rt + ", #" + shiftAmount
-            # SRL
-            elif (functionCode == 2):
-                shiftAmount = str(int(inst[21:26], 2))
-                instString = "SRL\t" + rd + ", " + rt + ", #" + shiftAmount
-            # AND
-            elif (functionCode == 36):
-                instString = "AND\t" + rd + ", " + rs + ", " + rt
-            # OR
-            elif (functionCode == 37):
-                instString = "OR\t" + rd + ", " + rs + ", " + rt
-            # MOVZ
-            elif (functionCode == 10):
-                instString = "MOVZ\t" + rd + ", " + rs + ", " + rt
-            # BREAK
-            elif (functionCode == 13):
-                instString = "BREAK"
-
-        # j-types
-        elif (opcode == 2):
-            addr = str(int(inst[6:], 2) * 4)
-            instString = "J\t#" + addr
-
-        # i-types
-        else:
-
-            # gather all parts of instruction for I-Types
-            rs = "R" + str(int(inst[6:11], 2))
-            rt = "R" + str(int(inst[11:16], 2))
-            imm = str(self.twosComp(inst[16:]))
-
-            # BEQ
-            if (opcode == 4):
-                offset = int(imm)
-                instString = "BEQ\t" + rs + ", " + rt + ", #" + str(offset)
-            # BLTZ
-            elif (opcode == 1):
-                offset = int(imm)
-                instString = "BLTZ\t" + rs + ", #" + str(offset)
-            # ADDI
-            elif (opcode == 8):
-                instString = "ADDI\t" + rt + ", " + rs + ", #" + imm
-            # SW
-            elif (opcode == 11):
-                instString = "SW\t" + rt + ", " + imm + "(" + rs + ")"
-            # LW
-            elif (opcode == 3):
-                instString = "LW\t" + rt + ", " + imm + "(" + rs + ")"
-
-
-        # Return
-        return instString
+        return Instruction(int(inst, 2)).text
 
     def output(self, file):
-        PC = 96
+        if (self.cacheEntry is not None):
+            self.cacheEntry.writeOutput(file)
+            return
+        PC = TEXT_BASE
         index = 0;
         for i in range(len(self.instructions)):
-            fullLine = self.instructions[i][0] + " " + self.instructions[i][1:6] + " "
-            fullLine += self.instructions[i][6:11] + " " + self.instructions[i][11:16] + " "
-            fullLine += self.instructions[i][16:21] + " " + self.instructions[i][21:26] + " " 
-            fullLine += self.instructions[i][26:]
+            inst = format(self.instructions[i], "032b")
+            fullLine = inst[0] + " " + inst[1:6] + " "
+            fullLine += inst[6:11] + " " + inst[11:16] + " "
+            fullLine += inst[16:21] + " " + inst[21:26] + " " 
+            fullLine += inst[26:]
 
             fullLine += "\t" + str(PC)
             fullLine += "\t" + self.instStrings[i]
@@ -212,7 +418,7 @@ class Disassembler:
             PC += 4
             index += 1
         for i in range(len(self.mem)):
-            fullLine = str(self.binaryList[index])
+            fullLine = format(self.words[index], "032b")
 
             fullLine += "\t" + str(PC)
             fullLine += "\t" + str(self.mem[i])
@@ -223,418 +429,1436 @@ class Disassembler:
             index += 1
 
 
+#========================================
+# Stage Status
+#========================================
+
+# What a stage did in a cycle; every stage's run() returns one
+STAGE_EMPTY = 0             # nothing to do
+STAGE_BUSY = 1              # moved an instruction along
+STALL_PRE_ISSUE_FULL = 2    # Fetch: the Pre-Issue Buffer is full
+STALL_PRE_ALU_FULL = 3      # Issue: the Pre-ALU Queue is full
+STALL_ICACHE_MISS = 4       # Fetch: the instruction missed in the cache
+STALL_DCACHE_MISS = 5       # MEM: the data access missed in the cache
+STALL_STRUCTURAL = 6        # the next buffer (Pre-MEM, Post-ALU, Post-MEM) is full
+STALL_DATA_HAZARD = 7       # an operand is still being computed
+STALL_BRANCH = 8            # waiting on a predicted branch to be resolved
+
+STATUS_NAMES = ("empty", "busy", "preIssueFull", "preALUFull", "icacheMiss",
+                "dcacheMiss", "structural", "dataHazard", "branchPending")
+
+#========================================
+# Scoreboard Class
+#========================================
+class Scoreboard(object):
+    """Registers with a write outstanding, kept as bitmasks.
+
+    writes holds the destinations of issued instructions that have not
+    been written back; there is never more than one issued writer of a
+    register, since Issue holds back WAW hazards. queuedWrites holds the
+    destinations of the instructions waiting in the Pre-Issue Buffer,
+    counted per register because several may write the same one. Every
+    update is a few mask operations, whatever the buffer sizes.
+    """
+
+    def __init__(self):
+        self.writes = 0
+        self.queuedWrites = 0
+        self.queuedCounts = [0] * 32
+
+    #############
+    # An instruction entered the Pre-Issue Buffer
+    def queue(self, inst):
+        dest = inst.dest
+        if (dest != -1):
+            self.queuedCounts[dest] += 1
+            self.queuedWrites |= inst.writeMask
+
+    #############
+    # An instruction left the Pre-Issue Buffer without issuing
+    def unqueue(self, inst):
+        dest = inst.dest
+        if (dest != -1):
+            self.queuedCounts[dest] -= 1
+            if (self.queuedCounts[dest] == 0):
+                self.queuedWrites &= ~inst.writeMask
+
+    #############
+    # An instruction left the Pre-Issue Buffer for the Pre-ALU Queue
+    def issue(self, inst):
+        self.unqueue(inst)
+        self.writes |= inst.writeMask
+
+    #############
+    # A register was written back
+    def retire(self, dest):
+        self.writes &= ~(1 << dest)
+
+    #############
+    # Recomputes every mask from the contents of the buffers
+    def rebuild(self, sim):
+        self.__init__()
+        for index in sim.fetch.preIssueBuffer:
+            if (index != -1):
+                self.queue(sim.decoded[index])
+        for buffer in (sim.ALU.preALUBuff, sim.MEM.preMEMBuff, sim.ALU.postALUBuff, sim.MEM.postMEMBuff):
+            for entry in buffer:
+                if (entry != -1):
+                    if (isinstance(entry, tuple)):
+                        entry = entry[0]
+                    self.writes |= sim.decoded[entry].writeMask
+
 #========================================
 # Fetch Class
 #========================================
 class Fetch:
 
-    preIssueBuffer = [-1, -1, -1, -1]
-
-    def __init__(self, _cache):
+    def __init__(self, sim, _cache):
+        self.sim = sim
         self.cache = _cache
-        
-    def run(self):
-        index = (Simulator.PC - 96) / 4
-        isHit, word = self.cache.accessMem(index, 0, False, 0);
-        if (isHit):
-            for i in range(len(self.preIssueBuffer)):
-                if (self.preIssueBuffer[i] == -1):
-                    self.preIssueBuffer[i] = index
-                    Simulator.PC += 4
-                    if (int(word[1:6], 2) == 0 and int(word[-6:], 2) == 13):
-                        # BREAK Found
-                        return False # Placeholder
-                    break
+        self.decoded = sim.decoded
+        self.scoreboard = sim.scoreboard
+        self.width = sim.config.fetchWidth
+        self.preIssueBuffer = [-1] * sim.config.preIssueSize
+        self.stopped = False        # no more instructions will be fetched
+        self.breakFound = False     # the BREAK has been fetched
+
+        self.predictor = None       # predictors.BranchUnit, when branches are predicted
+        if (sim.config.branchPredictor != "none"):
+            import predictors
+            self.predictor = predictors.BranchUnit(sim.config)
+        self.pendingBranch = None   # (index, PC, predicted next PC) of the branch fetched past
+        self.olderCount = 0         # Pre-Issue entries older than the pending branch
+        self.speculativeNops = 0    # NOPs dropped after the pending branch
+
+    #############
+    # Resolves the pending branch once its operands are ready; a
+    # mispredict squashes everything fetched after it
+    #
+    # Returns True if the branch was resolved
+    def resolvePending(self):
+        index, PC, predicted = self.pendingBranch
+        inst = self.decoded[index]
+        buffer = self.preIssueBuffer
+        older = 0
+        for i in range(self.olderCount):
+            older |= self.decoded[buffer[i]].writeMask
+        if (inst.readMask & (self.scoreboard.writes | older)):
+            return False
+        sim = self.sim
+        actual = branchTarget(inst, PC, sim.registers)
+        self.predictor.resolve(inst, PC, actual, predicted)
+        sim.instructionsRetired += 1
+        if (actual == predicted):
+            sim.instructionsRetired += self.speculativeNops
         else:
-            return True
+            self.predictor.mispredicts += 1
+            for i in range(self.olderCount, len(buffer)):
+                if (buffer[i] != -1):
+                    self.scoreboard.unqueue(self.decoded[buffer[i]])
+                    buffer[i] = -1
+                    self.predictor.squashed += 1
+            sim.PC = actual
+        self.pendingBranch = None
+        self.speculativeNops = 0
         return True
 
+    #############
+    # Fetches up to `width` instructions into the Pre-Issue Buffer
+    #
+    # Branches are resolved here once none of their operands are still
+    # being computed, and end the fetch group; NOPs are dropped and the
+    # BREAK stops fetching. With a predictor, a branch whose operands
+    # are not ready is predicted instead, and fetch goes on past it
+    def run(self):
+        resolved = self.pendingBranch is not None and self.resolvePending()
+        if (self.stopped):
+            return STAGE_BUSY if resolved else STAGE_EMPTY
+        sim = self.sim
+        buffer = self.preIssueBuffer
+        fetched = 0
+        status = STAGE_EMPTY
+        while (fetched < self.width):
+            if (buffer[-1] != -1):
+                status = STALL_PRE_ISSUE_FULL
+                break
+            index = (sim.PC - TEXT_BASE) // 4
+            isHit, word = self.cache.accessMem(index, 0, False, 0)
+            if (not isHit):
+                status = STALL_ICACHE_MISS
+                break
+
+            if (index < len(self.decoded)):
+                inst = self.decoded[index]
+            else:
+                inst = sim.instructionAt(index)
+            kind = inst.kind
+
+            if (self.pendingBranch is not None and (kind == KIND_BRANCH or kind == KIND_BREAK)):
+                status = STALL_BRANCH           # one unresolved branch at a time
+                break
+            if (kind == KIND_BRANCH):
+                ready = not (inst.readMask & (self.scoreboard.writes | self.scoreboard.queuedWrites))
+                if (self.predictor is not None):
+                    predicted = self.predictor.predict(inst, sim.PC)
+                    if (not ready):
+                        self.pendingBranch = (index, sim.PC, predicted)
+                        self.olderCount = len(buffer) - buffer.count(-1)
+                        self.predictor.speculated += 1
+                        sim.PC = predicted
+                        fetched += 1
+                        break
+                    actual = branchTarget(inst, sim.PC, sim.registers)
+                    self.predictor.resolve(inst, sim.PC, actual, predicted)
+                elif (not ready):
+                    status = STALL_DATA_HAZARD  # operands not written back yet, retry next cycle
+                    break
+                sim.PC = branchTarget(inst, sim.PC, sim.registers)
+                sim.instructionsRetired += 1
+                fetched += 1
+                break
+            elif (kind == KIND_BREAK):
+                self.stopped = True
+                self.breakFound = True
+                fetched += 1
+                break
+            elif (kind == KIND_NONE):
+                sim.PC += 4
+                if (self.pendingBranch is not None):
+                    self.speculativeNops += 1
+                else:
+                    sim.instructionsRetired += 1
+            else:
+                buffer[buffer.index(-1)] = index
+                self.scoreboard.queue(inst)
+                sim.PC += 4
+            fetched += 1
+        return STAGE_BUSY if (fetched or resolved) else status
+
 #========================================
 # ALU Class
 #========================================
 class LogicUnit:
 
-    preALUBuff = [-1, -1]
-    postALUBuff = [-1, -1]      # value, register
-
-    def __init__(self, instructions, opcode, args1, args2, args3):
-        self.instructions = instructions
-        self.opcode = opcode
-        self.args1 = args1
-        self.args2 = args2
-        self.args3 = args3
+    def __init__(self, sim, MEM):
+        self.decoded = sim.decoded
+        self.registers = sim.registers
+        self.units = sim.config.aluUnits
+        self.preMEMBuff = MEM.preMEMBuff
+        self.preALUBuff = [-1] * sim.config.preALUSize
+        self.postALUBuff = [-1] * self.units     # (index, register, value)
 
     def advanceBuffer(self):
-        self.preALUBuff[0] = self.preALUBuff[1]
-        self.preALUBuff[1] = -1
+        del self.preALUBuff[0]
+        self.preALUBuff.append(-1)
 
+    #############
+    # Executes the oldest Pre-ALU entries, one per unit, in order;
+    # LW/SW only compute their address here and move on to the
+    # Pre-MEM Queue
     def run(self):
-        index = self.preALUBuff[0]
-        if (self.preALUBuff[0] != -1):
-            if (self.opcode[index] == 0 and (int(self.instructions[index], 2)& 63) == 32):   # ADD
-                self.postALUBuff = [self.args1[index] + self.args2[index], self.args3[index]]
-                self.advanceBuffer()
-            elif (self.opcode[index] == 8):                                                  # ADDI
-                self.postALUBuff = [self.args1[index] + self.args3[index], self.args2[index]]
-                self.advanceBuffer()
+        registers = self.registers
+        done = 0
+        status = STAGE_EMPTY
+        while (done < self.units):
+            index = self.preALUBuff[0]
+            if (index == -1):
+                break
+            inst = self.decoded[index]
+
+            if (inst.kind == KIND_MEM):
+                if (self.preMEMBuff[-1] != -1):
+                    status = STALL_STRUCTURAL   # Pre-MEM Queue full
+                    break
+                address = registers[inst.rs] + inst.imm
+                result = (index, address, registers[inst.rt])
+                self.preMEMBuff[self.preMEMBuff.index(-1)] = result
+            else:
+                if (self.postALUBuff[-1] != -1):
+                    status = STALL_STRUCTURAL
+                    break
+                result = (index, inst.dest, aluResult(inst, registers))
+                self.postALUBuff[self.postALUBuff.index(-1)] = result
+            self.advanceBuffer()
+            done += 1
+        return STAGE_BUSY if done else status
 
 #========================================
 # Memory Class
 #========================================
 class MemoryUnit:
+
+    def __init__(self, sim, _cache):
+        self.sim = sim
+        self.cache = _cache
+        self.decoded = sim.decoded
+        self.units = sim.config.memUnits
+        self.preMEMBuff = [-1] * sim.config.preMEMSize     # (index, address, value to store)
+        self.postMEMBuff = [-1] * self.units                # (index, register, value)
+
+    def advanceBuffer(self):
+        del self.preMEMBuff[0]
+        self.preMEMBuff.append(-1)
+
+    #############
+    # Performs the oldest Pre-MEM accesses through the cache, one per
+    # unit and in order, waiting in place until the cache reports a hit
     def run(self):
-        return
+        done = 0
+        status = STAGE_EMPTY
+        while (done < self.units):
+            entry = self.preMEMBuff[0]
+            if (entry == -1):
+                break
+            index, address, value = entry
+            inst = self.decoded[index]
+            memIndex = (address - TEXT_BASE) // 4
+
+            if (inst.op == OP_LW):
+                if (self.postMEMBuff[-1] != -1):
+                    status = STALL_STRUCTURAL
+                    break
+                isHit, word = self.cache.accessMem(memIndex, index, False, 0, True)
+                if (not isHit):
+                    status = STALL_DCACHE_MISS
+                    break
+                self.postMEMBuff[self.postMEMBuff.index(-1)] = (index, inst.dest, signed(word))
+            else:
+                isHit, word = self.cache.accessMem(memIndex, index, True, value & MASK32, True)
+                if (not isHit):
+                    status = STALL_DCACHE_MISS
+                    break
+                self.sim.instructionsRetired += 1
+            self.advanceBuffer()
+            done += 1
+        return STAGE_BUSY if done else status
 
 #========================================
 # WriteBack Class
 #========================================
 class WriteBack:
-    def run(self, postALUBuff):
-        registers[postALUBuff[1]] = postALUBuff[0]
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.registers = sim.registers
+        self.scoreboard = sim.scoreboard
+
+    #############
+    # Writes back every Post-ALU and Post-MEM entry
+    def run(self, postALUBuff, postMEMBuff):
+        status = STAGE_EMPTY
+        for buffer in (postALUBuff, postMEMBuff):
+            for i in range(len(buffer)):
+                entry = buffer[i]
+                if (entry != -1):
+                    if (entry[1] != -1):
+                        self.registers[entry[1]] = entry[2]
+                        self.scoreboard.retire(entry[1])
+                    buffer[i] = -1
+                    self.sim.instructionsRetired += 1
+                    status = STAGE_BUSY
+        return status
 
 #========================================
 # Issue Class
 #========================================
 class Issue:
 
-    def adjustBuffer(self):
-        for i in range(len(Fetch.preIssueBuffer) - 1):
-            Fetch.preIssueBuffer[i] = Fetch.preIssueBuffer[i + 1]
-            Fetch.preIssueBuffer[i + 1] = -1
+    def __init__(self, sim, fetch, ALU):
+        self.sim = sim
+        self.decoded = sim.decoded
+        self.scoreboard = sim.scoreboard
+        self.width = sim.config.issueWidth
+        self.outOfOrder = sim.config.outOfOrderIssue
+        self.fetch = fetch
+        self.preIssueBuffer = fetch.preIssueBuffer
+        self.preALUBuff = ALU.preALUBuff
 
+    #############
+    # Issues up to `width` Pre-Issue entries, oldest first. An entry
+    # waits while
+    #
+    #   - an issued instruction, or an older one still waiting, writes
+    #     a register it reads or writes (RAW, WAW)
+    #   - an older instruction still waiting reads a register it
+    #     writes (WAR)
+    #   - it is a LW/SW and an older LW/SW is still waiting, which
+    #     keeps memory accesses in program order
+    #
+    # In order, the first entry that has to wait stops issue for the
+    # cycle; out of order, younger entries may go ahead of it. Entries
+    # fetched past a predicted branch wait until it is resolved
     def run(self):
-        if (Fetch.preIssueBuffer[0] != -1):
-            if (LogicUnit.preALUBuff[0] == -1):
-                LogicUnit.preALUBuff[0] = Fetch.preIssueBuffer[0]
-                self.adjustBuffer()
-            elif (LogicUnit.preALUBuff[1] == -1):
-                LogicUnit.preALUBuff[1] = Fetch.preIssueBuffer[0]
-                self.adjustBuffer()
+        buffer = self.preIssueBuffer
+        if (buffer[0] == -1):
+            return STAGE_EMPTY
+        fetch = self.fetch
+        limit = len(buffer)
+        if (fetch.pendingBranch is not None):
+            limit = fetch.olderCount
+            if (limit == 0):
+                return STALL_BRANCH
+        preALUBuff = self.preALUBuff
+        scoreboard = self.scoreboard
+        issued = 0
+        status = STAGE_EMPTY
+        olderReads = 0          # registers read by older entries still waiting
+        olderWrites = 0         # registers written by them
+        olderMemory = False     # one of them is a LW/SW
+        position = 0
+        while (issued < self.width and position < limit and buffer[position] != -1):
+            if (preALUBuff[-1] != -1):
+                if (not issued):
+                    status = STALL_PRE_ALU_FULL
+                break
+            index = buffer[position]
+            inst = self.decoded[index]
+            if (((inst.readMask | inst.writeMask) & (scoreboard.writes | olderWrites)) or
+                    (inst.writeMask & olderReads) or (olderMemory and inst.kind == KIND_MEM)):
+                if (status == STAGE_EMPTY):
+                    status = STALL_DATA_HAZARD
+                if (not self.outOfOrder):
+                    break
+                olderReads |= inst.readMask
+                olderWrites |= inst.writeMask
+                olderMemory = olderMemory or inst.kind == KIND_MEM
+                position += 1
+                continue
+            preALUBuff[preALUBuff.index(-1)] = index
+            del buffer[position]
+            buffer.append(-1)
+            scoreboard.issue(inst)
+            issued += 1
+            if (fetch.pendingBranch is not None):
+                fetch.olderCount -= 1
+                limit -= 1
+        return STAGE_BUSY if issued else status
+
+#============================================================
+# Returns (sets, ways, block words) of the cache a Config
+# describes, after checking its geometry and policies
+#============================================================
+def cacheGeometry(config):
+    ways = config.cacheWays
+    blockWords = config.cacheBlockWords
+    numSets = config.cacheSets
+    if (config.cacheSize is not None):
+        numSets = config.cacheSize // (4 * blockWords * ways)
+    if (numSets < 1 or numSets & (numSets - 1) or blockWords & (blockWords - 1)):
+        raise ValueError("cache sets and block words must be powers of two")
+    if (config.cacheReplacement not in ("lru", "fifo", "random")):
+        raise ValueError("unknown replacement policy '" + str(config.cacheReplacement) + "'")
+    if (config.cacheWritePolicy not in ("writeback", "writethrough")):
+        raise ValueError("unknown write policy '" + str(config.cacheWritePolicy) + "'")
+    if (config.prefetcher not in ("none", "nextline", "stride")):
+        raise ValueError("unknown prefetcher '" + str(config.prefetcher) + "'")
+    return numSets, ways, blockWords
 
 #========================================
 # Cache Class
 #========================================
 class Cache:
 
-    # valid, dirty, tag, data, data
-    cacheSets = [[[0,0,0,0,0], [0,0,0,0,0]],
-                 [[0,0,0,0,0], [0,0,0,0,0]],
-                 [[0,0,0,0,0], [0,0,0,0,0]],
-                 [[0,0,0,0,0], [0,0,0,0,0]]]
-
-    lruBit = [0,0,0,0]
-
-    justMissedList = []
-
-    def accessMem(self, memIndex, instructionIndex, isWriteToMem, dataToWrite):
-        address = 96 + (memIndex * 4)
-
-        if (address % 8 == 0):
-            dataWord = 0
-            address1 = address
-            address2 = address + 4
-        if (address % 8 != 0):
-            dataWord = 1
-            address1 = address - 4
-            address2 = address
-
-        data1 = mainMemory[(address1 - 96) / 4]
-        data2 = mainMemory[(address2 - 96) / 4]
-
-        if (memIndex != -1 and isWriteToMem == True):
-            if (dataWord == 0):
-                data1 = dataToWrite
-            elif (dataWord == 1):
-                data2 = dataToWrite
-
-        set = address & 24
-        set = set >> 3
-        tag = address >> 5
-
-        cacheTag = self.cacheSets[set][self.lruBit[set]][2]     # 3rd element contains the tag
-        tempAddress = (dataWord << 2) + (cacheTag << 5) + (set << 3)
-
-        if (address == tempAddress):    # Cache Hit
-            if (not isWriteToMem):
-                self.lruBit[set] = 1
-                return True, self.cacheSets[set][self.lruBit[set]][3 + dataWord]    # Offset for requested word
-        else:                           # Cache Miss
-            for k in range(len(self.justMissedList)):
-                if (address == self.justMissedList[k]):      # Second Miss
-                    lru = 5
-                    overwriteIndex = 0
-                    for i in range(len(self.lruBit)):
-                        if (self.lruBit[i] < lru):
-                            lru = self.lruBit[i]
-                            overwriteIndex = i
-                    if (self.cacheSets[set][self.lruBit[set]][1] == 1):
-                        wbAddr = self.cacheSets[set][self.lruBit[set]][2]   # tag
-                        wbAddr = (wbAddr << 5) + (set << 3)                 # Revert to address
-
-                        # Store last season's data in memory
-                        if (wbAddr >= (Simulator.numInstructions * 4) + 96):
-                            mainMemory[(wbAddr - 96) / 4] = self.cacheSets[set][self.lruBit[set]][3]
-                        if (wbAddr + 4 >= (Simulator.numInstructions * 4) + 96):
-                            mainMemory[(wbAddr - 92) / 4] = self.cacheSets[set][self.lruBit[set]][4]
-
-                    # Put the fresh, juicy data into cache
-                    self.cacheSets[set][self.lruBit[set]][0] = 1        # Valid: we are writing a block
-                    self.cacheSets[set][self.lruBit[set]][1] = 0        # reset the dirty bit
-                    if (isWriteToMem):
-                        self.cacheSets[set][self.lruBit[set]][1] = 1    # dirty if data mem is dirty again, INSTRUCTIONS ARE NEVER DIRTY
-                    self.cacheSets[set][self.lruBit[set]][2] = tag      # update the tag
-                    self.cacheSets[set][self.lruBit[set]][3] = data1    # update the first word
-                    self.cacheSets[set][self.lruBit[set]][4] = data2    # update the second word
-                    self.lruBit[set] = (self.lruBit[set] + 1) % 2       # set LRU to show block is recently used
-
-                    # Finally
-                    return True, self.cacheSets[set][(self.lruBit[set] + 1) % 2][dataWord + 3]  # dataWord was the actual word that
-                                                                                                # generated the hit
-            self.justMissedList.append(address)               # First miss
-            return False, 0
-                    
-                
-
-        return False, 0
+    def __init__(self, memory, dataStart, config=None):
+        if (config is None):
+            config = Config()
+        numSets, self.ways, self.blockWords = cacheGeometry(config)
+
+        self.numSets = numSets
+        self.offsetBits = (4 * self.blockWords).bit_length() - 1
+        self.tagShift = self.offsetBits + numSets.bit_length() - 1
+        self.setMask = numSets - 1
+        self.wordMask = self.blockWords - 1
+
+        # valid, dirty, tag, then one slot per data word
+        self.cacheSets = [[[0, 0, 0] + [0] * self.blockWords for way in range(self.ways)]
+                          for set in range(numSets)]
+        self.tagMaps = [{} for set in range(numSets)]   # tag -> way of every valid block
+        self.order = [list(range(self.ways)) for set in range(numSets)]     # next victim first
+        self.start(memory, dataStart, config)
+
+    #############
+    # Empties the cache for a new run over `memory`, under a config of
+    # the same geometry. Lines that were never filled are left alone,
+    # so this costs far less than building a large cache again
+    def reset(self, memory, dataStart, config):
+        if (cacheGeometry(config) != (self.numSets, self.ways, self.blockWords)):
+            raise ValueError("a cache can only be reset to the same geometry")
+        for set in range(self.numSets):
+            if (self.tagMaps[set]):
+                for line in self.cacheSets[set]:
+                    line[:] = [0] * len(line)
+                self.tagMaps[set].clear()
+                self.order[set] = list(range(self.ways))
+        self.start(memory, dataStart, config)
+
+    #############
+    # Sets up everything but the lines for a run over `memory`
+    def start(self, memory, dataStart, config):
+        self.memory = memory            # main memory words, shared with the Simulator
+        self.dataStart = dataStart      # index of the first data word; text is never written
+        self.touchOnHit = (config.cacheReplacement == "lru")
+        self.randomVictim = (config.cacheReplacement == "random")
+        self.writeThrough = (config.cacheWritePolicy == "writethrough")
+        self.rng = random.Random(config.cacheSeed)
+        self.missLatency = config.cacheMissLatency
+        self.cycle = 0              # current cycle, kept up to date by the Simulator
+        self.recorder = None        # addresstrace.AddressTraceWriter told about every hit and fill, when attached
+        self.writeWatchers = []     # sets given the block of every write to main memory (see digest.py)
+
+        self.pending = {}           # block -> first cycle an access to it fills it
+
+        # Optional components beside the cache (see Config)
+        self.prefetcher = config.prefetcher
+        self.prefetchDegree = config.prefetchDegree
+        self.prefetchBufferEntries = config.prefetchBufferEntries
+        self.prefetchTableEntries = config.prefetchTableEntries
+        self.victimEntries = config.victimCacheEntries
+        self.writeBufferEntries = config.writeBufferEntries
+        self.writebackLatency = config.writebackLatency
+        self.extended = (self.prefetcher != "none" or self.victimEntries > 0 or
+                         self.writebackLatency > 0)
+        self.prefetched = {}        # block -> cycle it arrives, of prefetches not used yet, oldest first
+        self.strideTable = {}       # LW/SW index -> [last block it missed on, stride], oldest first
+        self.victims = {}           # block -> evicted line, least recently evicted first
+        self.writeBuffer = []       # cycle each buffered dirty block is done draining, in order
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0         # blocks (or write-through words) written to main memory
+        self.prefetches = 0         # blocks prefetched
+        self.prefetchHits = 0       # misses served by a prefetch that had arrived
+        self.prefetchLate = 0       # misses on a prefetch still on its way
+        self.prefetchUnused = 0     # prefetches pushed out of the buffer without being used
+        self.victimHits = 0         # misses served by the victim cache
+        self.victimCastouts = 0     # lines pushed out of the victim cache
+        self.bufferedWritebacks = 0     # dirty blocks queued in the write buffer
+        self.writebackStalls = 0    # fills held back while a dirty block went to memory
+
+    #############
+    # Reads (or writes) the word at memIndex through the cache
+    #
+    # Returns (True, word) on a hit. The first access to a missing block
+    # returns (False, 0) and marks the block pending; the block is filled
+    # by the first access made missLatency - 1 or more cycles later (with
+    # the default latency of 1, simply the next access). dataAccess tells
+    # an attached recorder and the prefetcher a LW/SW from an instruction
+    # fetch; instructionIndex is the LW/SW the stride prefetcher trains on
+    def accessMem(self, memIndex, instructionIndex, isWriteToMem, dataToWrite, dataAccess=False):
+        if (memIndex < 0 or memIndex >= len(self.memory)):
+            raise IndexError("address " + str(TEXT_BASE + memIndex * 4) +
+                             " is outside the program image")
+        address = TEXT_BASE + (memIndex * 4)
+
+        set = (address >> self.offsetBits) & self.setMask
+        tag = address >> self.tagShift
+        slot = 3 + ((address >> 2) & self.wordMask)     # data slot of the requested word
+
+        way = self.tagMaps[set].get(tag)
+        if (way is not None):       # Cache Hit
+            return self.hit(set, way, memIndex, slot, isWriteToMem, dataToWrite, dataAccess)
+
+        # Cache Miss
+        block = address >> self.offsetBits
+        ready = self.pending.get(block)
+        if (ready is None):
+            if (self.extended):
+                ready = self.lookAside(block, instructionIndex, dataAccess)
+            if (ready is None or self.cycle < ready):
+                # First miss (or a prefetch still on its way)
+                self.pending[block] = self.missArrival(isWriteToMem) if (ready is None) else ready
+                self.misses += 1
+                return False, 0
+        elif (self.cycle < ready):
+            return False, 0         # still on its way
+        else:
+            del self.pending[block]
+
+        # Second access: replace a block
+        line, way = self.chooseVictim(set)
+        if (self.extended and line[0] == 1):
+            ready = self.writebackDelay(set, line, block)
+            if (ready is not None):
+                self.pending[block] = ready     # wait for the dirty block to reach memory
+                return False, 0
+        if (self.recorder is not None):
+            self.recorder.record(self.cycle, address, isWriteToMem, dataAccess)
+        if (line[0] == 1):
+            saved = self.evict(set, way, line, block)
+        else:
+            saved = self.victims.pop(block, None) if (self.victimEntries) else None
+        self.fill(set, way, line, block, saved, isWriteToMem)
+        if (isWriteToMem and memIndex >= self.dataStart):     # SWs into the text are dropped
+            line[slot] = dataToWrite
+            self.writeWord(memIndex, line, dataToWrite)
+
+        # Finally
+        return True, line[slot]
+
+    #############
+    # Completes an access that hit in `way`
+    def hit(self, set, way, memIndex, slot, isWriteToMem, dataToWrite, dataAccess):
+        self.hits += 1
+        if (self.recorder is not None):
+            self.recorder.record(self.cycle, TEXT_BASE + (memIndex * 4), isWriteToMem, dataAccess)
+        line = self.cacheSets[set][way]
+        if (self.touchOnHit):
+            order = self.order[set]
+            if (order[-1] != way):
+                order.remove(way)
+                order.append(way)
+        if (isWriteToMem and memIndex >= self.dataStart):
+            line[slot] = dataToWrite
+            self.writeWord(memIndex, line, dataToWrite)
+        return True, line[slot]
+
+    #############
+    # Cycle from which a block that missed just now (on a SW, if
+    # isWriteToMem) can be filled
+    def missArrival(self, isWriteToMem):
+        return self.cycle + self.missLatency - 1
+
+    #############
+    # Replaces the valid `line` in `way` to make room for `block`:
+    # writes it back or keeps it in the victim cache. Returns the line
+    # of `block` if it comes back from the victim cache, else None
+    def evict(self, set, way, line, block):
+        self.evictions += 1
+        del self.tagMaps[set][line[2]]
+        if (self.victimEntries):
+            saved = self.victims.pop(block, None)
+            self.keepVictim(set, line)
+            return saved
+        if (line[1] == 1):
+            self.writeBack(set, line)
+        return None
+
+    #############
+    # Puts `block` into the free `line` in `way`, from the victim cache
+    # line `saved` or else from memory, for a SW if isWriteToMem
+    def fill(self, set, way, line, block, saved, isWriteToMem):
+        if (saved is not None):
+            line[3:] = saved[3:]    # back from the victim cache
+            dirty = saved[1]
+        else:
+            first = ((block << self.offsetBits) - TEXT_BASE) >> 2
+            for i in range(self.blockWords):
+                index = first + i
+                if (index >= 0 and index < len(self.memory)):
+                    line[3 + i] = self.memory[index]
+                else:
+                    line[3 + i] = 0
+            dirty = 0
+
+        # Put the fresh, juicy data into cache
+        tag = block >> (self.tagShift - self.offsetBits)
+        line[0] = 1         # Valid: we are writing a block
+        line[1] = dirty     # reset the dirty bit (unless a dirty victim comes back)
+        line[2] = tag       # update the tag
+        self.tagMaps[set][tag] = way
+        order = self.order[set]
+        order.remove(way)
+        order.append(way)
+
+    #############
+    # Returns the (line, way) a new block goes into
+    def chooseVictim(self, set):
+        lines = self.cacheSets[set]
+        if (len(self.tagMaps[set]) < self.ways):
+            for way in range(self.ways):
+                if (lines[way][0] == 0):
+                    return lines[way], way
+        if (self.randomVictim):
+            way = self.rng.randrange(self.ways)
+        else:
+            way = self.order[set][0]
+        return lines[way], way
+
+    #############
+    # Looks for a missing block beside the cache before it is fetched
+    # from memory: returns the cycle it is there from (now, if it is in
+    # the victim cache) or None when it has to be fetched. Every miss
+    # also drives the prefetcher
+    def lookAside(self, block, instructionIndex, dataAccess):
+        if (block in self.victims):
+            self.victimHits += 1
+            self.hits += 1
+            return self.cycle
+        ready = self.prefetched.pop(block, None)
+        if (ready is not None):
+            if (ready <= self.cycle):
+                self.prefetchHits += 1
+                self.hits += 1
+            else:
+                self.prefetchLate += 1
+        if (self.prefetcher != "none"):
+            self.prefetch(block, instructionIndex, dataAccess)
+        return ready
+
+    #############
+    # Prefetches the blocks after a missing one: the next ones in line,
+    # or for a LW/SW under "stride", the next ones along the stride it
+    # has missed with twice in a row
+    def prefetch(self, block, instructionIndex, dataAccess):
+        stride = 1
+        if (self.prefetcher == "stride" and dataAccess):
+            table = self.strideTable
+            entry = table.get(instructionIndex)
+            if (entry is None):
+                if (len(table) >= self.prefetchTableEntries):
+                    del table[next(iter(table))]
+                table[instructionIndex] = [block, 0]
+                return
+            stride = block - entry[0]
+            confirmed = (stride != 0 and stride == entry[1])
+            entry[0] = block
+            entry[1] = stride
+            if (not confirmed):
+                return
+        for i in range(1, self.prefetchDegree + 1):
+            self.prefetchBlock(block + i * stride)
+
+    #############
+    # Starts fetching a block into the prefetch buffer, unless it is
+    # outside memory or already cached, on its way or in the buffer
+    def prefetchBlock(self, block):
+        first = ((block << self.offsetBits) - TEXT_BASE) >> 2
+        if (first < 0 or first >= len(self.memory)):
+            return
+        if (block in self.pending or block in self.prefetched or block in self.victims or
+                (block >> (self.tagShift - self.offsetBits)) in self.tagMaps[block & self.setMask]):
+            return
+        if (len(self.prefetched) >= self.prefetchBufferEntries):
+            del self.prefetched[next(iter(self.prefetched))]
+            self.prefetchUnused += 1
+        self.prefetched[block] = self.cycle + self.missLatency - 1
+        self.prefetches += 1
+
+    #############
+    # Called before `block` replaces the valid `line`. Returns None when
+    # the fill can go ahead, or the cycle it has to wait for when a dirty
+    # block on its way to memory finds no room in the write buffer
+    def writebackDelay(self, set, line, block):
+        if (self.writebackLatency == 0):
+            return None
+        if (self.victimEntries):
+            # the line goes into the victim cache, which may push its
+            # oldest line out to memory
+            if (len(self.victims) < self.victimEntries or block in self.victims):
+                return None
+            oldest = next(iter(self.victims))
+            line = self.victims[oldest]
+            set = oldest & self.setMask
+        if (line[1] == 0):
+            return None
+        buffer = self.writeBuffer
+        while (buffer and buffer[0] <= self.cycle):
+            del buffer[0]
+        if (len(buffer) < self.writeBufferEntries):
+            # main memory is written at once: a fill of the block would
+            # be forwarded the same words from the buffer
+            buffer.append(max(self.cycle, buffer[-1] if buffer else 0) + self.writebackLatency)
+            self.bufferedWritebacks += 1
+            return None
+        self.writebackStalls += 1
+        if (self.writeBufferEntries):
+            return buffer[0]
+        self.writeBack(set, line)
+        return self.cycle + self.writebackLatency
+
+    #############
+    # Moves an evicted line into the victim cache, pushing the oldest
+    # one out (and back to memory, if dirty) when it is full
+    def keepVictim(self, set, line):
+        if (len(self.victims) >= self.victimEntries):
+            oldest = next(iter(self.victims))
+            old = self.victims.pop(oldest)
+            self.victimCastouts += 1
+            if (old[1] == 1):
+                self.writeBack(oldest & self.setMask, old)
+        self.victims[(line[2] << (self.tagShift - self.offsetBits)) | set] = line[:]
+
+    #############
+    # Earliest cycle after `cycle` at which a pending block arrives,
+    # or None if nothing is on its way
+    def nextArrival(self, cycle):
+        arrival = None
+        for ready in self.pending.values():
+            if (ready > cycle and (arrival is None or ready < arrival)):
+                arrival = ready
+        return arrival
 
+    #############
+    # Way printed as "LRU": the next victim under LRU/FIFO
+    def lruWay(self, set):
+        return self.order[set][0]
+
+    #############
+    # Records a write to a cached word: marks the block dirty, or
+    # sends the word straight to memory when writing through
+    def writeWord(self, memIndex, line, value):
+        if (self.writeThrough):
+            self.memory[memIndex] = value
+            self.writebacks += 1
+            for watcher in self.writeWatchers:
+                watcher.add((TEXT_BASE + (memIndex * 4)) >> self.offsetBits)
+        else:
+            line[1] = 1     # dirty if data mem is dirty again, INSTRUCTIONS ARE NEVER DIRTY
+
+    #############
+    # Stores a dirty block back into main memory
+    def writeBack(self, set, line):
+        wbAddr = (line[2] << self.tagShift) + (set << self.offsetBits)  # Revert to address
+        first = (wbAddr - TEXT_BASE) >> 2
+
+        # Store last season's data in memory
+        for i in range(self.blockWords):
+            index = first + i
+            if (index >= self.dataStart and index < len(self.memory)):
+                self.memory[index] = line[3 + i]
+        line[1] = 0
+        self.writebacks += 1
+        for watcher in self.writeWatchers:
+            watcher.add(wbAddr >> self.offsetBits)
+
+    #############
+    # Counts the changes to main memory: it changes only when a
+    # block (or write-through word) is written back
+    def memoryVersion(self):
+        return self.writebacks
+
+    #############
+    # Writes every dirty block back so main memory is up to date
     def flush(self):
-        return
+        for set in range(self.numSets):
+            for line in self.cacheSets[set]:
+                if (line[0] == 1 and line[1] == 1):
+                    self.writeBack(set, line)
+        for block in self.victims:
+            line = self.victims[block]
+            if (line[1] == 1):
+                self.writeBack(block & self.setMask, line)
+
+    #############
+    # Returns the hit/miss counters as a dictionary
+    # (and those of the components that are enabled)
+    def stats(self):
+        accesses = self.hits + self.misses
+        stats = {"hits": self.hits,
+                 "misses": self.misses,
+                 "evictions": self.evictions,
+                 "writebacks": self.writebacks,
+                 "hitRate": (float(self.hits) / accesses) if accesses else 0.0}
+        if (self.prefetcher != "none"):
+            stats["prefetches"] = self.prefetches
+            stats["prefetchHits"] = self.prefetchHits
+            stats["prefetchLate"] = self.prefetchLate
+            stats["prefetchUnused"] = self.prefetchUnused
+        if (self.victimEntries):
+            stats["victimHits"] = self.victimHits
+            stats["victimCastouts"] = self.victimCastouts
+        if (self.writebackLatency):
+            stats["bufferedWritebacks"] = self.bufferedWritebacks
+            stats["writebackStalls"] = self.writebackStalls
+        return stats
         
+#============================================================
+# Returns a fresh main memory holding the program image: a copy
+# of the image itself, or a sparse PagedMemory when
+# config.memorySize asks for a larger address space
+#============================================================
+def initialMemory(program, config):
+    if (config.memorySize is None or config.memorySize // 4 <= len(program.words)):
+        return program.words[:]
+    import pagedmemory
+    return pagedmemory.PagedMemory.fromWords(program.words, config.memorySize // 4)
+
+#============================================================
+# Decodes the instruction at a word index of the program image
+#
+# Code always comes from the image as it was loaded: SWs into
+# the text section are dropped, and words past it that Fetch
+# runs into are decoded as loaded even if data was stored there
+# since. Every model follows this rule, so none of them needs
+# to notice code changing under it
+#============================================================
+def imageInstruction(program, index):
+    words = program.words
+    return Instruction(words[index] if (index < len(words)) else 0)
+
 #========================================
 # Simulator Class
 #========================================
 class Simulator:
 
-    instructions = []
-    opcodes = []
-    memory = []
-    valids = []
-    addresses = []
-    numInstructions = []
-    args1 = []
-    args2 = []
-    args3 = []
-
-    numInstructions = 0
-    cycle = 1
-    PC = 96
-
     #****************************************************
     # Constructor for the Simulator Class
+    #
+    # program is a disassembled Disassembler; nothing in it
+    # is modified, so one program can back many Simulators.
+    # memory, when given, is used as main memory in place of
+    # a fresh copy of the program image; cache, when given,
+    # is used in place of a private Cache over it. hooks is a
+    # hooks.HookRegistry whose listeners are bound into the
+    # stages of this Simulator
     #****************************************************
-    def __init__(self, insts, opcodes, mem, valids, addrs, args1, args2, args3, numInstrs):
-        self.instructions = insts
-        self.opcodes = opcodes
-        self.memory = mem
-        self.valids = valids
-        self.addresses = addrs
-        self.numInstructions = numInstrs
-        self.args1 = args1
-        self.args2 = args2
-        self.args3 = args3
-        self.ALU = LogicUnit(insts, opcodes, args1, args2, args3)
-
+    def __init__(self, program, config=None, memory=None, hooks=None, cache=None):
+        self.cache = None
+        self.load(program, config, memory, cache)
+        self.hooks = None
+        if (hooks is not None):
+            hooks.install(self)
 
-    
+    #****************************************************
+    # Puts the Simulator back where a new one would start,
+    # with another program or Config when given, so a
+    # long-lived process can run job after job on one
+    # Simulator. Its Cache is emptied and kept when the
+    # geometry stays the same. Tracers and counters are
+    # dropped; a Simulator with hooks, or running on memory
+    # or a cache it was given, can not be reset
+    #****************************************************
+    def reset(self, program=None, config=None):
+        if (self.hooks is not None or self.shared):
+            raise ValueError("only a Simulator with its own memory and cache and no hooks can be reset")
+        self.load(self.program if (program is None) else program,
+                  self.config if (config is None) else config, None, None)
 
+    #****************************************************
+    # Sets up the state of a run of program from cycle 1
+    #****************************************************
+    def load(self, program, config, memory, cache):
+        if (config is None):
+            config = Config()
+        self.config = config
+        self.program = program
+        self.shared = memory is not None or cache is not None     # runs on memory or a cache given to it
+
+        if (memory is None):
+            memory = initialMemory(program, config)
+        self.decoded = list(program.decoded)      # grows if Fetch leaves the text section
+        self.numInstructions = program.numInstrs
+        self.dataStart = len(program.decoded)     # index of the first data word
+        self.memory = memory                      # main memory, private to this run (array of words or PagedMemory)
+        self.dataEnd = min(len(memory), len(program.words))    # the trace shows data up to the end of the image
+        self.registers = [0] * 32
+
+        self.cycle = 1
+        self.PC = TEXT_BASE
+        self.halted = False
+        self.instructionsRetired = 0
+        self.tracer = None
+        self.counters = None        # PerformanceCounters fed by step(), when attached
+        self.idleStatuses = None    # stage statuses of the last cycle in which nothing moved
+        self.skippedCycles = 0      # idle cycles jumped over instead of simulated
+        self.dataText = None
+        self.dataTextVersion = -1
+
+        for name in ("fetchWidth", "issueWidth", "preIssueSize", "preALUSize", "preMEMSize",
+                     "aluUnits", "memUnits"):
+            if (getattr(config, name) < 1):
+                raise ValueError(name + " must be at least 1")
+        self.scoreboard = Scoreboard()
+
+        if (cache is None):
+            cache = self.cache
+            if (type(cache) is Cache and
+                    cacheGeometry(config) == (cache.numSets, cache.ways, cache.blockWords)):
+                cache.reset(self.memory, self.dataStart, config)
+            else:
+                cache = Cache(self.memory, self.dataStart, config)
+        self.cache = cache
+        self.fetch = Fetch(self, self.cache)
+        self.MEM = MemoryUnit(self, self.cache)
+        self.ALU = LogicUnit(self, self.MEM)
+        self.issue = Issue(self, self.fetch, self.ALU)
+        self.WB = WriteBack(self)
 
-    issue = Issue()
-    
-    MEM = MemoryUnit()
-    WB = WriteBack()
-    cache = Cache()
-    fetch = Fetch(cache)
-    dis = Disassembler(instructions)
+    #****************************************************
+    # Builds a Simulator straight from a list of 32-bit words
+    #****************************************************
+    @classmethod
+    def fromWords(cls, words, config=None):
+        if (config is not None and config.decodeCache is not None):
+            import decodecache
+            return cls(decodecache.disassemble(words, config.decodeCache), config)
+        return cls(Disassembler(words).disassemble(), config)
 
-    
+    #****************************************************
+    # Builds a Simulator from lines of '0'/'1' text
+    #****************************************************
+    @classmethod
+    def fromLines(cls, lines, config=None):
+        return cls(Disassembler.fromLines(lines).disassemble(), config)
 
     #****************************************************
-    # Prints all information about the state of the
-    # entire machine at the moment the function is called
+    # Returns the decoded instruction at a word index,
+    # decoding words of the image past the text section
+    # on first use
     #****************************************************
-    def printState(self):
-        pipelineFile.write("--------------------\n")
-        pipelineFile.write("Cycle:" + str(self.cycle) + '\n')
-
-        pipelineFile.write("\nPre-Issue Buffer:\n")
-        pipelineFile.write("\tEntry 0:\t")
-        if (Fetch.preIssueBuffer[0] != -1):
-            pipelineFile.write(self.dis.toString(self.instructions[Fetch.preIssueBuffer[0]]))
-        pipelineFile.write('\n')
-        pipelineFile.write("\tEntry 1:\t")
-        if (Fetch.preIssueBuffer[1] != -1):
-            pipelineFile.write(self.dis.toString(self.instructions[Fetch.preIssueBuffer[1]]))
-        pipelineFile.write('\n')
-        pipelineFile.write("\tEntry 2:\t")
-        if (Fetch.preIssueBuffer[2] != -1):
-            pipelineFile.write(self.dis.toString(self.instructions[Fetch.preIssueBuffer[2]]))
-        pipelineFile.write('\n')
-        pipelineFile.write("\tEntry 3:\t")
-        if (Fetch.preIssueBuffer[3] != -1):
-            pipelineFile.write(self.dis.toString(self.instructions[Fetch.preIssueBuffer[3]]))
-        pipelineFile.write('\n')
-
-        pipelineFile.write("Pre_ALU Queue:\n")
-        pipelineFile.write("\tEntry 0:\t")
-        if (LogicUnit.preALUBuff[0] != -1):
-            pipelineFile.write(self.dis.toString(self.instructions[LogicUnit.preALUBuff[0]]))
-        pipelineFile.write('\n')
-        pipelineFile.write("\tEntry 1:\t")
-        if (LogicUnit.preALUBuff[1] != -1):
-            pipelineFile.write(self.dis.toString(self.instructions[LogicUnit.preALUBuff[1]]))
-        pipelineFile.write('\n')
-
-        pipelineFile.write("Post_ALU Queue:\n")
-        pipelineFile.write("\tEntry 0:\t")
-        # Entry 0 contents go here
-        pipelineFile.write('\n')
-
-        pipelineFile.write("Pre_MEM Queue:\n")
-        pipelineFile.write("\tEntry 0:\t")
-        # Entry 0 contents go here
-        pipelineFile.write('\n')
-        pipelineFile.write("\tEntry 1:\t")
-        # Entry 1 contents go here
-        pipelineFile.write('\n')
-
-        pipelineFile.write("Post_MEM Queue:\n")
-        pipelineFile.write("\tEntry 0:\t")
-        # Entry 0 contents go here
-        pipelineFile.write("\n\n")
-
-        ##### Register output #####
-        pipelineFile.write("Registers\n")
-        pipelineFile.write("R00:\t")
-        for i in range(8):
-            pipelineFile.write(str(registers[i]) + "\t")
-        pipelineFile.write("\n")
-
-        pipelineFile.write("R08:\t")
-        for i in range(8, 16):
-            pipelineFile.write(str(registers[i]) + "\t")
-        pipelineFile.write("\n")
-
-        pipelineFile.write("R16:\t")
-        for i in range(16, 24):
-            pipelineFile.write(str(registers[i]) + "\t")
-        pipelineFile.write("\n")
-
-        pipelineFile.write("R24:\t")
-        for i in range(24, 32):
-            pipelineFile.write(str(registers[i]) + "\t")
-        pipelineFile.write("\n\n")
-
-        ##### Cache Output #####
-        pipelineFile.write("Cache\n")
-        pipelineFile.write("Set 0: LRU=")
-        pipelineFile.write(str(Cache.lruBit[0]))
-        pipelineFile.write("\n\tEntry 0:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[0][0][0]) + "," +
-                           str(Cache.cacheSets[0][0][1]) + "," +
-                           str(Cache.cacheSets[0][0][2]) + ")<" +
-                           str(Cache.cacheSets[0][0][3]) + "," +
-                           str(Cache.cacheSets[0][0][4]) + ">]")
-        pipelineFile.write("\n\tEntry 1:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[0][1][0]) + "," +
-                           str(Cache.cacheSets[0][1][1]) + "," +
-                           str(Cache.cacheSets[0][1][2]) + ")<" +
-                           str(Cache.cacheSets[0][1][3]) + "," +
-                           str(Cache.cacheSets[0][1][4]) + ">]")
-        pipelineFile.write("\nSet 1: LRU=")
-        pipelineFile.write(str(Cache.lruBit[1]))
-        pipelineFile.write("\n\tEntry 0:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[1][0][0]) + "," +
-                           str(Cache.cacheSets[1][0][1]) + "," +
-                           str(Cache.cacheSets[1][0][2]) + ")<" +
-                           str(Cache.cacheSets[1][0][3]) + "," +
-                           str(Cache.cacheSets[1][0][4]) + ">]")
-        pipelineFile.write("\n\tEntry 1:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[1][1][0]) + "," +
-                           str(Cache.cacheSets[1][1][1]) + "," +
-                           str(Cache.cacheSets[1][1][2]) + ")<" +
-                           str(Cache.cacheSets[1][1][3]) + "," +
-                           str(Cache.cacheSets[1][1][4]) + ">]")
-        pipelineFile.write("\nSet 2: LRU=")
-        pipelineFile.write(str(Cache.lruBit[2]))
-        pipelineFile.write("\n\tEntry 0:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[2][0][0]) + "," +
-                           str(Cache.cacheSets[2][0][1]) + "," +
-                           str(Cache.cacheSets[2][0][2]) + ")<" +
-                           str(Cache.cacheSets[2][0][3]) + "," +
-                           str(Cache.cacheSets[2][0][4]) + ">]")
-        pipelineFile.write("\n\tEntry 1:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[2][1][0]) + "," +
-                           str(Cache.cacheSets[2][1][1]) + "," +
-                           str(Cache.cacheSets[2][1][2]) + ")<" +
-                           str(Cache.cacheSets[2][1][3]) + "," +
-                           str(Cache.cacheSets[2][1][4]) + ">]")
-        pipelineFile.write("\nSet 3: LRU=")
-        pipelineFile.write(str(Cache.lruBit[3]))
-        pipelineFile.write("\n\tEntry 0:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[3][0][0]) + "," +
-                           str(Cache.cacheSets[3][0][1]) + "," +
-                           str(Cache.cacheSets[3][0][2]) + ")<" +
-                           str(Cache.cacheSets[3][0][3]) + "," +
-                           str(Cache.cacheSets[3][0][4]) + ">]")
-        pipelineFile.write("\n\tEntry 1:")
-        pipelineFile.write("[(" + str(Cache.cacheSets[3][1][0]) + "," +
-                           str(Cache.cacheSets[3][1][1]) + "," +
-                           str(Cache.cacheSets[3][1][2]) + ")<" +
-                           str(Cache.cacheSets[3][1][3]) + "," +
-                           str(Cache.cacheSets[3][1][4]) + ">]")
-        pipelineFile.write("\n\n")
-
-        ##### Data Output #####
-        pipelineFile.write("Data")
-        for i in range(len(self.memory)):
-            if (i % 8 == 0):
-                pipelineFile.write('\n')
-                pipelineFile.write(str(self.addresses[len(self.addresses) - 1]) + ":\t")
-            pipelineFile.write(str(self.memory[i]) + '\t')
-        pipelineFile.write('\n')
+    def instructionAt(self, index):
+        while (len(self.decoded) <= index):
+            self.decoded.append(imageInstruction(self.program, len(self.decoded)))
+        return self.decoded[index]
 
-    def run(self):
-        go = True
-        self.PC = 96
-        while go:
-            self.WB.run(LogicUnit.postALUBuff)
-            self.ALU.run()
-            self.MEM.run()
-            self.issue.run()
-            go = self.fetch.run()
-            self.printState()
-            self.cycle += 1
-    
+    #****************************************************
+    # True when no instruction is left in any buffer
+    #****************************************************
+    def isDrained(self):
+        return (self.fetch.preIssueBuffer[0] == -1 and
+                self.ALU.preALUBuff[0] == -1 and
+                self.MEM.preMEMBuff[0] == -1 and
+                self.ALU.postALUBuff[0] == -1 and
+                self.MEM.postMEMBuff[0] == -1)
 
-#========================================
-# Function Definitions
-#========================================
+    #****************************************************
+    # Cached words print as 32-bit binary strings; a block
+    # that was never filled prints its words as 0
+    #****************************************************
+    def cacheWord(self, entry, slot):
+        if (entry[0] == 0):
+            return str(entry[slot])
+        return format(entry[slot], "032b")
 
+    #****************************************************
+    # Returns the text of one buffer entry: an instruction
+    # index, an (index, ...) tuple, or -1 when empty
+    #****************************************************
+    def entryText(self, entry):
+        if (entry == -1):
+            return ""
+        if (isinstance(entry, tuple)):
+            entry = entry[0]
+        return self.decoded[entry].text
 
-#========================================
-# Main Code
-#========================================
+    #****************************************************
+    # Formats one named buffer, one line per entry
+    #****************************************************
+    def formatBuffer(self, name, buff):
+        parts = [name, ":\n"]
+        for i in range(len(buff)):
+            parts.append("\tEntry " + str(i) + ":\t" + self.entryText(buff[i]) + "\n")
+        return "".join(parts)
 
+    #****************************************************
+    # The sections of a state dump, in order: pipeline
+    # buffers, registers, cache and data memory
+    #****************************************************
+    def stateSections(self):
+        return [self.formatBuffers(), self.formatRegisters(),
+                self.formatCache(), self.formatData()]
+
+    def formatBuffers(self):
+        return ("\n" +
+                self.formatBuffer("Pre-Issue Buffer", self.fetch.preIssueBuffer) +
+                self.formatBuffer("Pre_ALU Queue", self.ALU.preALUBuff) +
+                self.formatBuffer("Post_ALU Queue", self.ALU.postALUBuff) +
+                self.formatBuffer("Pre_MEM Queue", self.MEM.preMEMBuff) +
+                self.formatBuffer("Post_MEM Queue", self.MEM.postMEMBuff) + "\n")
+
+    def formatRegisters(self):
+        parts = ["Registers\n"]
+        for row in range(0, 32, 8):
+            parts.append("R" + str(row).zfill(2) + ":\t")
+            for value in self.registers[row:row + 8]:
+                parts.append(str(value) + "\t")
+            parts.append("\n")
+        parts.append("\n")
+        return "".join(parts)
+
+    def formatCache(self):
+        parts = ["Cache"]
+        for set in range(len(self.cache.cacheSets)):
+            parts.append("\nSet " + str(set) + ": LRU=" + str(self.cache.lruWay(set)))
+            for way in range(len(self.cache.cacheSets[set])):
+                line = self.cache.cacheSets[set][way]
+                words = [self.cacheWord(line, slot) for slot in range(3, len(line))]
+                parts.append("\n\tEntry " + str(way) + ":[(" + str(line[0]) + "," +
+                             str(line[1]) + "," + str(line[2]) + ")<" +
+                             ",".join(words) + ">]")
+        parts.append("\n\n")
+        return "".join(parts)
 
-mainMemory = inFile.readlines()
+    #****************************************************
+    # Data memory only changes on cache write-backs, so
+    # its text is rebuilt only after one has happened
+    # (in any cache sharing the memory)
+    #****************************************************
+    def formatData(self):
+        version = self.cache.memoryVersion()
+        if (self.dataTextVersion != version):
+            parts = ["Data"]
+            for i in range(self.dataEnd - self.dataStart):
+                if (i % 8 == 0):
+                    parts.append("\n" + str(TEXT_BASE + (self.dataStart + i) * 4) + ":\t")
+                parts.append(str(signed(self.memory[self.dataStart + i])) + "\t")
+            parts.append("\n")
+            self.dataText = "".join(parts)
+            self.dataTextVersion = version
+        return self.dataText
 
-# Trim new line characters off of strings
-for i in range(len(mainMemory)):
-    mainMemory[i] = mainMemory[i][:32]
+    #****************************************************
+    # Returns all information about the state of the
+    # entire machine at the moment the function is called
+    #****************************************************
+    def formatState(self):
+        return ("--------------------\nCycle:" + str(self.cycle) + "\n" +
+                "".join(self.stateSections()))
 
-dis = Disassembler(mainMemory)
-dis.disassemble()
-dis.output(disFile)
+    #****************************************************
+    # Prints the state of the machine to out
+    #****************************************************
+    def printState(self, out):
+        out.write(self.formatState())
 
-sim = Simulator(dis.binaryList, dis.opcodes, dis.mem, dis.valids,
-                dis.addrs, dis.args1, dis.args2, dis.args3, dis.numInstrs)
+    #****************************************************
+    # Runs the pipeline until the BREAK is fetched or
+    # maxCycles more cycles have passed. tracer is a
+    # tracing.TraceWriter deciding which cycles are dumped;
+    # a plain file given as traceFile gets every cycle
+    #
+    # Returns the number of cycles simulated by this call
+    #****************************************************
+    def run(self, maxCycles=None, traceFile=None, tracer=None):
+        if (maxCycles is None):
+            maxCycles = self.config.maxCycles
+        self.setTracer(traceFile, tracer)
+
+        startCycle = self.cycle
+        stopCycle = None if (maxCycles is None) else (startCycle + maxCycles)
+        skipIdle = self.config.skipIdle
+        while (not self.halted):
+            if (stopCycle is not None and self.cycle >= stopCycle):
+                break
+            if (self.step() and skipIdle):
+                self.skipIdleCycles(stopCycle)
+        return self.cycle - startCycle
 
-sim.run()
+    #****************************************************
+    # Simulates a single cycle
+    #
+    # Returns True if no stage moved an instruction, i.e.
+    # the machine did nothing but wait
+    #****************************************************
+    def step(self):
+        self.cache.cycle = self.cycle
+        wbStatus = self.WB.run(self.ALU.postALUBuff, self.MEM.postMEMBuff)
+        memStatus = self.MEM.run()
+        aluStatus = self.ALU.run()
+        issueStatus = self.issue.run()
+        fetchStatus = self.fetch.run()
+        if (self.fetch.stopped and self.isDrained()):
+            self.halted = True
+        if (self.counters is not None):
+            self.counters.record(fetchStatus, issueStatus, aluStatus, memStatus, wbStatus)
+        if (self.tracer is not None):
+            self.tracer.cycle(self)
+        self.cycle += 1
+        if (fetchStatus != STAGE_BUSY and issueStatus != STAGE_BUSY and aluStatus != STAGE_BUSY and
+                memStatus != STAGE_BUSY and wbStatus != STAGE_BUSY and not self.halted):
+            self.idleStatuses = (fetchStatus, issueStatus, aluStatus, memStatus, wbStatus)
+            return True
+        return False
 
-inFile.close()
-disFile.close()
-pipelineFile.close()
+    #****************************************************
+    # Called after a cycle in which nothing moved: until
+    # the next pending cache block arrives, every cycle
+    # would repeat it exactly, so jump straight to that
+    # cycle (never past stopCycle). The tracer and the
+    # counters are told about the skipped cycles
+    #****************************************************
+    def skipIdleCycles(self, stopCycle):
+        arrival = self.cache.nextArrival(self.cycle - 1)
+        if (arrival is None):
+            return
+        if (stopCycle is not None and arrival > stopCycle):
+            arrival = stopCycle
+        if (arrival <= self.cycle):
+            return
+        first = self.cycle
+        last = arrival - 1
+        if (self.idleStatuses[0] == STALL_DATA_HAZARD or self.idleStatuses[0] == STALL_BRANCH):
+            # a branch waiting on its operands, or a branch or BREAK
+            # waiting on the pending branch, re-reads its word every cycle
+            self.cache.hits += last - first + 1
+            if (self.cache.recorder is not None):
+                for cycle in range(first, last + 1):
+                    self.cache.recorder.record(cycle, self.PC, False, False)
+        if (self.counters is not None):
+            self.counters.recordIdle(last - first + 1, self.idleStatuses)
+        if (self.tracer is not None):
+            self.tracer.idle(self, first, last)
+        self.skippedCycles += last - first + 1
+        self.cycle = arrival
+
+    def setTracer(self, traceFile, tracer):
+        if (tracer is None and traceFile is not None):
+            tracer = tracing.TraceWriter(traceFile)
+        self.tracer = tracer
 
+    #****************************************************
+    # Stops fetching, lets every instruction already in the
+    # pipeline finish and writes dirty cache blocks back, so
+    # registers, memory and PC are a precise architectural
+    # state again
+    #
+    # Returns the number of cycles it took
+    #****************************************************
+    def drain(self, traceFile=None, tracer=None):
+        self.fetch.stopped = True
+        self.setTracer(traceFile, tracer)
 
+        startCycle = self.cycle
+        skipIdle = self.config.skipIdle
+        while (not self.halted):
+            if (self.step() and skipIdle):
+                self.skipIdleCycles(None)
+        self.cache.flush()
+        return self.cycle - startCycle
 
 
+#========================================
+# Main Code
+#========================================
+def main(args):
+    if (len(args) > 1 and args[1] == "sweep"):
+        import sweep
+        return sweep.main(args[1:])
+    if (len(args) > 1 and args[1] == "replay"):
+        import addresstrace
+        return addresstrace.main(args[1:])
+    if (len(args) > 1 and args[1] == "serve"):
+        import server
+        return server.main(args[1:])
+    if (len(args) > 1 and args[1] == "show"):
+        import statetrace
+        return statetrace.main(args[1:])
+    if (len(args) > 1 and args[1] == "diff"):
+        import digest
+        return digest.main(args[1:])
+
+    inputFileName = None
+    outputFileName = None
+    maxCycles = None
+    fastForward = None
+    sampling = None
+    inputFormat = None
+    byteorder = "little"
+    traceLevel = "full"
+    compression = None
+    configOptions = {}
+    decodeCache = None
+    checkpointIn = None
+    checkpointOut = None
+    countersFileName = None
+    addressTraceName = None
+    stateTraceName = None
+    profileMode = None
+    coreCount = None
+    digestName = None
+    goldenName = None
+
+    #========================================
+    # Command Line Arguments
+    #========================================
+    for i in range(len(args)):
+        if (args[i] == '-i' and i < (len(args) - 1)):  # make sure there are at least 2 args
+            inputFileName = args[i + 1]
+        elif (args[i] == '-o' and i < (len(args) - 1)):
+            outputFileName = args[i + 1]
+        elif (args[i] == '-c' and i < (len(args) - 1)):
+            maxCycles = int(args[i + 1])
+        elif (args[i] == '-f' and i < (len(args) - 1)):
+            fastForward = int(args[i + 1])
+        elif (args[i] == '-s' and i < (len(args) - 1)):
+            sampling = [int(n) for n in args[i + 1].split(':')]
+        elif (args[i] == '-t' and i < (len(args) - 1)):
+            inputFormat = args[i + 1]
+        elif (args[i] == '-e' and i < (len(args) - 1)):
+            byteorder = args[i + 1]
+        elif (args[i] == '-l' and i < (len(args) - 1)):
+            traceLevel = args[i + 1]
+        elif (args[i] == '-z' and i < (len(args) - 1)):
+            compression = args[i + 1]
+        elif (args[i] == '-r' and i < (len(args) - 1)):
+            checkpointIn = args[i + 1]
+        elif (args[i] == '-w' and i < (len(args) - 1)):
+            checkpointOut = args[i + 1]
+        elif (args[i] == '-d' and i < (len(args) - 1)):
+            decodeCache = args[i + 1]
+        elif (args[i] == '-a' and i < (len(args) - 1)):
+            configOptions["memorySize"] = int(args[i + 1], 0)
+        elif (args[i] == '-m' and i < (len(args) - 1)):
+            configOptions["cacheMissLatency"] = int(args[i + 1])
+        elif (args[i] == '-p' and i < (len(args) - 1)):
+            countersFileName = args[i + 1]
+        elif (args[i] == '-x' and i < (len(args) - 1)):
+            addressTraceName = args[i + 1]
+        elif (args[i] == '-y' and i < (len(args) - 1)):
+            stateTraceName = args[i + 1]
+        elif (args[i] == '--profile' and i < (len(args) - 1)):
+            profileMode = args[i + 1]
+        elif (args[i] == '--digest' and i < (len(args) - 1)):
+            digestName = args[i + 1]
+        elif (args[i] == '--golden' and i < (len(args) - 1)):
+            goldenName = args[i + 1]
+        elif (args[i] == '--cores' and i < (len(args) - 1)):
+            spec = args[i + 1].split(':')
+            coreCount = int(spec[0])
+            names = ["coherenceProtocol", "busCycles"]
+            for name, value in zip(names, spec[1:]):
+                configOptions[name] = int(value) if (name == "busCycles") else value
+        elif (args[i] == '-k' and i < (len(args) - 1)):
+            spec = args[i + 1].split(':')
+            names = ["cacheSets", "cacheWays", "cacheBlockWords",
+                     "cacheReplacement", "cacheWritePolicy"]
+            for name, value in zip(names, spec):
+                configOptions[name] = int(value) if name in names[:3] else value
+        elif (args[i] == '-n' and i < (len(args) - 1)):
+            spec = args[i + 1].split(':')
+            configOptions["prefetcher"] = spec[0]
+            names = ["prefetchDegree", "prefetchBufferEntries", "prefetchTableEntries"]
+            for name, value in zip(names, spec[1:]):
+                configOptions[name] = int(value)
+        elif (args[i] == '-v' and i < (len(args) - 1)):
+            configOptions["victimCacheEntries"] = int(args[i + 1])
+        elif (args[i] == '-q' and i < (len(args) - 1)):
+            spec = args[i + 1].split(':')
+            configOptions["writebackLatency"] = int(spec[0])
+            if (len(spec) > 1):
+                configOptions["writeBufferEntries"] = int(spec[1])
+        elif (args[i] == '-u' and i < (len(args) - 1)):
+            spec = args[i + 1].split(':')
+            configOptions["fetchWidth"] = int(spec[0])
+            if (len(spec) > 1):
+                configOptions["issueWidth"] = int(spec[1])
+            if (len(spec) > 2):
+                configOptions["outOfOrderIssue"] = (spec[2] == "ooo")
+        elif (args[i] == '-g' and i < (len(args) - 1)):
+            spec = args[i + 1].split(':')
+            configOptions["branchPredictor"] = spec[0]
+            names = ["predictorEntries", "btbEntries", "predictorHistoryBits"]
+            for name, value in zip(names, spec[1:]):
+                configOptions[name] = int(value)
+        elif (args[i] == '-b' and i < (len(args) - 1)):
+            spec = args[i + 1].split(':')
+            names = ["preIssueSize", "preALUSize", "preMEMSize", "aluUnits", "memUnits"]
+            for name, value in zip(names, spec):
+                configOptions[name] = int(value)
+
+    if (inputFileName is None or outputFileName is None):
+        print("usage: team23_project2.py sweep -m <manifest.json> -o <summary file> [-j <processes>]\n"
+              "       team23_project2.py replay -i <address trace> [-o <report.csv>] [-k <sets>:<ways>:<block words>[:<policy>]]...\n"
+              "                                 [-g <sets,...>:<ways,...>:<block words,...>[:<policy,...>]]...\n"
+              "       team23_project2.py show -i <state trace> --cycle <cycle>\n"
+              "       team23_project2.py diff <expected trace or digest> <actual trace or digest>\n"
+              "       team23_project2.py serve -u <socket path> | -p <localhost port> [-j <workers>] [-c <max cycles per job>]\n"
+              "       team23_project2.py -i <input file> -o <output prefix> [-c <max cycles>]\n"
+              "                          [-f <instructions to fast-forward>]\n"
+              "                          [-s <detailed cycles>:<instructions between samples>[:<warm-up cycles>]]\n"
+              "                          [-t text|raw|elf] [-e little|big]\n"
+              "                          [-l full|off|final|changed|every:N|range:A-B] [-z gzip|zstd]\n"
+              "                          [-k <sets>:<ways>:<block words>[:lru|fifo|random[:writeback|writethrough]]] [-m <miss latency>]\n"
+              "                          [-n nextline|stride[:<degree>[:<buffer entries>[:<stride table entries>]]]]\n"
+              "                          [-v <victim cache entries>] [-q <writeback latency>[:<write buffer entries>]]\n"
+              "                          [-a <address space in bytes>] [-d <decode cache directory>]\n"
+              "                          [-u <fetch width>[:<issue width>[:inorder|ooo]]]\n"
+              "                          [-b <pre-issue>:<pre-ALU>:<pre-MEM>[:<ALU units>[:<MEM units>]]]\n"
+              "                          [-g none|nottaken|onebit|twobit|gshare[:<table entries>[:<BTB entries>[:<history bits>]]]]\n"
+              "                          [-r <checkpoint to start from>] [-w <checkpoint to save at the end>]\n"
+              "                          [-p <performance counters .json>] [-x <address trace to record>]\n"
+              "                          [-y <state trace to record>] [--profile stages|sample|cprofile]\n"
+              "                          [--digest <state digest to record>] [--golden <state digest to check against>]\n"
+              "                          [--cores <cores>[:msi|mesi[:<bus cycles>]]]")
+        return 2
+
+    import loader
+    dis = loader.loadProgram(inputFileName, inputFormat, byteorder,
+                             decodeCache)
+
+    disFile = open(outputFileName + "_dis.txt", "w")
+    loader.batchdecode.writeOutput(dis, disFile)
+    disFile.close()
+
+    config = Config(maxCycles=maxCycles, decodeCache=decodeCache, **configOptions)
+    if (coreCount is not None):
+        if (checkpointIn is not None or checkpointOut is not None or fastForward is not None or
+                sampling is not None or addressTraceName is not None or stateTraceName is not None or
+                profileMode is not None or digestName is not None or goldenName is not None):
+            print("--cores cannot be combined with -r, -w, -f, -s, -x, -y, --profile, --digest or --golden")
+            return 2
+        import multicore
+        multicore.runToFiles(dis, config, coreCount, outputFileName, traceLevel, compression,
+                             countersFileName)
+        return 0
+
+    if (sampling is not None):
+        import functional
+        result = functional.sample(dis, sampling[0], sampling[1], config,
+                                   warmupCycles=sampling[2] if (len(sampling) > 2) else None)
+        print("instructions: " + str(result.instructions))
+        print("samples: " + str(result.samples))
+        print("CPI: " + str(result.CPI()))
+        print("estimated cycles: " + str(result.estimatedCycles()))
+        return 0
+
+    if (checkpointIn is not None):
+        import checkpoint
+        sim = checkpoint.load(checkpointIn, dis, config if configOptions else None)
+        sim.config.maxCycles = maxCycles
+    elif (fastForward is not None):
+        import functional
+        sim = functional.fastForward(dis, config, instructions=fastForward)
+    else:
+        sim = Simulator(dis, config)
+
+    pipelineName = outputFileName + "_pipeline.txt"
+    if (compression == "gzip"):
+        pipelineName += ".gz"
+    elif (compression == "zstd"):
+        pipelineName += ".zst"
+    tracer = tracing.TraceWriter.fromSpec(tracing.openTrace(pipelineName, compression), traceLevel)
+    if (stateTraceName is not None):
+        import statetrace
+        tracer = statetrace.StateTraceWriter.open(stateTraceName, sim, tracer)
+    if (digestName is not None):
+        import digest
+        tracer = digest.DigestWriter.open(digestName, sim, tracer)
+    checker = None
+    divergence = ()         # catches nothing unless checking against a golden digest
+    if (goldenName is not None):
+        import digest
+        checker = tracer = digest.DigestChecker.open(goldenName, sim, tracer)
+        divergence = digest.Divergence
+    if (countersFileName is not None):
+        import counters
+        perf = counters.PerformanceCounters.attach(sim)
+    if (addressTraceName is not None):
+        import addresstrace
+        recorder = addresstrace.attach(sim, addressTraceName)
+    try:
+        if (profileMode is not None):
+            import stageprofile
+            stageprofile.profileRun(sim, outputFileName, profileMode, tracer)
+        else:
+            sim.run(tracer=tracer)
+    except divergence:
+        pass                # the run stops at the first cycle that differs
+    tracer.close(sim)
+    if (addressTraceName is not None):
+        recorder.close()
+    if (countersFileName is not None):
+        perf.write(countersFileName)
+    if (checkpointOut is not None):
+        import checkpoint
+        checkpoint.save(sim, checkpointOut)
+    if (checker is not None and checker.divergence is not None):
+        print(str(checker.divergence))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(argv))
@@ -0,0 +1,304 @@
+"""Random programs and reference runs shared by the tests.
+
+randomProgram() builds a short loop of random ALU instructions, LW/SW to
+a small data section and BEQs that skip the next instruction, so every
+seed is a different mix of hazards, misses and taken branches.
+execute() runs a program image one instruction at a time straight from
+the instruction set, without the Disassembler's records, and is the
+reference the pipeline models are checked against.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workloads
+from team23_project2 import Disassembler, Simulator, TEXT_BASE
+
+LOOP_REG = 10
+MAX_INSTRUCTIONS = 100000
+MAX_CYCLES = 400000
+MASK32 = 0xFFFFFFFF
+
+#========================================
+# Instruction Encoders
+#========================================
+VALID = 1 << 31
+
+def rType(rs, rt, rd, shamt, funct, opcode=0):
+    return VALID | (opcode << 26) | (rs << 21) | (rt << 16) | (rd << 11) | (shamt << 6) | funct
+
+def iType(opcode, rs, rt, imm):
+    return VALID | (opcode << 26) | (rs << 21) | (rt << 16) | (imm & 0xFFFF)
+
+def add(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 32)
+
+def sub(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 34)
+
+def mul(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 2, 28)
+
+def andOp(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 36)
+
+def orOp(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 37)
+
+def movz(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 10)
+
+def sll(rd, rt, shamt):
+    return rType(0, rt, rd, shamt, 0)
+
+def srl(rd, rt, shamt):
+    return rType(0, rt, rd, shamt, 2)
+
+def addi(rt, rs, imm):
+    return iType(8, rs, rt, imm)
+
+def lw(rt, offset, rs):
+    return iType(3, rs, rt, offset)
+
+def sw(rt, offset, rs):
+    return iType(11, rs, rt, offset)
+
+def beq(rs, rt, offset):
+    return iType(4, rs, rt, offset)
+
+def bltz(rs, offset):
+    return iType(1, rs, 0, offset)
+
+def jump(address):
+    return VALID | (2 << 26) | (address // 4)
+
+def jr(rs):
+    return rType(rs, 0, 0, 0, 8)
+
+BREAK = VALID | 13
+
+
+#============================================================
+# Generates a random looping program and returns its words
+#
+# The body has about `length` instructions over R1-R8, the
+# loop runs `iterations` times and LW/SW address `dataWords`
+# words through R0, so the data section must stay within the
+# 16-bit immediate. A share `textStores` of the SWs store into
+# the text section instead
+#============================================================
+def randomProgram(seed, length=40, dataWords=16, iterations=5, textStores=0.0):
+    rnd = random.Random(seed)
+    body = []
+    for i in range(length):
+        d = rnd.randrange(1, 9)
+        s = rnd.randrange(0, 9)
+        t = rnd.randrange(0, 9)
+        k = rnd.randrange(10)
+        if (k == 0):
+            body.append(add(d, s, t))
+        elif (k == 1):
+            body.append(sub(d, s, t))
+        elif (k == 2):
+            body.append(mul(d, s, t))
+        elif (k == 3):
+            body.append(addi(d, s, rnd.randrange(-50, 50)))
+        elif (k == 4):
+            body.append(sll(d, t, rnd.randrange(0, 5)))
+        elif (k == 5):
+            body.append(srl(d, t, rnd.randrange(0, 5)))
+        elif (k == 6):
+            body.append(movz(d, s, t))
+        elif (k == 7):
+            body.append(andOp(d, s, t) if (rnd.random() < 0.5) else orOp(d, s, t))
+        elif (k == 9 and textStores and rnd.random() < textStores):
+            body.append(("text", d, rnd.randrange(length)))
+        else:
+            body.append(("lw" if (k == 8) else "sw", d, rnd.randrange(dataWords)))
+        if (i < length - 1 and rnd.random() < 0.05):
+            body.append(beq(s, t, 4))      # skips the next instruction when taken
+
+    textWords = 1 + len(body) + 4
+    dataAddress = TEXT_BASE + textWords * 4
+    words = [addi(LOOP_REG, 0, iterations)]
+    for inst in body:
+        if (isinstance(inst, tuple)):
+            op, reg, slot = inst
+            if (op == "lw"):
+                inst = lw(reg, dataAddress + slot * 4, 0)
+            elif (op == "text"):
+                inst = sw(reg, TEXT_BASE + slot * 4, 0)
+            else:
+                inst = sw(reg, dataAddress + slot * 4, 0)
+        words.append(inst)
+    words += [addi(LOOP_REG, LOOP_REG, -1), beq(LOOP_REG, 0, 4), jump(TEXT_BASE + 4), BREAK]
+    words += [rnd.getrandbits(32) for i in range(dataWords)]
+    return words
+
+
+#############
+# Random programs for seeds 0..count-1, then one small
+# program of every workloads kind
+def programs(count):
+    result = [randomProgram(seed) for seed in range(count)]
+    for kind in workloads.KINDS:
+        result.append(list(workloads.generate(kind, 60, 300, 3, seed=1)))
+    return result
+
+
+#============================================================
+# Reference model of the instruction set
+#
+# Runs the words one instruction at a time from TEXT_BASE
+# until the BREAK or maxInstructions, decoding every field from
+# the word itself. Registers hold signed 32-bit values, memory
+# holds unsigned words, and every instruction but the BREAK
+# counts, NOPs and invalid words included. Code is always the
+# words as given: SWs into the text section, up to the first
+# BREAK, are dropped, and stores past it leave the instructions
+# there unchanged. The address of every
+# LW/SW is appended to `accesses` when a list is given, and `log`
+# gets what each instruction did, in program order:
+#
+#   ("fetch", PC)                       every instruction, the BREAK too
+#   ("mem", address, isWrite, value)    LW/SW, with the signed value
+#                                       loaded or stored
+#   ("write", PC, register, value)      ALU instructions and LW, with
+#                                       register -1 for writes to R0
+#
+# Returns (registers, memory, instructions, halted)
+#============================================================
+def execute(words, maxInstructions=MAX_INSTRUCTIONS, accesses=None, log=None):
+    def toSigned(value):
+        value &= MASK32
+        return value - (1 << 32) if (value & 0x80000000) else value
+
+    registers = [0] * 32
+    memory = list(words)
+    dataStart = len(words)
+    for i in range(len(words)):
+        if (words[i] >> 31 and (words[i] >> 26) & 31 == 0 and words[i] & 63 == 13):
+            dataStart = i + 1
+            break
+    PC = TEXT_BASE
+    count = 0
+    while (count < maxInstructions):
+        word = words[(PC - TEXT_BASE) // 4]
+        nextPC = PC + 4
+        opcode = (word >> 26) & 31
+        rs = (word >> 21) & 31
+        rt = (word >> 16) & 31
+        rd = (word >> 11) & 31
+        shamt = (word >> 6) & 31
+        funct = word & 63
+        imm = word & 0xFFFF
+        if (imm & 0x8000):
+            imm -= 0x10000
+        a = registers[rs]
+        b = registers[rt]
+        dest = None
+        value = 0
+        if (log is not None):
+            log.append(("fetch", PC))
+        if (not word >> 31):
+            pass
+        elif (opcode == 0 and funct == 13):
+            return registers, memory, count, True
+        elif (opcode == 28 and funct == 2):
+            dest, value = rd, a * b
+        elif (opcode == 0 or opcode == 28):
+            if (funct == 32):
+                dest, value = rd, a + b
+            elif (funct == 34):
+                dest, value = rd, a - b
+            elif (funct == 36):
+                dest, value = rd, a & b
+            elif (funct == 37):
+                dest, value = rd, a | b
+            elif (funct == 10):
+                dest, value = rd, (a if (b == 0) else registers[rd])
+            elif (funct == 0):
+                dest, value = rd, b << shamt
+            elif (funct == 2):
+                dest, value = rd, (b & MASK32) >> shamt
+            elif (funct == 8):
+                nextPC = a
+        elif (opcode == 2):
+            nextPC = (word & 0x3FFFFFF) * 4
+        elif (opcode == 4):
+            if (a == b):
+                nextPC = PC + 4 + imm
+        elif (opcode == 1):
+            if (a < 0):
+                nextPC = PC + 4 + imm
+        elif (opcode == 8):
+            dest, value = rt, a + imm
+        elif (opcode == 3 or opcode == 11):
+            address = a + imm
+            if (accesses is not None):
+                accesses.append(address)
+            if (opcode == 3):
+                dest, value = rt, toSigned(memory[(address - TEXT_BASE) // 4])
+            elif ((address - TEXT_BASE) // 4 >= dataStart):
+                memory[(address - TEXT_BASE) // 4] = b & MASK32
+            if (log is not None):
+                log.append(("mem", address, opcode == 11, value if (opcode == 3) else b))
+        if (dest is not None):
+            value = toSigned(value)
+            if (log is not None):
+                log.append(("write", PC, dest if (dest) else -1, value))
+            if (dest):
+                registers[dest] = value
+        PC = nextPC
+        count += 1
+    return registers, memory, count, False
+
+
+#############
+# Disassembles program words
+def decode(words):
+    return Disassembler(words).disassemble()
+
+
+#############
+# Returns the words of a flat or paged memory as a list
+def memoryWords(memory):
+    if (hasattr(memory, "dump")):
+        return list(memory.dump(0, len(memory)))
+    return list(memory)
+
+
+#############
+# Runs a program on the pipeline to the BREAK, with the cache
+# written back, and returns the Simulator
+def simulate(program, config=None):
+    sim = Simulator(program, config)
+    sim.run(maxCycles=MAX_CYCLES)
+    sim.cache.flush()
+    return sim
+
+
+#========================================
+# Differential Test Case Class
+#========================================
+class DifferentialCase(unittest.TestCase):
+
+    #############
+    # Runs every program on the pipeline under config and checks it
+    # ends in the state of the instruction set model, after the same
+    # instructions; returns the Simulator of the last program
+    def assertMatchesReference(self, wordLists, config):
+        sim = None
+        for i in range(len(wordLists)):
+            registers, memory, count, halted = execute(wordLists[i])
+            self.assertTrue(halted, i)
+            sim = simulate(decode(wordLists[i]), config)
+            self.assertTrue(sim.halted, i)
+            self.assertEqual(sim.registers, registers, i)
+            self.assertEqual(list(sim.memory), memory, i)
+            self.assertEqual(sim.instructionsRetired, count, i)
+        return sim
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import addresstrace
+from team23_project2 import Config, Simulator
+
+# sets, ways, block words, replacement
+GEOMETRIES = ((4, 2, 2, "lru"), (2, 1, 1, "lru"), (8, 4, 4, "lru"), (4, 2, 2, "fifo"),
+              (2, 2, 1, "random"))
+
+
+#========================================
+# Address Trace Tests
+#========================================
+class AddressTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.trc")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, program, config):
+        sim = Simulator(program, config)
+        recorder = addresstrace.attach(sim, self.path)
+        sim.run(maxCycles=20000)
+        recorder.close()
+        with open(self.path, "rb") as f:
+            return sim, f.read()
+
+    #############
+    # Replaying a trace through the cache that recorded it gives back
+    # its misses, and the trace does not depend on idle cycle skipping
+    def testReplayRecordedCache(self):
+        for seed in range(0, 60, 2):
+            program = programs.decode(programs.randomProgram(seed))
+            for latency in (1, 5):
+                for sets, ways, blockWords, replacement in GEOMETRIES:
+                    options = dict(cacheSets=sets, cacheWays=ways, cacheBlockWords=blockWords,
+                                   cacheReplacement=replacement, cacheMissLatency=latency)
+                    sim, expected = self.record(program, Config(skipIdle=False, **options))
+                    sim, trace = self.record(program, Config(**options))
+                    self.assertEqual(trace, expected, (seed, options))
+                    result = addresstrace.replay(self.path, [("recorded", sim.config)])[0]
+                    self.assertEqual(result["misses"], sim.cache.misses, (seed, options))
+
+    #############
+    # Replaying many LRU caches in one pass by stack distance gives
+    # what replaying them one at a time gives
+    def testOnePassReplay(self):
+        program = programs.decode(programs.randomProgram(7, length=80, dataWords=64))
+        self.record(program, Config())
+        configs = addresstrace.gridConfigs("1,2,4,8:1,2,4:1,2,4:lru,fifo")
+        together = addresstrace.replay(self.path, configs)
+        for i in range(len(configs)):
+            self.assertEqual(together[i], addresstrace.replay(self.path, [configs[i]])[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import io
+import random
+import unittest
+
+import programs
+import batchdecode
+import workloads
+from team23_project2 import Disassembler
+
+COLUMNS = ("instructions", "opcodes", "mem", "valids", "addrs", "args1", "args2", "args3",
+           "instStrings", "dataAddress", "numInstrs")
+
+
+#############
+# Random images: program-like words with some invalid ones, a BREAK
+# somewhere (or none at all) and data of any value after it
+def randomImage(seed):
+    rnd = random.Random(seed)
+    words = list(workloads.generate(workloads.KINDS[seed % 4], 30 + seed, 20, 2, seed=seed))
+    for i in range(rnd.randrange(0, 8)):
+        words[rnd.randrange(len(words))] = rnd.getrandbits(31)      # top bit clear: invalid
+    if (seed % 5 == 0):
+        words = [word for word in words if (word != workloads.BREAK)]
+    return words + [rnd.getrandbits(32) for i in range(rnd.randrange(0, 50))]
+
+
+#========================================
+# Batch Decoding Tests
+#========================================
+@unittest.skipUnless(batchdecode.available(), "needs numpy")
+class BatchDecodeTest(unittest.TestCase):
+
+    #############
+    # Every column and the decoded records match the word-at-a-time
+    # Disassembler, and so does the _dis.txt text
+    def testMatchesDisassembler(self):
+        for seed in range(60):
+            words = randomImage(seed)
+            expected = Disassembler(words).disassemble()
+            actual = batchdecode.disassemble(words)
+            for column in COLUMNS:
+                self.assertEqual(getattr(actual, column), getattr(expected, column), (seed, column))
+            self.assertEqual([inst.word for inst in actual.decoded],
+                             [inst.word for inst in expected.decoded], seed)
+            self.assertEqual([inst.text for inst in actual.decoded],
+                             [inst.text for inst in expected.decoded], seed)
+
+            expectedText = io.StringIO()
+            expected.output(expectedText)
+            actualText = io.StringIO()
+            batchdecode.output(actual, actualText)
+            self.assertEqual(actualText.getvalue(), expectedText.getvalue(), seed)
+
+    #############
+    # Output larger than one chunk of lines is written the same way
+    def testChunks(self):
+        words = list(workloads.generate("mem", 300, 200, 1, seed=3))
+        original = batchdecode.CHUNK_LINES
+        batchdecode.CHUNK_LINES = 64
+        try:
+            actual = io.StringIO()
+            batchdecode.output(batchdecode.disassemble(words), actual)
+        finally:
+            batchdecode.CHUNK_LINES = original
+        expected = io.StringIO()
+        Disassembler(words).disassemble().output(expected)
+        self.assertEqual(actual.getvalue(), expected.getvalue())
+
+    #############
+    # Programs decoded either way simulate the same
+    def testSimulates(self):
+        for seed in range(0, 40, 8):
+            words = programs.randomProgram(seed)
+            expected = programs.simulate(programs.decode(words))
+            actual = programs.simulate(batchdecode.disassemble(words))
+            self.assertEqual(actual.cycle, expected.cycle)
+            self.assertEqual(actual.registers, expected.registers)
+            self.assertEqual(actual.memory, expected.memory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import bench
+import workloads
+from team23_project2 import Simulator
+
+
+#========================================
+# Benchmark Tests
+#========================================
+class BenchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.baselineFile = bench.BASELINE_FILE
+
+    def tearDown(self):
+        bench.BASELINE_FILE = self.baselineFile
+        bench.SUITE.pop("tiny", None)
+        shutil.rmtree(self.directory)
+
+    #############
+    # Only the relative rate and the RSS, past its slack, can regress
+    def testRegressions(self):
+        baseline = {"relativeRate": 40.0, "peakRSSKiB": 20000}
+        result = {"relativeRate": 30.0, "cyclesPerSecond": 1, "peakRSSKiB": 20000 * 1.3 + bench.RSS_SLACK_KIB}
+        self.assertEqual(bench.regressions(result, baseline, 0.3), [])
+        self.assertEqual(bench.regressions(result, None, 0.3), [])
+        result = {"relativeRate": 27.9, "cyclesPerSecond": 10 ** 9,
+                  "peakRSSKiB": 20000 * 1.3 + bench.RSS_SLACK_KIB + 1}
+        problems = bench.regressions(result, baseline, 0.3)
+        self.assertEqual([problem.split(" ")[0] for problem in problems], ["relative", "rss"])
+
+    #############
+    # A case reports its calibrated rate beside the raw one
+    def testRunCase(self):
+        bench.SUITE["tiny"] = ("alu", 20, 16, 20, None)
+        result = bench.runCase("tiny")
+        sim = Simulator(programs.decode(workloads.generate("alu", 20, 16, 20)))
+        self.assertEqual(result["cycles"], sim.run())
+        self.assertGreater(result["relativeRate"], 0)
+        self.assertGreater(result["cyclesPerSecond"], 0)
+        self.assertIn("relative", bench.formatResult(result, {"relativeRate": 1.0}, []))
+
+    #############
+    # Every case has a calibrated baseline; raw-rate baselines are
+    # ignored and replaced when baselines are saved
+    def testBaselines(self):
+        baselines = bench.loadBaselines()
+        self.assertEqual(sorted(baselines), sorted(bench.SUITE))
+        bench.BASELINE_FILE = os.path.join(self.directory, "baselines.json")
+        with open(bench.BASELINE_FILE, "w") as f:
+            json.dump({"alu-small": {"cyclesPerSecond": 100000, "peakRSSKiB": 1},
+                       "mem-medium": {"relativeRate": 2.5, "peakRSSKiB": 2}}, f)
+        self.assertEqual(list(bench.loadBaselines()), ["mem-medium"])
+        bench.saveBaselines([{"name": "alu-small", "relativeRate": 3.5, "cyclesPerSecond": 9,
+                              "peakRSSKiB": 3}])
+        self.assertEqual(bench.loadBaselines(), {"alu-small": {"relativeRate": 3.5, "peakRSSKiB": 3},
+                                                 "mem-medium": {"relativeRate": 2.5, "peakRSSKiB": 2}})
+
+
+if __name__ == "__main__":
+    unittest.main()
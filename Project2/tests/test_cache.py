@@ -0,0 +1,122 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import checkpoint
+import tracing
+from team23_project2 import Config, Simulator
+
+# a small cache, so random programs miss, evict and write back often
+SMALL = dict(cacheSets=2, cacheWays=1, cacheBlockWords=2, cacheMissLatency=4)
+
+POLICY_CONFIGS = (
+    dict(cacheSets=1, cacheWays=4, cacheBlockWords=4),
+    dict(cacheReplacement="fifo"),
+    dict(cacheReplacement="random", cacheSeed=3),
+    dict(cacheWritePolicy="writethrough"),
+    dict(cacheSize=256, cacheWays=1, cacheBlockWords=1),
+)
+
+EXTENSION_CONFIGS = (
+    dict(SMALL, prefetcher="nextline"),
+    dict(SMALL, prefetcher="stride", prefetchDegree=2),
+    dict(SMALL, victimCacheEntries=2),
+    dict(SMALL, writebackLatency=6),
+    dict(SMALL, writebackLatency=6, writeBufferEntries=2),
+    dict(SMALL, prefetcher="stride", victimCacheEntries=2, writebackLatency=5, writeBufferEntries=1),
+    dict(SMALL, prefetcher="nextline", victimCacheEntries=1, writebackLatency=3,
+         cacheReplacement="random", cacheWays=2),
+)
+
+
+#========================================
+# Cache Tests
+#========================================
+class CacheTest(programs.DifferentialCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #############
+    # Replacement and write policies do not change the results
+    def testPolicies(self):
+        wordLists = programs.programs(60)
+        for options in POLICY_CONFIGS:
+            self.assertMatchesReference(wordLists, Config(**options))
+
+    #############
+    # A cache holding the whole image never evicts, and the hit rate
+    # is the share of accesses that hit
+    def testStats(self):
+        for words in programs.programs(20):
+            program = programs.decode(words)
+            sim = Simulator(program, Config(cacheSets=1, cacheWays=64, cacheBlockWords=4))
+            sim.run(maxCycles=programs.MAX_CYCLES)
+            stats = sim.cache.stats()
+            self.assertGreater(stats["misses"], 0)
+            self.assertEqual(stats["evictions"], 0)
+            self.assertEqual(stats["writebacks"], 0)
+            self.assertAlmostEqual(stats["hitRate"],
+                                   float(stats["hits"]) / (stats["hits"] + stats["misses"]))
+
+            sim = Simulator(program, Config(cacheSets=1, cacheWays=1, cacheBlockWords=1))
+            sim.run(maxCycles=programs.MAX_CYCLES)
+            stats = sim.cache.stats()
+            self.assertEqual(stats["evictions"], stats["misses"] - 1)
+
+
+    #############
+    # Neither do the prefetcher, victim cache and write buffer, and
+    # idle cycle skipping still jumps to the right cycle with them
+    def testExtensions(self):
+        wordLists = programs.programs(60)
+        for options in EXTENSION_CONFIGS:
+            sim = self.assertMatchesReference(wordLists, Config(**options))
+            self.assertGreater(sim.cache.stats()["misses"], 0)
+            for words in wordLists[::6]:
+                program = programs.decode(words)
+                expected = Simulator(program, Config(skipIdle=False, **options))
+                expected.run(maxCycles=programs.MAX_CYCLES)
+                sim = Simulator(program, Config(**options))
+                sim.run(maxCycles=programs.MAX_CYCLES)
+                self.assertEqual(sim.cycle, expected.cycle, options)
+                self.assertEqual(sim.cache.stats(), expected.cache.stats(), options)
+
+    #############
+    # A checkpoint holds the prefetch buffer, victim cache and write
+    # buffer: the restored run writes the rest of the original trace
+    def testCheckpoint(self):
+        path = os.path.join(self.directory, "run.ckpt")
+        wordLists = programs.programs(60)[::10]
+        for options in EXTENSION_CONFIGS:
+            for i in range(len(wordLists)):
+                program = programs.decode(wordLists[i])
+                expected = Simulator(program, Config(**options))
+                out = io.StringIO()
+                cycles = expected.run(maxCycles=programs.MAX_CYCLES,
+                                      tracer=tracing.TraceWriter(out))
+                cut = (i * 37) % (cycles - 1) + 1      # stop before the last cycle
+
+                sim = Simulator(program, Config(**options))
+                sim.run(maxCycles=cut)
+                checkpoint.save(sim, path)
+                restored = checkpoint.load(path, program)
+                rest = io.StringIO()
+                restored.run(tracer=tracing.TraceWriter(rest))
+
+                full = out.getvalue()
+                self.assertEqual(rest.getvalue(), full[full.index(tracing.HEADER + str(cut + 1) + "\n"):],
+                                 (options, i))
+                self.assertEqual(restored.registers, expected.registers, (options, i))
+                self.assertEqual(restored.cycle, expected.cycle, (options, i))
+                self.assertEqual(restored.cache.stats(), expected.cache.stats(), (options, i))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import checkpoint
+import tracing
+from team23_project2 import Config, Simulator
+
+CONFIGS = (dict(), dict(cacheSets=2, cacheWays=1, cacheReplacement="random", cacheSeed=5),
+           dict(cacheWritePolicy="writethrough", cacheBlockWords=4), dict(cacheMissLatency=7),
+           dict(memorySize=1 << 20))
+
+
+#========================================
+# Checkpoint Tests
+#========================================
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.ckpt")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #############
+    # A run saved at any cycle and restored writes the rest of the
+    # original trace and ends in the same state
+    def testResume(self):
+        for seed in range(0, 30, 3):
+            program = programs.decode(programs.randomProgram(seed))
+            for options in CONFIGS:
+                expected = Simulator(program, Config(**options))
+                out = io.StringIO()
+                cycles = expected.run(maxCycles=programs.MAX_CYCLES, tracer=tracing.TraceWriter(out))
+                expected.cache.flush()
+                full = out.getvalue()
+                for cut in (1, cycles // 3, cycles - 1):
+                    sim = Simulator(program, Config(**options))
+                    sim.run(maxCycles=cut)
+                    checkpoint.save(sim, self.path)
+                    for shared in (program, None):
+                        restored = checkpoint.load(self.path, shared)
+                        rest = io.StringIO()
+                        restored.run(tracer=tracing.TraceWriter(rest))
+                        restored.cache.flush()
+                        start = full.index(tracing.HEADER + str(cut + 1) + "\n")
+                        self.assertEqual(rest.getvalue(), full[start:], (seed, options, cut))
+                        self.assertEqual(restored.registers, expected.registers)
+                        self.assertEqual(programs.memoryWords(restored.memory),
+                                         programs.memoryWords(expected.memory))
+                        self.assertEqual(restored.instructionsRetired, expected.instructionsRetired)
+                        self.assertEqual(restored.cache.stats(), expected.cache.stats())
+
+    #############
+    # Checkpoints of another program, or files that are not
+    # checkpoints, are refused
+    def testRejects(self):
+        sim = Simulator(programs.decode(programs.randomProgram(1)))
+        sim.run(maxCycles=20)
+        checkpoint.save(sim, self.path)
+        with self.assertRaises(ValueError):
+            checkpoint.load(self.path, programs.decode(programs.randomProgram(2)))
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for name, bad in (("empty", b""), ("magic", b"NOTACKPT" + data[8:]),
+                          ("version", data[:8] + b"\x63\x00" + data[10:])):
+            path = os.path.join(self.directory, name)
+            with open(path, "wb") as f:
+                f.write(bad)
+            with self.assertRaises(ValueError):
+                checkpoint.load(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
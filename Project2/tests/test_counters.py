@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import counters
+from team23_project2 import Config, Simulator
+
+CONFIGS = (dict(), dict(cacheSets=2, cacheWays=1), dict(cacheSets=1, cacheWays=8, cacheBlockWords=8))
+
+
+#========================================
+# Performance Counter Tests
+#========================================
+class CountersTest(unittest.TestCase):
+
+    #############
+    # Every cycle and every retired instruction is accounted for,
+    # and every cache miss is charged to the PC that took it
+    def testTotals(self):
+        for seed in range(0, 60, 3):
+            program = programs.decode(programs.randomProgram(seed))
+            for options in CONFIGS:
+                sim = Simulator(program, Config(**options))
+                sim.run(maxCycles=1 + seed)
+                startRetired = sim.instructionsRetired
+                startMisses = sim.cache.misses
+                result = counters.PerformanceCounters.attach(sim).toDict()
+                self.assertEqual(result["cycles"], 0)
+                cycles = sim.run(maxCycles=programs.MAX_CYCLES)
+                result = sim.counters.toDict()
+
+                key = (seed, options)
+                self.assertEqual(result["cycles"], cycles, key)
+                self.assertEqual(result["instructions"], sim.instructionsRetired - startRetired, key)
+                self.assertAlmostEqual(result["IPC"] * cycles, result["instructions"], 6)
+                for name, stage in result["stages"].items():
+                    self.assertEqual(stage["busy"] + stage["empty"] + stage["stalled"], cycles, name)
+                    self.assertEqual(sum(stage["stalls"].values()), stage["stalled"], name)
+                for name, histogram in result["occupancy"].items():
+                    self.assertEqual(sum(histogram), cycles, name)
+                misses = result["misses"]
+                self.assertEqual(sum(misses["instruction"].values()) + sum(misses["data"].values()),
+                                 sim.cache.misses - startMisses, key)
+                self.assertEqual(result["cache"], sim.cache.stats())
+
+    #############
+    # write() saves what toDict() returns
+    def testWrite(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "counters.json")
+            sim = Simulator(programs.decode(programs.randomProgram(4)))
+            counters.PerformanceCounters.attach(sim)
+            sim.run()
+            sim.counters.write(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), json.loads(json.dumps(sim.counters.toDict())))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
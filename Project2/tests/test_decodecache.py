@@ -0,0 +1,135 @@
+import io
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+
+import programs
+import decodecache
+import workloads
+from team23_project2 import Disassembler
+
+COLUMNS = ("instructions", "opcodes", "mem", "valids", "addrs", "args1", "args2", "args3",
+           "instStrings", "dataAddress", "numInstrs")
+
+
+#========================================
+# Decode Cache Tests
+#========================================
+class DecodeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.words = workloads.generate("branch", 200, 64, 2, seed=4)
+        self.key = decodecache.imageKey(self.words)
+        self.path = decodecache.entryPath(self.directory, self.key)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #############
+    # A hit gives the Disassembler a fresh decode gives, and the same
+    # _dis.txt
+    def assertMatchesDecode(self, dis):
+        expected = Disassembler(self.words).disassemble()
+        for column in COLUMNS:
+            self.assertEqual(getattr(dis, column), getattr(expected, column), column)
+        self.assertEqual([(inst.word, inst.text, inst.op, inst.imm) for inst in dis.decoded],
+                         [(inst.word, inst.text, inst.op, inst.imm) for inst in expected.decoded])
+        actual = io.StringIO()
+        dis.cacheEntry.writeOutput(actual)
+        text = io.StringIO()
+        expected.output(text)
+        self.assertEqual(actual.getvalue(), text.getvalue())
+
+    def testHit(self):
+        stored = decodecache.disassemble(self.words, self.directory)
+        self.assertMatchesDecode(stored)
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(self.path)])
+        loaded = decodecache.load(self.directory, self.key, self.words)
+        self.assertIsNotNone(loaded)
+        self.assertMatchesDecode(loaded)
+        if (sys.byteorder == "little"):
+            for name, column, typecode in decodecache.COLUMNS:
+                self.assertIsInstance(getattr(loaded, column), memoryview, column)
+                self.assertTrue(getattr(loaded, column).readonly, column)
+        sim = programs.simulate(loaded)
+        self.assertEqual(sim.registers, programs.simulate(programs.decode(self.words)).registers)
+
+    #############
+    # Threads storing the same entry at once each write a temporary
+    # file of their own, and leave one whole entry behind
+    def testConcurrentStores(self):
+        expected = Disassembler(self.words).disassemble()
+        barrier = threading.Barrier(8)
+        errors = []
+
+        def store():
+            try:
+                for i in range(5):
+                    barrier.wait()
+                    decodecache.store(self.directory, self.key, expected)
+            except Exception as e:
+                errors.append(e)
+                barrier.abort()     # the others stop waiting for this one
+        threads = [threading.Thread(target=store) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(self.path)])
+        self.assertMatchesDecode(decodecache.load(self.directory, self.key, self.words))
+
+    #############
+    # The key changes with any word of the image and with the
+    # decoder version
+    def testKey(self):
+        self.assertEqual(decodecache.imageKey(list(self.words)), self.key)
+        for i in (0, len(self.words) // 2, len(self.words) - 1):
+            changed = self.words[:]
+            changed[i] ^= 1
+            self.assertNotEqual(decodecache.imageKey(changed), self.key, i)
+        self.assertNotEqual(decodecache.imageKey(self.words[:-1]), self.key)
+        original = decodecache.DECODER_VERSION
+        decodecache.DECODER_VERSION = original + 1
+        try:
+            self.assertNotEqual(decodecache.imageKey(self.words), self.key)
+        finally:
+            decodecache.DECODER_VERSION = original
+
+    #############
+    # Entries of another decoder version, truncated or damaged entries
+    # are misses, and the next disassemble() replaces them
+    def testBadEntries(self):
+        decodecache.disassemble(self.words, self.directory)
+        with open(self.path, "rb") as f:
+            good = f.read()
+        header = decodecache.HEADER.size
+        magic, version, key, count = decodecache.HEADER.unpack_from(good)
+        table = bytearray(good)
+        struct.pack_into("<Q", table, header + 8, len(good))      # first section past the end
+        missing = bytearray(good)
+        struct.pack_into("<8s", missing, header, b"nothing")      # first section renamed
+        bad = {"empty": b"",
+               "short": good[:header - 1],
+               "magic": b"NOTADECO" + good[8:],
+               "version": decodecache.HEADER.pack(magic, version + 1, key, count) + good[header:],
+               "key": decodecache.HEADER.pack(magic, version, bytes(32), count) + good[header:],
+               "truncated": good[:len(good) // 2],
+               "table": bytes(table),
+               "section": bytes(missing)}
+        for name, data in bad.items():
+            with open(self.path, "wb") as f:
+                f.write(data)
+            self.assertIsNone(decodecache.load(self.directory, self.key, self.words), name)
+            self.assertMatchesDecode(decodecache.disassemble(self.words, self.directory))
+            with open(self.path, "rb") as f:
+                self.assertEqual(f.read(), good, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
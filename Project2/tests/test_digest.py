@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import digest
+import tracing
+from team23_project2 import Config, Simulator
+
+MEMORY_CONFIGS = (
+    dict(),
+    dict(cacheWritePolicy="writethrough"),
+    dict(memorySize=1 << 20, cacheBlockWords=8),
+    dict(victimCacheEntries=2, writebackLatency=3, cacheSets=2, cacheWays=1),
+    dict(cacheSets=64, cacheWays=4, cacheReplacement="fifo"),
+    dict(cacheSets=32, cacheWays=1, prefetcher="stride", writebackLatency=2, writeBufferEntries=1),
+)
+
+
+#============================================================
+# Tracer that checks the incremental cache and memory digests
+# of every cycle against ones computed from scratch
+#============================================================
+class MemoryDigestCheck(object):
+
+    def __init__(self, test, sim):
+        self.test = test
+        self.state = digest.StateDigest(sim)
+
+    def cycle(self, sim):
+        fresh = digest.StateDigest(sim)
+        fresh.detach(sim)
+        self.test.assertEqual(self.state.fields(sim), fresh.fields(sim), sim.cycle)
+
+    def idle(self, sim, first, last):
+        self.cycle(sim)
+
+    def close(self, sim=None):
+        pass
+
+
+#========================================
+# Digest Tests
+#========================================
+class DigestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    #############
+    # Writes the digest and text trace of a run to name.dg and name.txt
+    def record(self, program, config, name):
+        sim = Simulator(program, config)
+        text = tracing.TraceWriter(open(self.path(name + ".txt"), "w"))
+        writer = digest.DigestWriter.open(self.path(name + ".dg"), sim, text)
+        sim.run(maxCycles=programs.MAX_CYCLES, tracer=writer)
+        writer.close(sim)
+
+    #############
+    # Rehashing only the cache sets accessed and the regions written
+    # back keeps the digests equal to hashing the whole cache and all
+    # of memory again, and detaching leaves the cache as it was
+    def testIncremental(self):
+        for seed in range(0, 60, 4):
+            program = programs.decode(programs.randomProgram(seed))
+            for options in MEMORY_CONFIGS:
+                sim = Simulator(program, Config(**options))
+                check = MemoryDigestCheck(self, sim)
+                sim.run(maxCycles=3000, tracer=check)
+                sim.cache.flush()
+                check.cycle(sim)
+                check.state.detach(sim)
+                self.assertEqual(sim.cache.writeWatchers, [], (seed, options))
+                self.assertNotIn("accessMem", vars(sim.cache), (seed, options))
+                self.assertNotIn("flush", vars(sim.cache), (seed, options))
+
+    #############
+    # Digests do not depend on idle cycle skipping, and comparing
+    # digests finds the cycle where comparing the text traces does
+    def testCompare(self):
+        for seed in range(0, 60, 4):
+            program = programs.decode(programs.randomProgram(seed))
+            other = Config(cacheMissLatency=1 + seed % 3, cacheReplacement=("lru", "fifo")[seed % 2],
+                           skipIdle=False)
+            self.record(program, Config(), "a")
+            self.record(program, Config(skipIdle=False), "b")
+            self.record(program, other, "c")
+            with open(self.path("a.dg"), "rb") as a, open(self.path("b.dg"), "rb") as b:
+                self.assertEqual(a.read(), b.read(), seed)
+            self.assertIsNone(digest.compare(self.path("a.txt"), self.path("b.txt")))
+
+            fromDigests = digest.compare(self.path("a.dg"), self.path("c.dg"))
+            fromText = digest.compare(self.path("a.txt"), self.path("c.txt"))
+            if (fromText is None):
+                self.assertIsNone(fromDigests, seed)
+            else:
+                self.assertEqual(fromDigests.cycle, fromText.cycle, seed)
+
+    #############
+    # A golden check passes a run equal to the golden one, and stops
+    # a different run at its first differing cycle; closing a checker
+    # and the writer it wraps leaves the cache unwatched
+    def testChecker(self):
+        for seed in range(0, 60, 6):
+            program = programs.decode(programs.randomProgram(seed))
+            other = Config(cacheMissLatency=3)
+            self.record(program, Config(), "golden")
+            self.record(program, other, "other")
+            expected = digest.compare(self.path("golden.dg"), self.path("other.dg"))
+
+            sim = Simulator(program, Config(skipIdle=False))
+            writer = digest.DigestWriter.open(self.path("again.dg"), sim)
+            checker = digest.DigestChecker.open(self.path("golden.dg"), sim, writer)
+            sim.run(maxCycles=programs.MAX_CYCLES, tracer=checker)
+            checker.close(sim)
+            self.assertIsNone(checker.divergence, seed)
+            self.assertIsNone(digest.compare(self.path("golden.dg"), self.path("again.dg")), seed)
+            self.assertEqual(sim.cache.writeWatchers, [], seed)
+            self.assertNotIn("accessMem", vars(sim.cache), seed)
+            self.assertNotIn("flush", vars(sim.cache), seed)
+
+            sim = Simulator(program, other)
+            checker = digest.DigestChecker.open(self.path("golden.dg"), sim)
+            with self.assertRaises(digest.Divergence):
+                sim.run(maxCycles=programs.MAX_CYCLES, tracer=checker)
+            checker.close(sim)
+            self.assertEqual(checker.divergence.cycle, expected.cycle, seed)
+            self.assertEqual(sim.cycle, expected.cycle, seed)
+
+            sim = Simulator(program)
+            checker = digest.DigestChecker.open(self.path("golden.dg"), sim)
+            sim.run(maxCycles=5, tracer=checker)
+            checker.close(sim)
+            self.assertEqual(checker.divergence.cycle, 6, seed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+
+import programs
+import functional
+import workloads
+from team23_project2 import Config
+from workloads import lw, sw, addi, jump, BREAK
+
+
+#========================================
+# Functional Executor Tests
+#========================================
+class FunctionalTest(unittest.TestCase):
+
+    #############
+    # The functional executor ends every random program in the state
+    # the instruction set gives, after the same instructions
+    def testMatchesInstructionSet(self):
+        for seed in range(120):
+            words = programs.randomProgram(seed)
+            registers, memory, count, halted = programs.execute(words)
+            executor = functional.FunctionalExecutor(programs.decode(words))
+            executor.run(maxInstructions=programs.MAX_INSTRUCTIONS)
+            self.assertTrue(executor.halted, seed)
+            self.assertEqual(executor.registers, registers, seed)
+            self.assertEqual(list(executor.memory), memory, seed)
+            self.assertEqual(executor.instructionCount, count, seed)
+
+    #############
+    # Handing over to the pipeline at any point ends in the same state
+    def testFastForward(self):
+        for seed in range(0, 200, 20):
+            words = programs.randomProgram(seed)
+            registers, memory, count, halted = programs.execute(words)
+            program = programs.decode(words)
+            for instructions in range(0, count, max(1, count // 7)):
+                sim = functional.fastForward(program, instructions=instructions)
+                sim.run()
+                sim.cache.flush()
+                self.assertEqual(sim.registers, registers, (seed, instructions))
+                self.assertEqual(list(sim.memory), memory, (seed, instructions))
+
+    #############
+    # SWs into the text are dropped, and words past it run as loaded
+    # even after a SW changed them, by every model and wherever the
+    # handoff falls
+    def testCodeStores(self):
+        # 96 LW R1,128(R0) ; 100 SW R1,108(R0) ; 104 SW R1,120(R0) ; 108 ADDI R3,R0,1
+        # 112 J 120 ; 116 BREAK ; 120 ADDI R2,R0,1 ; 124 BREAK ; 128 ADDI R2,R0,7
+        words = [lw(1, 128, 0), sw(1, 108, 0), sw(1, 120, 0), addi(3, 0, 1), jump(120), BREAK,
+                 addi(2, 0, 1), BREAK, addi(2, 0, 7)]
+        registers, memory, count, halted = programs.execute(words)
+        self.assertEqual((registers[2], registers[3]), (1, 1))
+        self.assertEqual((memory[3], memory[6]), (words[3], words[8]))
+        wordLists = [words] + [programs.randomProgram(seed, textStores=0.5) for seed in range(40)]
+
+        for words in wordLists:
+            registers, memory, count, halted = programs.execute(words)
+            program = programs.decode(words)
+            for translate in (False, True):
+                config = Config(translateBlocks=translate, translateThreshold=1)
+                executor = functional.FunctionalExecutor(program, config)
+                executor.run()
+                self.assertEqual(executor.registers, registers, (words[:4], translate))
+                self.assertEqual(list(executor.memory), memory, (words[:4], translate))
+                self.assertEqual(executor.instructionCount, count, (words[:4], translate))
+                for instructions in range(0, count, max(1, count // 7)):
+                    key = (words[:4], translate, instructions)
+                    sim = functional.fastForward(program, config, instructions=instructions)
+                    sim.run(maxCycles=programs.MAX_CYCLES)
+                    sim.cache.flush()
+                    self.assertTrue(sim.halted, key)
+                    self.assertEqual(sim.registers, registers, key)
+                    self.assertEqual(list(sim.memory), memory, key)
+
+    #############
+    # Sampling executes every instruction once, or stops at maxInstructions
+    def testSample(self):
+        for seed in range(0, 100, 10):
+            words = programs.randomProgram(seed)
+            count = programs.execute(words)[2]
+            result = functional.sample(programs.decode(words), 20, 50)
+            self.assertEqual(result.instructions, count, seed)
+
+        program = programs.decode(workloads.generate("mem", 60, 300, 100, seed=1))
+        for limit in (100, 450, 501, 777, 1500, 5000):
+            result = functional.sample(program, 200, 500, maxInstructions=limit)
+            self.assertEqual(result.instructions, limit)
+
+    #############
+    # A warm-up before every measured window removes the cold cache
+    # and empty pipeline from the sampled CPI, and neither it nor the
+    # drain after the window is counted
+    def testSampleWarmup(self):
+        config = Config(cacheMissLatency=10, cacheSets=16, cacheWays=2, cacheBlockWords=4)
+        for kind in ("alu", "branch"):
+            program = programs.decode(workloads.generate(kind, 60, 64, 100, seed=1))
+            sim = programs.simulate(program, config)
+            cpi = float(sim.cycle - 1) / sim.instructionsRetired
+
+            cold = functional.sample(program, 200, 2000, config, warmupCycles=0)
+            warm = functional.sample(program, 200, 2000, config)
+            self.assertEqual(warm.instructions, sim.instructionsRetired, kind)
+            self.assertEqual(warm.warmupCycles, 200 * warm.samples, kind)
+            self.assertEqual(warm.sampledCycles, 200 * warm.samples, kind)
+            self.assertGreater(warm.drainCycles, 0, kind)
+            self.assertLess(abs(warm.CPI() - cpi), 0.05 * cpi, kind)
+            self.assertLess(abs(warm.CPI() - cpi), abs(cold.CPI() - cpi), kind)
+
+
+if __name__ == "__main__":
+    unittest.main()
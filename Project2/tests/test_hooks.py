@@ -0,0 +1,206 @@
+import collections
+import io
+import random
+import unittest
+
+import programs
+import hooks
+import tracing
+from team23_project2 import Cache, Config, Simulator, TEXT_BASE, KIND_ALU, KIND_MEM, initialMemory
+
+CONFIGS = (dict(), dict(cacheMissLatency=4), dict(skipIdle=False, cacheSets=2, cacheWays=1),
+           dict(fetchWidth=2, issueWidth=2, outOfOrderIssue=True, aluUnits=2))
+PREDICTED = (dict(branchPredictor="twobit"), dict(branchPredictor="gshare", fetchWidth=2))
+
+
+#############
+# Turns some of the loop body into NOPs (invalid words) for odd seeds
+def withNops(words, seed):
+    if (seed % 2):
+        rnd = random.Random(seed)
+        words = list(words)
+        for i in range(1, words.index(programs.BREAK) - 3):
+            if (rnd.random() < 0.15):
+                words[i] = 0
+    return words
+
+
+#============================================================
+# Records every event of a run, in the order it was raised
+#============================================================
+class Recorder(object):
+
+    def __init__(self):
+        self.registry = hooks.HookRegistry()
+        self.events = dict((event, []) for event in hooks.EVENTS)
+        for event in hooks.EVENTS:
+            self.registry.on(event, self.listener(event))
+
+    def listener(self, event):
+        def record(sim, *args):
+            self.events[event].append(args)
+        return record
+
+
+#============================================================
+# Cache that counts its accesses on top of the plain ones
+#============================================================
+class CountingCache(Cache):
+
+    def __init__(self, memory, dataStart, config):
+        Cache.__init__(self, memory, dataStart, config)
+        self.accesses = 0
+
+    def accessMem(self, *args):
+        self.accesses += 1
+        return super().accessMem(*args)
+
+
+#========================================
+# Hook Tests
+#========================================
+class HooksTest(unittest.TestCase):
+
+    #############
+    # Runs a program with a tracer and returns (trace, Simulator)
+    def traced(self, program, config, registry):
+        sim = Simulator(program, config, hooks=registry)
+        out = io.StringIO()
+        sim.run(maxCycles=programs.MAX_CYCLES, tracer=tracing.TraceWriter(out))
+        return out.getvalue(), sim
+
+    #############
+    # Every event fires with the arguments the instruction set says,
+    # for each instruction it should. Past a predicted branch, Fetch
+    # also raises fetch for the instructions a mispredict squashes
+    def testEvents(self):
+        for seed in range(0, 60, 3):
+            words = withNops(programs.randomProgram(seed), seed)
+            log = []
+            programs.execute(words, log=log)
+            program = programs.decode(words)
+            fetched = [entry[1] for entry in log if (entry[0] == "fetch")]
+            accesses = [entry[1:] for entry in log if (entry[0] == "mem")]
+            writes = collections.Counter(((pc - TEXT_BASE) // 4, register, value)
+                                         for name, pc, register, value in
+                                         [entry for entry in log if (entry[0] == "write")])
+            for options in CONFIGS + PREDICTED:
+                key = (seed, options)
+                recorder = Recorder()
+                trace, sim = self.traced(program, Config(**options), recorder.registry)
+                events = recorder.events
+                self.assertTrue(sim.halted, key)
+
+                for index, pc in events["fetch"]:
+                    self.assertEqual(index, (pc - TEXT_BASE) // 4, key)
+                if (options in PREDICTED):
+                    rest = iter(pc for index, pc in events["fetch"])
+                    self.assertTrue(all(pc in rest for pc in fetched), key)
+                    self.assertGreaterEqual(len(events["fetch"]) - len(fetched),
+                                            sim.fetch.predictor.squashed, key)
+                else:
+                    self.assertEqual([pc for index, pc in events["fetch"]], fetched, key)
+                    issued = [index for index, pc in events["fetch"]
+                              if (sim.decoded[index].kind in (KIND_ALU, KIND_MEM))]
+                    self.assertEqual(collections.Counter(index for index, in events["issue"]),
+                                     collections.Counter(issued), key)
+
+                self.assertEqual([args[1:] for args in events["memAccess"]], accesses, key)
+                self.assertEqual(collections.Counter(events["writeback"]), writes, key)
+                loads = [args for args in events["memAccess"] if (not args[2])]
+                self.assertEqual(collections.Counter(events["writeback"]),
+                                 collections.Counter([result for index, result in events["execute"]
+                                                      if (sim.decoded[index].kind == KIND_ALU)] +
+                                                     [(index, sim.decoded[index].dest, value)
+                                                      for index, address, isWrite, value in loads]),
+                                 key)
+                self.assertEqual([result[:2] for index, result in events["execute"]
+                                  if (sim.decoded[index].kind != KIND_ALU)],
+                                 [args[:2] for args in events["memAccess"]], key)
+
+                cycle = 1
+                for first, last in events["cycleEnd"]:
+                    self.assertEqual(first, cycle, key)
+                    self.assertTrue(last >= first, key)
+                    cycle = last + 1
+                self.assertEqual(cycle, sim.cycle, key)
+
+                cache = sim.cache
+                self.assertEqual(len(events["cacheEvict"]), cache.evictions, key)
+                self.assertEqual(len(events["cacheFill"]), cache.misses - len(cache.pending), key)
+                held = {}
+                fills = iter(events["cacheFill"])
+                for set, way, address, dirty in events["cacheEvict"]:
+                    while ((set, way) not in held or held[(set, way)] is None):
+                        fill = next(fills)
+                        held[fill[:2]] = fill[2]
+                    self.assertEqual(held[(set, way)], address, key)
+                    held[(set, way)] = None
+
+    #############
+    # Hooks change nothing the Simulator does, with listeners on
+    # every event or none, and without listeners the plain stage
+    # methods run
+    def testSameRun(self):
+        for seed in range(0, 60, 4):
+            program = programs.decode(programs.randomProgram(seed))
+            for options in CONFIGS:
+                expected, plain = self.traced(program, Config(**options), None)
+                for registry in (hooks.HookRegistry(), Recorder().registry, None):
+                    trace, sim = self.traced(program, Config(**options), registry)
+                    self.assertEqual(trace, expected, (seed, options))
+                    self.assertEqual(sim.registers, plain.registers, (seed, options))
+                    self.assertEqual(sim.instructionsRetired, plain.instructionsRetired, (seed, options))
+                    bound = registry is not None and bool(registry.events())
+                    self.assertEqual("step" in vars(sim), bound)
+                    for stage in (sim.fetch, sim.issue, sim.ALU, sim.MEM, sim.WB):
+                        self.assertEqual("run" in vars(stage), bound)
+
+    #############
+    # Watchpoints see every write of their register or word, in order
+    def testWatchpoints(self):
+        for seed in range(0, 60, 5):
+            words = programs.randomProgram(seed)
+            log = []
+            programs.execute(words, log=log)
+            stores = [entry[1:] for entry in log if (entry[0] == "mem" and entry[2])]
+            counts = collections.Counter(store[0] for store in stores)
+            address = max(counts, key=counts.get, default=TEXT_BASE)
+            registerValues = [entry[3] for entry in log if (entry[0] == "write" and entry[2] == 3)]
+            memoryValues = [value for accessed, isWrite, value in stores if (accessed == address)]
+
+            seen = []
+            stored = []
+            registry = hooks.HookRegistry()
+            hooks.watchRegister(registry, 3, lambda sim, index, value: seen.append(value))
+            hooks.watchMemory(registry, address, lambda sim, index, value: stored.append(value))
+            sim = Simulator(programs.decode(words))
+            registry.install(sim)
+            sim.run(maxCycles=programs.MAX_CYCLES)
+            self.assertEqual(seen, registerValues, seed)
+            self.assertEqual(stored, memoryValues, seed)
+
+    #############
+    # A subclass that extends a stage method through super() still
+    # raises the events of the method it extends
+    def testSubclass(self):
+        for seed in range(0, 40, 4):
+            program = programs.decode(programs.randomProgram(seed))
+            config = Config(cacheSets=2, cacheWays=1)
+            memory = initialMemory(program, config)
+            cache = CountingCache(memory, len(program.decoded), config)
+            recorder = Recorder()
+            sim = Simulator(program, config, memory=memory, hooks=recorder.registry, cache=cache)
+            sim.run(maxCycles=programs.MAX_CYCLES)
+            self.assertTrue(sim.halted, seed)
+            self.assertGreater(cache.accesses, 0, seed)
+            self.assertEqual(len(recorder.events["cacheEvict"]), cache.evictions, seed)
+            self.assertEqual(len(recorder.events["cacheFill"]), cache.misses - len(cache.pending), seed)
+
+    def testRejects(self):
+        with self.assertRaises(ValueError):
+            hooks.HookRegistry().on("retire", lambda sim: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
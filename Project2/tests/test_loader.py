@@ -0,0 +1,115 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import programs
+import loader
+from team23_project2 import Disassembler, TEXT_BASE
+
+
+#############
+# Builds an ELF32 image whose PT_LOAD segments are
+# (vaddr, bytes, memsz) triples
+def elfImage(segments, byteorder="little"):
+    prefix = "<" if (byteorder == "little") else ">"
+    phoff = 52
+    offset = phoff + 32 * len(segments)
+    header = bytearray(b"\x7fELF")
+    header += bytes([1, 1 if (byteorder == "little") else 2, 1]) + bytes(9)
+    header += struct.pack(prefix + "HHIIIIIHHHHHH", 2, 8, 1, TEXT_BASE, phoff, 0, 0,
+                          52, 32, len(segments), 40, 0, 0)
+    body = bytearray()
+    for vaddr, data, memsz in segments:
+        header += struct.pack(prefix + "8I", loader.PT_LOAD, offset + len(body), vaddr, vaddr,
+                              len(data), memsz, 5, 4)
+        body += data
+    return bytes(header + body)
+
+
+#############
+# Packs words into bytes in the given byte order
+def packWords(words, byteorder):
+    prefix = "<" if (byteorder == "little") else ">"
+    return struct.pack(prefix + str(len(words)) + "I", *words)
+
+
+#========================================
+# Loader Tests
+#========================================
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.words = programs.randomProgram(3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def testText(self):
+        text = "".join(format(word, "032b") + "\t\n" for word in self.words)
+        path = self.write("prog.txt", text.encode("ascii"))
+        for kind in (None, "text"):
+            self.assertEqual(list(loader.loadWords(path, kind)), self.words)
+
+    #############
+    # Text images parse exactly as the Disassembler reads its input:
+    # CRLF endings, blank lines and text after the 32 bits
+    def testTextMatchesDisassembler(self):
+        dis = programs.decode(self.words)
+        lines = [format(self.words[i], "032b") + "\t" + dis.instStrings[i] if (i < len(dis.instStrings))
+                 else format(self.words[i], "032b") for i in range(len(self.words))]
+        text = "\r\n\r\n".join(lines) + "\r\n"
+        path = self.write("prog.txt", text.encode("ascii"))
+        expected = Disassembler.fromLines(text.splitlines()).words
+        self.assertEqual(list(expected), self.words)
+        self.assertEqual(loader.loadWords(path, "text"), expected)
+
+    def testRaw(self):
+        for byteorder in ("little", "big"):
+            path = self.write("prog.bin", packWords(self.words, byteorder))
+            self.assertEqual(list(loader.loadWords(path, "raw", byteorder)), self.words)
+        path = self.write("odd.bin", packWords(self.words, "little")[:-1])
+        with self.assertRaises(ValueError):
+            loader.loadWords(path, "raw")
+        self.assertEqual(list(loader.loadWords(self.write("empty.bin", b""))), [])
+
+    #############
+    # Segments land at their addresses, with the gap between them and
+    # the part of memsz past the file data zeroed
+    def testElf(self):
+        text = self.words[:10]
+        data = self.words[10:]
+        dataAddress = TEXT_BASE + 4 * (len(text) + 2)
+        expected = text + [0, 0] + data + [0, 0, 0]
+        for byteorder in ("little", "big"):
+            image = elfImage([(dataAddress, packWords(data, byteorder), 4 * (len(data) + 3)),
+                              (TEXT_BASE, packWords(text, byteorder), 4 * len(text))], byteorder)
+            path = self.write("prog.elf", image)
+            for kind in (None, "elf"):
+                self.assertEqual(list(loader.loadWords(path, kind)), expected, byteorder)
+
+        path = self.write("moved.elf", elfImage([(TEXT_BASE + 4, packWords(text, "little"), 40)]))
+        with self.assertRaises(ValueError):
+            loader.loadWords(path)
+
+    #############
+    # A loaded program disassembles like the words it was made from
+    def testLoadProgram(self):
+        path = self.write("prog.bin", packWords(self.words, "little"))
+        program = loader.loadProgram(path)
+        expected = programs.decode(self.words)
+        self.assertEqual(program.instStrings, expected.instStrings)
+        self.assertEqual(list(program.mem), list(expected.mem))
+        self.assertEqual(program.dataAddress, expected.dataAddress)
+
+
+if __name__ == "__main__":
+    unittest.main()
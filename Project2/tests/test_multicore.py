@@ -0,0 +1,134 @@
+import unittest
+
+import programs
+import hooks
+import multicore
+import workloads
+from team23_project2 import Config, Simulator, TEXT_BASE
+
+REPLACEMENTS = ("lru", "fifo", "random")
+
+
+#============================================================
+# Checks the coherence invariant over every cached block of a
+# System: at most one M copy and no other copy beside it, E
+# only in a single copy, and clean copies equal to memory
+#============================================================
+def checkCoherence(test, system):
+    copies = {}
+    for sim in system.cores:
+        cache = sim.cache
+        for set in range(cache.numSets):
+            for way in range(cache.ways):
+                line = cache.cacheSets[set][way]
+                if (line[0]):
+                    block = (line[2] << cache.blockTagShift) | set
+                    test.assertEqual(cache.tagMaps[set][line[2]], way)
+                    copies.setdefault(block, []).append((cache, line))
+    for block, lines in copies.items():
+        dirty = [line for cache, line in lines if line[1]]
+        test.assertTrue(len(dirty) <= 1 and (not dirty or len(lines) == 1), block)
+        if ([cache for cache, line in lines if block in cache.exclusive]):
+            test.assertEqual(len(lines), 1, block)
+        if (not dirty):
+            cache = lines[0][0]
+            first = ((block << cache.offsetBits) - TEXT_BASE) >> 2
+            for cache, line in lines:
+                for i in range(cache.blockWords):
+                    if (first + i < len(system.memory)):
+                        test.assertEqual(line[3 + i], system.memory[first + i], block)
+
+
+#========================================
+# Multicore Tests
+#========================================
+class MulticoreTest(unittest.TestCase):
+
+    #############
+    # One core on a bus that never waits is the plain Simulator
+    def testSingleCore(self):
+        for seed in range(100):
+            program = programs.decode(programs.randomProgram(seed))
+            sim = Simulator(program)
+            cycles = sim.run(maxCycles=programs.MAX_CYCLES)
+            sim.cache.flush()
+            system = multicore.System(program, 1, Config(busCycles=0))
+            self.assertEqual(system.run(maxCycles=programs.MAX_CYCLES), cycles, seed)
+            system.flush()
+            registers = system.cores[0].registers[:]
+            registers[multicore.CORE_COUNT_REGISTER] = 0
+            self.assertEqual(registers, sim.registers, seed)
+            self.assertEqual(list(system.memory), list(sim.memory), seed)
+
+    #############
+    # Every core runs the same racy program: the caches stay coherent
+    # every cycle, every core's Data dump shows the current memory,
+    # and skipping idle cycles changes nothing
+    def testCoherence(self):
+        for seed in range(40):
+            program = programs.decode(programs.randomProgram(seed, dataWords=8))
+            cores = 1 + seed % 4
+            for protocol in multicore.PROTOCOLS:
+                options = dict(coherenceProtocol=protocol, busCycles=seed % 3,
+                               cacheMissLatency=1 + seed % 4,
+                               cacheReplacement=REPLACEMENTS[seed % 3])
+                system = multicore.System(program, cores, Config(skipIdle=False, **options))
+                while (not system.halted and system.cycle < 30000):
+                    system.step()
+                    checkCoherence(self, system)
+                    for sim in system.cores:
+                        data = sim.formatData()
+                        sim.dataTextVersion = None
+                        self.assertEqual(data, sim.formatData(), (seed, protocol, system.cycle))
+                self.assertTrue(system.halted)
+
+                skipping = multicore.System(program, cores, Config(**options))
+                skipping.run()
+                self.assertEqual(skipping.cycle, system.cycle, (seed, protocol))
+                self.assertEqual([sim.registers for sim in skipping.cores],
+                                 [sim.registers for sim in system.cores], (seed, protocol))
+
+    #############
+    # Every block a core fills was read over the bus: an upgrade cut
+    # short by a snoop or an eviction leaves nothing pending
+    def testFillsFollowBusReads(self):
+        for seed in range(60):
+            program = programs.decode(programs.randomProgram(seed, dataWords=8))
+            for protocol in multicore.PROTOCOLS:
+                config = Config(coherenceProtocol=protocol, busCycles=1 + seed % 3,
+                                cacheMissLatency=2 + seed % 5, cacheSets=2, cacheWays=1)
+                system = multicore.System(program, 2 + seed % 3, config)
+                fills = []
+                registry = hooks.HookRegistry()
+                registry.on("cacheFill", lambda sim, set, way, address: fills.append(address))
+                for sim in system.cores:
+                    registry.install(sim)
+                system.run()
+                reads = (system.bus.transactions[multicore.BUS_READ] +
+                         system.bus.transactions[multicore.BUS_READ_EXCLUSIVE])
+                waiting = sum(len(sim.cache.pending) for sim in system.cores)
+                self.assertTrue(reads - waiting <= len(fills) <= reads, (seed, protocol))
+
+    #############
+    # The parallel sum kernel adds up its data on any number of cores
+    def testParallelSum(self):
+        elements = 512
+        maxCores = 4
+        words = workloads.parallelSum(elements, seed=3, maxCores=maxCores)
+        program = programs.decode(words)
+        tail = 2 * maxCores + 1         # partial sums, flags and the total
+        expected = sum(words[len(words) - tail - elements:len(words) - tail]) & 0xFFFFFFFF
+        for protocol in multicore.PROTOCOLS:
+            for options in (dict(), dict(cacheSets=16, cacheWays=2, cacheBlockWords=4,
+                                         cacheMissLatency=10, busCycles=2)):
+                for cores in (1, 2, 4):
+                    system = multicore.System(program, cores, Config(coherenceProtocol=protocol,
+                                                                     **options))
+                    system.run()
+                    system.flush()
+                    self.assertEqual(system.memory[len(system.memory) - 1], expected,
+                                     (protocol, options, cores))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import random
+import unittest
+
+import programs
+import functional
+import pagedmemory
+from team23_project2 import Config, TEXT_BASE
+from workloads import addi, sll, lw, sw, add, BREAK
+
+
+#========================================
+# Paged Memory Tests
+#========================================
+class PagedMemoryTest(unittest.TestCase):
+
+    #############
+    # diff() against any snapshot, not only the latest, lists exactly
+    # the words that differ from it
+    def testDiff(self):
+        rnd = random.Random(0)
+        size = 8 * pagedmemory.PAGE_WORDS
+        memory = pagedmemory.PagedMemory(size)
+        flat = [0] * size
+        snapshots = []
+        for step in range(40):
+            for i in range(rnd.randrange(0, 20)):
+                index = rnd.randrange(size)
+                memory[index] = flat[index] = rnd.getrandbits(32)
+            snapshots.append((memory.snapshot(), flat[:]))
+            for snapshot, words in snapshots:
+                expected = [(i, words[i], flat[i]) for i in range(size) if (words[i] != flat[i])]
+                self.assertEqual(memory.diff(snapshot), expected, (step, snapshot.number))
+
+    #############
+    # Word and byte accessors, load and dump agree with a flat list,
+    # and pages are only allocated for nonzero data
+    def testAccessors(self):
+        rnd = random.Random(1)
+        size = 6 * pagedmemory.PAGE_WORDS
+        words = [0] * pagedmemory.PAGE_WORDS + [rnd.getrandbits(32) for i in range(1500)]
+        memory = pagedmemory.PagedMemory.fromWords(words, size)
+        flat = words + [0] * (size - len(words))
+        self.assertEqual(sorted(memory.pages), [1, 2])
+        for step in range(500):
+            index = rnd.randrange(size)
+            address = TEXT_BASE + index * 4
+            if (step % 2):
+                value = rnd.getrandbits(32)
+                memory.writeWord(address, value)
+                flat[index] = value
+            else:
+                byte = rnd.randrange(4)
+                value = rnd.getrandbits(8)
+                memory.writeByte(address + byte, value)
+                shift = (3 - byte) * 8
+                flat[index] = (flat[index] & ~(0xFF << shift) & 0xFFFFFFFF) | (value << shift)
+            self.assertEqual(memory.readWord(address), flat[index])
+            self.assertEqual(memory.readByte(address + 1), (flat[index] >> 16) & 0xFF)
+        self.assertEqual(list(memory.dump(0, size)), flat)
+        self.assertEqual(list(memory.dump(1000, 100)), flat[1000:1100])
+        with self.assertRaises(ValueError):
+            memory.readWord(TEXT_BASE + 2)
+        with self.assertRaises(IndexError):
+            memory[size]
+
+    #############
+    # A program runs the same on flat and paged memory
+    def testMatchesFlatMemory(self):
+        for seed in range(0, 60, 3):
+            program = programs.decode(programs.randomProgram(seed))
+            flat = programs.simulate(program)
+            config = Config(memorySize=1 << 20)
+            paged = programs.simulate(program, config)
+            self.assertIsInstance(paged.memory, pagedmemory.PagedMemory)
+            self.assertEqual(paged.cycle, flat.cycle, seed)
+            self.assertEqual(paged.registers, flat.registers, seed)
+            self.assertEqual(list(paged.memory.dump(0, len(flat.memory))), list(flat.memory), seed)
+
+    #############
+    # Stores far past the image allocate only the pages they touch
+    def testSparseStore(self):
+        # R1 = 0x200 << 15 ; SW R2,0(R1) ; LW R3,0(R1) ; R4 = R3 + R3
+        words = [addi(1, 0, 0x200), sll(1, 1, 15), addi(2, 0, 77), sw(2, 0, 1), lw(3, 0, 1),
+                 add(4, 3, 3), BREAK, 5]
+        program = programs.decode(words)
+        config = Config(memorySize=1 << 26)
+        sim = programs.simulate(program, config)
+        executor = functional.FunctionalExecutor(program, config)
+        executor.run()
+        self.assertEqual(sim.registers[4], 154)
+        self.assertEqual(executor.registers, sim.registers)
+        self.assertEqual(sim.memory.readWord(0x200 << 15), 77)
+        self.assertEqual(len(sim.memory.pages), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import checkpoint
+import counters
+import functional
+import hooks
+import tracing
+from team23_project2 import Config, Disassembler, Simulator
+
+SAMPLES = ("t1test_bin.txt", "t5_nohaz_bin.txt")
+TRACE_LEVELS = ("full", "every", "range")
+
+WIDTH_CONFIGS = (
+    dict(fetchWidth=2, issueWidth=2),
+    dict(fetchWidth=2, issueWidth=2, outOfOrderIssue=True),
+    dict(outOfOrderIssue=True),
+    dict(fetchWidth=4, issueWidth=4, outOfOrderIssue=True, preIssueSize=8, preALUSize=4,
+         preMEMSize=4, aluUnits=2, memUnits=2),
+    dict(fetchWidth=3, issueWidth=2, outOfOrderIssue=True, preIssueSize=2, preALUSize=1,
+         preMEMSize=1, aluUnits=3, cacheMissLatency=5),
+    dict(fetchWidth=2, issueWidth=2, outOfOrderIssue=True, skipIdle=False, memUnits=2),
+)
+
+
+#============================================================
+# Runs a program with idle cycle skipping on or off and returns
+# everything skipping must not change (cycles, state, trace
+# text and counters) and the number of cycles it skipped
+#============================================================
+def runState(program, config, level, maxCycles):
+    return runSimulator(Simulator(program, config), level, maxCycles)
+
+
+def runSimulator(sim, level, maxCycles):
+    out = io.StringIO()
+    tracer = tracing.TraceWriter(out, level, interval=3, first=10, last=60)
+    performance = counters.PerformanceCounters.attach(sim)
+    cycles = sim.run(maxCycles=maxCycles, tracer=tracer)
+    return (cycles, sim.cycle, sim.halted, sim.registers[:], list(sim.memory),
+            out.getvalue(), performance.toDict()), sim.skippedCycles
+
+
+#========================================
+# Pipeline Tests
+#========================================
+class PipelineTest(programs.DifferentialCase):
+
+    #############
+    # Random programs end in the state the instruction set gives,
+    # after the same number of instructions
+    def testMatchesInstructionSet(self):
+        wordLists = [programs.randomProgram(seed) for seed in range(120)]
+        self.assertMatchesReference(wordLists, Config())
+        for latency in (2, 9):
+            self.assertMatchesReference(wordLists[::4], Config(cacheMissLatency=latency))
+
+    #############
+    # So do the sample programs shipped with the simulator
+    def testSamples(self):
+        wordLists = []
+        for name in SAMPLES:
+            path = os.path.join(os.path.dirname(programs.__file__), os.pardir, name)
+            with open(path) as f:
+                wordLists.append(Disassembler.fromLines(f.readlines()).words)
+        self.assertMatchesReference(wordLists, Config())
+
+    #############
+    # A run cut short by maxCycles carries on from where it stopped
+    def testResume(self):
+        for seed in range(0, 40, 4):
+            program = programs.decode(programs.randomProgram(seed))
+            whole = programs.simulate(program)
+            sim = Simulator(program)
+            while (not sim.halted):
+                sim.run(maxCycles=1 + seed)
+            sim.cache.flush()
+            self.assertEqual(sim.cycle, whole.cycle, seed)
+            self.assertEqual(sim.registers, whole.registers, seed)
+            self.assertEqual(sim.memory, whole.memory, seed)
+
+    #############
+    # A Simulator reset between runs, from any point of the last one
+    # and to other programs, geometries and memories, runs each like
+    # a new Simulator
+    def testReset(self):
+        configs = (Config(), Config(cacheMissLatency=4, cacheReplacement="fifo"),
+                   Config(cacheSets=16, cacheBlockWords=8), Config(cacheSets=16, cacheBlockWords=8),
+                   Config(memorySize=1 << 20, branchPredictor="twobit"),
+                   Config(victimCacheEntries=2, prefetcher="nextline", writebackLatency=2))
+        sim = Simulator(programs.decode(programs.randomProgram(0)))
+        for seed in range(30):
+            program = programs.decode(programs.randomProgram(seed))
+            config = configs[seed % len(configs)]
+            level = TRACE_LEVELS[seed % 3]
+            maxCycles = 150 if (seed % 4 == 0) else programs.MAX_CYCLES
+            fresh = Simulator(program, config)
+            expected = runSimulator(fresh, level, maxCycles)
+            sim.reset(program, config)
+            self.assertEqual(runSimulator(sim, level, maxCycles), expected, seed)
+            self.assertEqual(sim.cache.stats(), fresh.cache.stats(), seed)
+        sim.reset()
+        self.assertEqual(runSimulator(sim, "full", programs.MAX_CYCLES),
+                         runState(program, config, "full", programs.MAX_CYCLES))
+
+        shared = Simulator(program, memory=sim.memory)
+        for other in (shared, Simulator(program, hooks=hooks.HookRegistry())):
+            with self.assertRaises(ValueError):
+                other.reset()
+
+    #############
+    # Skipping the cycles spent waiting on a miss changes nothing
+    # that can be observed, whether or not the run reaches the BREAK
+    def testSkipIdle(self):
+        skipped = 0
+        for seed in range(120):
+            program = programs.decode(programs.randomProgram(seed))
+            latency = (1, 2, 5, 20)[seed % 4]
+            level = TRACE_LEVELS[seed % 3]
+            maxCycles = 137 if (seed % 5 == 0) else 20000
+            expected, none = runState(program, Config(cacheMissLatency=latency, skipIdle=False),
+                                      level, maxCycles)
+            actual, count = runState(program, Config(cacheMissLatency=latency), level, maxCycles)
+            self.assertEqual(actual, expected, (seed, latency, level))
+            self.assertEqual(none, 0)
+            skipped += count
+        self.assertGreater(skipped, 0)
+
+    #############
+    # The "changed" level sums up the skipped cycles in idle records
+    def testChangedTraceIdleRecords(self):
+        program = programs.decode(programs.randomProgram(0))
+        sim = Simulator(program, Config(cacheMissLatency=20))
+        out = io.StringIO()
+        sim.run(maxCycles=programs.MAX_CYCLES, tracer=tracing.TraceWriter(out, "changed"))
+        self.assertGreater(sim.skippedCycles, 0)
+        self.assertIn(" idle\n", out.getvalue())
+
+
+#========================================
+# Pipeline Width Tests
+#========================================
+class WidthTest(programs.DifferentialCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #############
+    # Wider and out-of-order pipelines still compute what the
+    # instruction set gives
+    def testMatchesInstructionSet(self):
+        wordLists = programs.programs(60)
+        for options in WIDTH_CONFIGS:
+            self.assertMatchesReference(wordLists, Config(**options))
+
+    #############
+    # Draining a wide pipeline stopped at any cycle leaves exactly
+    # the retired instructions' state
+    def testDrain(self):
+        for options in WIDTH_CONFIGS:
+            for seed in range(0, 60, 10):
+                program = programs.decode(programs.randomProgram(seed))
+                for cut in (5, 17, 40, 111):
+                    sim = Simulator(program, Config(**options))
+                    sim.run(maxCycles=cut)
+                    sim.drain()
+                    executor = functional.FunctionalExecutor(program)
+                    executor.run(maxInstructions=sim.instructionsRetired)
+                    self.assertEqual(sim.registers, executor.registers, (options, seed, cut))
+                    self.assertEqual(sim.PC, executor.PC, (options, seed, cut))
+
+    #############
+    # A checkpoint taken mid-run with full buffers continues exactly
+    # like the run it was taken from
+    def testCheckpoint(self):
+        path = os.path.join(self.directory, "run.ckpt")
+        for options in WIDTH_CONFIGS:
+            for seed in range(0, 60, 20):
+                program = programs.decode(programs.randomProgram(seed))
+                expected = programs.simulate(program, Config(**options))
+                sim = Simulator(program, Config(**options))
+                sim.run(maxCycles=37)
+                checkpoint.save(sim, path)
+                restored = checkpoint.load(path, program)
+                self.assertEqual(vars(restored.scoreboard), vars(sim.scoreboard), (options, seed))
+                restored.run()
+                restored.cache.flush()
+                self.assertEqual(restored.cycle, expected.cycle, (options, seed))
+                self.assertEqual(restored.registers, expected.registers, (options, seed))
+                self.assertEqual(restored.memory, expected.memory, (options, seed))
+
+
+if __name__ == "__main__":
+    unittest.main()
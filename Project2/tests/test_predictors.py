@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import checkpoint
+import counters
+import functional
+import predictors
+from team23_project2 import Config, Simulator
+
+PREDICTOR_CONFIGS = (
+    dict(branchPredictor="nottaken"),
+    dict(branchPredictor="onebit"),
+    dict(branchPredictor="twobit"),
+    dict(branchPredictor="gshare"),
+    dict(branchPredictor="gshare", btbEntries=1, predictorEntries=4, predictorHistoryBits=2,
+         fetchWidth=2, issueWidth=2, outOfOrderIssue=True, cacheMissLatency=4),
+    dict(branchPredictor="twobit", fetchWidth=3, issueWidth=2, aluUnits=2, preIssueSize=6),
+)
+
+
+#========================================
+# Branch Predictor Tests
+#========================================
+class PredictorTest(programs.DifferentialCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #############
+    # Wrong-path instructions never reach the architectural state
+    def testMatchesInstructionSet(self):
+        wordLists = programs.programs(60)
+        for options in PREDICTOR_CONFIGS:
+            sim = self.assertMatchesReference(wordLists, Config(**options))
+            self.assertGreater(sim.fetch.predictor.stats()["branches"], 0)
+
+    #############
+    # Speculation and squashes do not depend on idle cycle skipping
+    def testSkipIdle(self):
+        mispredicts = 0
+        for options in PREDICTOR_CONFIGS:
+            for seed in range(0, 60, 3):
+                program = programs.decode(programs.randomProgram(seed))
+                results = []
+                for skipIdle in (True, False):
+                    sim = Simulator(program, Config(skipIdle=skipIdle, **options))
+                    performance = counters.PerformanceCounters.attach(sim)
+                    cycles = sim.run(maxCycles=programs.MAX_CYCLES)
+                    results.append((cycles, performance.toDict(), sim.fetch.predictor.stats()))
+                self.assertEqual(results[0], results[1], (options, seed))
+                mispredicts += results[0][2]["mispredicts"]
+        self.assertGreater(mispredicts, 0)
+
+    #############
+    # Stopping with a branch in flight, then draining or restoring
+    # a checkpoint, loses nothing
+    def testStopMidRun(self):
+        path = os.path.join(self.directory, "run.ckpt")
+        for options in PREDICTOR_CONFIGS:
+            for seed in range(0, 60, 10):
+                program = programs.decode(programs.randomProgram(seed))
+                expected = Simulator(program, Config(**options))
+                expected.run(maxCycles=programs.MAX_CYCLES)
+                for cut in (5, 17, 40, 111):
+                    sim = Simulator(program, Config(**options))
+                    sim.run(maxCycles=cut)
+                    if (sim.halted):
+                        continue
+                    checkpoint.save(sim, path)
+                    restored = checkpoint.load(path, program)
+                    restored.run()
+                    self.assertEqual(restored.cycle, expected.cycle, (options, seed, cut))
+                    self.assertEqual(restored.registers, expected.registers, (options, seed, cut))
+                    self.assertEqual(restored.fetch.predictor.stats(),
+                                     expected.fetch.predictor.stats(), (options, seed, cut))
+
+                    sim.drain()
+                    executor = functional.FunctionalExecutor(program)
+                    executor.run(maxInstructions=sim.instructionsRetired)
+                    self.assertEqual(sim.registers, executor.registers, (options, seed, cut))
+                    self.assertEqual(sim.PC, executor.PC, (options, seed, cut))
+
+    #############
+    # Each direction predictor learns the patterns it is built for
+    def testDirections(self):
+        def mispredicts(name, pattern, rounds=50):
+            predictor = predictors.DIRECTION[name](16, 4)
+            wrong = 0
+            for i in range(rounds):
+                for taken in pattern:
+                    if (i >= 10 and predictor.predict(120) != taken):
+                        wrong += 1
+                    predictor.update(120, taken)
+            return wrong
+
+        loop = [True, True, True, False]
+        self.assertEqual(mispredicts("nottaken", loop), 40 * 3)
+        self.assertEqual(mispredicts("onebit", loop), 40 * 2)
+        self.assertEqual(mispredicts("twobit", loop), 40)
+        self.assertEqual(mispredicts("gshare", loop), 0)
+        self.assertEqual(mispredicts("onebit", [True, False]), 40 * 2)
+        self.assertEqual(mispredicts("gshare", [True, False]), 0)
+
+    #############
+    # The BTB holds one target per entry, tagged by the branch's PC
+    def testTargetBuffer(self):
+        btb = predictors.BranchTargetBuffer(4)
+        self.assertIsNone(btb.lookup(100))
+        btb.insert(100, 200)
+        self.assertEqual(btb.lookup(100), 200)
+        btb.insert(116, 300)        # same entry as 100
+        self.assertIsNone(btb.lookup(100))
+        self.assertEqual(btb.lookup(116), 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+import programs
+import server
+import tracing
+from team23_project2 import Config, Simulator, TEXT_BASE
+
+MAX_CYCLES = 200000
+TIMEOUT = 60
+
+
+#############
+# A run request for program words, as a raw little-endian image
+def request(words, **options):
+    job = dict(image=base64.b64encode(struct.pack("<%dI" % len(words), *words)).decode("ascii"),
+               format="raw")
+    job.update(options)
+    return job
+
+
+#========================================
+# Server Tests
+#========================================
+class ServerTest(unittest.TestCase):
+
+    #############
+    # Starts a server with its own event loop in a thread
+    def startServer(self, workers, maxCycles=MAX_CYCLES):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, "sim.sock")
+        self.server = server.SimulationServer(workers, maxCycles)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        future = asyncio.run_coroutine_threadsafe(self.server.start(self.address), self.loop)
+        self.listener = future.result(TIMEOUT)
+        self.previousTimeout = socket.getdefaulttimeout()
+        socket.setdefaulttimeout(TIMEOUT)
+
+    def tearDown(self):
+        socket.setdefaulttimeout(self.previousTimeout)
+
+        async def stop():
+            self.listener.close()
+            self.server.stop()
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result(TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(TIMEOUT)
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    #############
+    # Opens a connection and sends requests on it
+    def connect(self, *requests):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.address)
+        stream = sock.makefile("rwb")
+        for job in requests:
+            stream.write((json.dumps(job) + "\n").encode("utf-8"))
+        stream.flush()
+        return sock, stream
+
+    def close(self, sock, stream):
+        stream.close()
+        sock.close()
+
+    def read(self, stream):
+        return json.loads(stream.readline().decode("utf-8"))
+
+    #############
+    # A job through the server streams the disassembly, trace and
+    # results of running it directly
+    def testMatchesDirectRun(self):
+        self.startServer(2)
+        for seed in range(0, 40, 4):
+            words = programs.randomProgram(seed)
+            level = ("full", "changed", "off")[seed % 3]
+            options = dict(cacheMissLatency=1 + seed % 3, cacheSets=(4, 4, 16)[seed % 3])
+            messages = list(server.submit(self.address, request(words, config=options, trace=level)))
+
+            program = programs.decode(words)
+            disassembly = io.StringIO()
+            server.loader.batchdecode.writeOutput(program, disassembly)
+            sim = Simulator(program, Config(**options))
+            out = server.TraceBuffer()
+            tracer = tracing.TraceWriter.fromSpec(out, level)
+            cycles = sim.run(maxCycles=MAX_CYCLES, tracer=tracer)
+            tracer.close(sim)
+            sim.cache.flush()
+
+            kinds = [message["type"] for message in messages]
+            self.assertEqual(kinds[:2], ["started", "disassembly"], seed)
+            self.assertEqual(kinds[-1], "summary", seed)
+            self.assertEqual(messages[1]["text"], disassembly.getvalue(), seed)
+            trace = "".join(message["text"] for message in messages if (message["type"] == "trace"))
+            self.assertEqual(trace, out.take(), seed)
+            stats = messages[-1]["stats"]
+            self.assertEqual(stats["cycles"], cycles, seed)
+            self.assertEqual(stats["registers"], sim.registers, seed)
+            self.assertEqual(stats["instructions"], sim.instructionsRetired, seed)
+            self.assertTrue(stats["halted"], seed)
+
+    #############
+    # Jobs wait for a free worker, in order, and run to the server's
+    # cycle limit at most
+    def testQueueAndLimit(self):
+        self.startServer(1, maxCycles=5000)
+        loop = [programs.jump(TEXT_BASE), programs.BREAK]
+        sock, stream = self.connect(dict(request(loop, maxCycles=10 ** 9), op="run", id="a"),
+                                    dict(request(programs.randomProgram(1)), op="run", id="b"))
+        try:
+            messages = [self.read(stream) for i in range(5)]
+            self.assertEqual([(m["id"], m["type"]) for m in messages],
+                             [("a", "started"), ("b", "queued"), ("a", "disassembly"),
+                              ("a", "summary"), ("b", "started")])
+            self.assertEqual(messages[1]["position"], 1)
+            self.assertEqual(messages[3]["stats"]["cycles"], 5000)
+            self.assertFalse(messages[3]["stats"]["halted"])
+            while (True):
+                message = self.read(stream)
+                if (message["type"] == "summary"):
+                    break
+            self.assertTrue(message["stats"]["halted"])
+        finally:
+            self.close(sock, stream)
+
+    #############
+    # A cancel stops a running job, within a fraction of a second
+    # even with a full trace slowing it down, and a queued one; and
+    # closing the connection frees its worker for the next client
+    def testCancel(self):
+        self.startServer(1, maxCycles=10 ** 9)
+        loop = [programs.jump(TEXT_BASE), programs.BREAK]
+        sock, stream = self.connect(dict(request(loop, disassembly=False, trace="full"), op="run", id="a"),
+                                    dict(request(loop), op="run", id="b"))
+        try:
+            self.assertEqual(self.read(stream)["type"], "started")
+            self.assertEqual(self.read(stream)["type"], "queued")
+            self.assertEqual(self.read(stream)["type"], "trace")
+            for id in ("b", "a"):
+                start = time.perf_counter()
+                stream.write((json.dumps({"op": "cancel", "id": id}) + "\n").encode("utf-8"))
+                stream.flush()
+                message = self.read(stream)
+                while (message["type"] == "trace"):
+                    message = self.read(stream)
+                self.assertEqual(message, {"id": id, "type": "cancelled"})
+                self.assertLess(time.perf_counter() - start, 0.5, id)
+        finally:
+            self.close(sock, stream)
+
+        sock, stream = self.connect(dict(request(loop, disassembly=False), op="run", id="c"))
+        self.assertEqual(self.read(stream)["type"], "started")
+        self.close(sock, stream)
+        messages = list(server.submit(self.address, request(programs.randomProgram(2))))
+        self.assertEqual(messages[-1]["type"], "summary")
+
+    #############
+    # Bad requests get an error and leave the server working
+    def testErrors(self):
+        self.startServer(1)
+        messages = list(server.submit(self.address, request([1, 2, 3], config={"noSuchOption": 1})))
+        self.assertEqual(messages[-1]["type"], "error")
+        messages = list(server.submit(self.address, dict(op="pause", id=0)))
+        self.assertEqual(messages, [{"id": 0, "type": "error", "message": "unknown op 'pause'"}])
+        messages = list(server.submit(self.address, request(programs.randomProgram(3))))
+        self.assertEqual(messages[-1]["type"], "summary")
+
+    #############
+    # A small job on a warm server takes milliseconds, not the
+    # hundreds a process start costs
+    def testLatency(self):
+        self.startServer(1)
+        job = request(programs.randomProgram(0, iterations=1), disassembly=False)
+        list(server.submit(self.address, job))
+        start = time.perf_counter()
+        for i in range(20):
+            messages = list(server.submit(self.address, job))
+            self.assertEqual(messages[-1]["type"], "summary")
+        self.assertLess((time.perf_counter() - start) / 20, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
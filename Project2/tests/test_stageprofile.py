@@ -0,0 +1,108 @@
+import io
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+import programs
+import stageprofile
+import tracing
+from team23_project2 import Config, Simulator
+
+STAGES = ("WB", "MEM", "ALU", "Issue", "Fetch")
+
+
+#========================================
+# Stage Profiler Tests
+#========================================
+class StageProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.directory, "run")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #############
+    # A profiled run is the plain run, and only the profiled
+    # Simulator is timed
+    def testSameRun(self):
+        for seed in range(0, 40, 4):
+            program = programs.decode(programs.randomProgram(seed))
+            config = Config(cacheMissLatency=1 + seed % 4)
+            out = io.StringIO()
+            plain = Simulator(program, config)
+            plain.run(maxCycles=programs.MAX_CYCLES, tracer=tracing.TraceWriter(out))
+
+            profiled = io.StringIO()
+            sim = Simulator(program, config)
+            other = Simulator(program, config)
+            profiler = stageprofile.StageProfiler(sim)
+            profiler.run(maxCycles=programs.MAX_CYCLES, tracer=tracing.TraceWriter(profiled))
+            self.assertEqual(profiled.getvalue(), out.getvalue(), seed)
+            self.assertEqual(sim.registers, plain.registers, seed)
+            self.assertEqual(profiler.cycles, plain.cycle - 1, seed)
+            self.assertNotIn("step", vars(other))
+            self.assertNotIn("run", vars(other.fetch))
+
+    #############
+    # Every stepped cycle runs every stage once, cache accesses are
+    # charged to the stage making them, and self times add up to the
+    # whole run
+    def testCalls(self):
+        for seed in range(0, 40, 4):
+            program = programs.decode(programs.randomProgram(seed))
+            sim = Simulator(program, Config(cacheMissLatency=1 + seed % 4))
+            tracer = tracing.TraceWriter(io.StringIO(), "changed")
+            profiler = stageprofile.StageProfiler(sim, tracer)
+            profiler.run(maxCycles=programs.MAX_CYCLES, tracer=tracer)
+
+            rows = profiler.rows()
+            self.assertEqual(rows[0][0], (stageprofile.ROOT,))
+            calls = dict((path, count) for path, count, total, selfTime in rows)
+            root = (stageprofile.ROOT,)
+            steps = calls[root + ("step",)]
+            self.assertEqual(steps, profiler.cycles - sim.skippedCycles, seed)
+            for stage in STAGES:
+                self.assertEqual(calls[root + ("step", stage)], steps, seed)
+            self.assertEqual(calls[root + ("step", "Tracer")], steps, seed)
+            self.assertTrue(calls.get(root + ("skipIdle", "Tracer"), 0) <=
+                            calls.get(root + ("skipIdle",), 0), seed)
+            self.assertEqual(sorted(path[-2] for path in calls if (path[-1] == "Cache.accessMem")),
+                             ["Fetch", "MEM"], seed)
+            self.assertEqual(sum(selfTime for path, count, total, selfTime in rows), profiler.wall)
+            for path, count, total, selfTime in rows:
+                self.assertTrue(path[:-1] in calls or len(path) == 1, path)
+
+    #############
+    # Every mode writes its report and a collapsed-stack file
+    def testProfileRun(self):
+        program = programs.decode(programs.randomProgram(1, iterations=40))
+        for mode in stageprofile.MODES:
+            sim = Simulator(program)
+            profiler = stageprofile.profileRun(sim, self.prefix, mode, interval=0.0005)
+            self.assertTrue(sim.halted, mode)
+            with open(self.prefix + "_profile.txt") as f:
+                report = f.read()
+            self.assertTrue(report.startswith("Profile of " + str(profiler.cycles) + " cycles"), mode)
+            with open(self.prefix + "_profile.folded") as f:
+                lines = f.read().splitlines()
+            self.assertTrue(lines, mode)
+            for line in lines:
+                stack, weight = line.rsplit(" ", 1)
+                self.assertTrue(int(weight) >= 0, line)
+                if (mode != "sample"):
+                    self.assertTrue(stack.startswith(stageprofile.ROOT), line)
+            if (mode == "sample"):
+                self.assertTrue(any(";run (team23_project2.py:" in line for line in lines))
+            if (mode == "cprofile"):
+                self.assertIn("cProfile, by own time", report)
+                pstats.Stats(self.prefix + "_profile.prof")
+        with self.assertRaises(ValueError):
+            stageprofile.profileRun(Simulator(program), self.prefix, "trace")
+
+
+if __name__ == "__main__":
+    unittest.main()
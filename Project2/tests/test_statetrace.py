@@ -0,0 +1,64 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import statetrace
+import tracing
+from team23_project2 import Config, Simulator, TEXT_BASE
+from workloads import addi, jump, BREAK
+
+
+#========================================
+# State Trace Tests
+#========================================
+class StateTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.st")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #############
+    # Every cycle read back from a state trace formats exactly like
+    # the text trace of the same run
+    def checkProgram(self, words, config):
+        program = programs.decode(words)
+        sim = Simulator(program, config)
+        out = io.StringIO()
+        sim.run(maxCycles=programs.MAX_CYCLES, tracer=tracing.TraceWriter(out))
+        dumps = out.getvalue().split(tracing.HEADER)[1:]
+
+        sim = Simulator(program, config)
+        writer = statetrace.StateTraceWriter.open(self.path, sim)
+        sim.run(maxCycles=programs.MAX_CYCLES, tracer=writer)
+        writer.close(sim)
+        trace = statetrace.StateTrace(self.path)
+        try:
+            self.assertEqual(trace.cycleRange(), (1, len(dumps)))
+            for cycle in range(1, len(dumps) + 1):
+                self.assertEqual(trace.state(cycle).format(),
+                                 tracing.HEADER + dumps[cycle - 1], cycle)
+        finally:
+            trace.close()
+
+    def testMatchesTextTrace(self):
+        for seed in range(0, 40, 4):
+            iterations = 30 if (seed == 0) else 5      # the long run spans several chunks
+            words = programs.randomProgram(seed, iterations=iterations)
+            self.checkProgram(words, Config(cacheMissLatency=1 + seed % 5))
+
+    #############
+    # Instructions Fetch decodes past the text section are in the trace
+    def testInstructionsPastText(self):
+        # J over the BREAK that ends the text section into the words after it
+        words = [jump(TEXT_BASE + 8), BREAK, addi(1, 0, 5), addi(2, 1, 1), BREAK, 0]
+        self.checkProgram(words, Config())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import sweep
+from team23_project2 import Config, Simulator
+
+CONFIGS = [{"name": "base"},
+           {"name": "small", "cacheSets": 2, "cacheWays": 1},
+           {"name": "bad", "cacheColour": "blue"},
+           {"cacheReplacement": "fifo", "maxCycles": 50}]
+
+
+#========================================
+# Sweep Tests
+#========================================
+class SweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.words = [programs.randomProgram(seed) for seed in (1, 2)]
+        names = []
+        for i in range(len(self.words)):
+            names.append(self.writeProgram("prog" + str(i) + ".txt", self.words[i]))
+        # a load far outside the image raises in the middle of the run
+        names.append(self.writeProgram("wild.txt", [programs.lw(1, 0x7000, 0), programs.BREAK]))
+        names.append("missing.txt")
+        self.manifest = os.path.join(self.directory, "manifest.json")
+        with open(self.manifest, "w") as f:
+            json.dump({"programs": names, "configs": CONFIGS, "maxCycles": 100000}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeProgram(self, name, words):
+        with open(os.path.join(self.directory, name), "w") as f:
+            for word in words:
+                f.write(format(word, "032b") + "\n")
+        return name
+
+    #############
+    # Returns the summary rows of a sweep keyed by (program, config)
+    def runSweep(self, processes):
+        summaries = {}
+        def collect(summary):
+            key = (os.path.basename(summary["program"]), summary["config"])
+            summaries[key] = summary
+        errors = sweep.sweep(sweep.readManifest(self.manifest), collect, processes)
+        return errors, summaries
+
+    #############
+    # Every pair gets a row; runs that raise get an error row and do
+    # not stop the others
+    def testRows(self):
+        for processes in (1, 3):
+            errors, summaries = self.runSweep(processes)
+            self.assertEqual(len(summaries), 4 * len(CONFIGS))
+            self.assertEqual(errors, 4 + 4 + 2)
+            for (name, config), summary in summaries.items():
+                failing = (name in ("wild.txt", "missing.txt") or config == "bad")
+                self.assertEqual(bool(summary["error"]), failing, (name, config))
+                if (failing):
+                    self.assertEqual(summary["cycles"], "")
+            self.assertIn("IndexError", summaries[("wild.txt", "base")]["error"])
+            self.assertIn("TypeError", summaries[("prog0.txt", "bad")]["error"])
+
+            for i in range(len(self.words)):
+                for options, name in ((dict(), "base"), (dict(maxCycles=50, cacheReplacement="fifo"),
+                                                         "config3")):
+                    sim = Simulator(programs.decode(self.words[i]), Config(**options))
+                    cycles = sim.run(maxCycles=options.get("maxCycles", 100000))
+                    summary = summaries[("prog" + str(i) + ".txt", name)]
+                    self.assertEqual(summary["cycles"], cycles)
+                    self.assertEqual(summary["instructions"], sim.instructionsRetired)
+                    self.assertEqual(summary["halted"], sim.halted)
+                    self.assertEqual(summary["registerHash"], sweep.registerHash(sim.registers))
+
+    #############
+    # The command line writes the same rows as CSV or JSON lines
+    def testOutputFiles(self):
+        errors, expected = self.runSweep(1)
+        for name in ("out.csv", "out.jsonl"):
+            path = os.path.join(self.directory, name)
+            self.assertEqual(sweep.main(["sweep.py", "-m", self.manifest, "-o", path, "-j", "1"]), 1)
+            with open(path) as f:
+                if (name.endswith(".csv")):
+                    rows = list(csv.DictReader(f))
+                else:
+                    rows = [json.loads(line) for line in f]
+            self.assertEqual(len(rows), len(expected))
+            for row in rows:
+                summary = expected[(os.path.basename(row["program"]), row["config"])]
+                self.assertEqual(str(row["cycles"]), str(summary["cycles"]))
+                self.assertEqual(row["error"], summary["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
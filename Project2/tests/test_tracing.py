@@ -0,0 +1,132 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import tracing
+from team23_project2 import Disassembler, Simulator
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+SAMPLES = (("t1test_bin.txt", "t1test_pipeline.txt"), ("t5_nohaz_bin.txt", "t5_nohaz_pipeline.txt"))
+
+# first characters of each section of a dump, in order
+SECTION_STARTS = ("\nPre-Issue Buffer", "Registers", "Cache", "Data")
+
+
+#############
+# Returns the output of one run traced by TraceWriter(out, **options)
+def traceRun(program, maxCycles=None, **options):
+    out = io.StringIO()
+    out.close = lambda: None
+    sim = Simulator(program)
+    writer = tracing.TraceWriter(out, **options)
+    sim.run(maxCycles=maxCycles or programs.MAX_CYCLES, tracer=writer)
+    writer.close(sim)
+    return out.getvalue()
+
+
+#############
+# Splits a trace into {cycle: text after the Cycle line}
+def dumps(text):
+    result = {}
+    for dump in text.split(tracing.HEADER)[1:]:
+        cycle, newline, body = dump.partition("\n")
+        result[int(cycle)] = body
+    return result
+
+
+#========================================
+# Trace Level Tests
+#========================================
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.program = programs.decode(programs.randomProgram(5))
+        self.full = dumps(traceRun(self.program))
+
+    #############
+    # The full level writes the sample programs' traces byte for byte
+    def testFullMatchesGolden(self):
+        root = os.path.join(GOLDEN, os.pardir, os.pardir)
+        for source, golden in SAMPLES:
+            with open(os.path.join(root, source)) as f:
+                program = Disassembler.fromLines(f.readlines()).disassemble()
+            with open(os.path.join(GOLDEN, golden)) as f:
+                self.assertEqual(traceRun(program), f.read(), source)
+
+    def testOff(self):
+        self.assertEqual(traceRun(self.program, level="off"), "")
+
+    def testEvery(self):
+        for interval in (1, 3, 10):
+            expected = dict((c, d) for c, d in self.full.items() if (c % interval == 0))
+            self.assertEqual(dumps(traceRun(self.program, level="every", interval=interval)),
+                             expected, interval)
+
+    def testRange(self):
+        last = max(self.full)
+        for first, end in ((1, 5), (20, 40), (last - 3, None), (last + 1, None)):
+            expected = dict((c, d) for c, d in self.full.items()
+                            if (c >= first and (end is None or c <= end)))
+            trace = traceRun(self.program, level="range", first=first, last=end)
+            self.assertEqual(dumps(trace), expected, (first, end))
+
+    #############
+    # The final level dumps the last cycle, whether the run reached the
+    # BREAK or was stopped by maxCycles
+    def testFinal(self):
+        last = max(self.full)
+        self.assertEqual(dumps(traceRun(self.program, level="final")), {last: self.full[last]})
+        self.assertEqual(dumps(traceRun(self.program, maxCycles=25, level="final")),
+                         {25: self.full[25]})
+
+    #############
+    # Applying each "changed" dump's sections to the previous state
+    # rebuilds every cycle of the full trace, and no dump repeats a
+    # section that did not change
+    def testChanged(self):
+        state = [None] * len(SECTION_STARTS)
+        changed = dumps(traceRun(self.program, level="changed"))
+        for cycle in sorted(self.full):
+            if (cycle in changed):
+                body = changed[cycle]
+                starts = [body.find(start) for start in SECTION_STARTS] + [len(body)]
+                present = [i for i in range(len(SECTION_STARTS)) if (starts[i] >= 0)]
+                for n in range(len(present)):
+                    i = present[n]
+                    end = starts[present[n + 1]] if (n + 1 < len(present)) else len(body)
+                    section = body[starts[i]:end]
+                    self.assertNotEqual(section, state[i], cycle)
+                    state[i] = section
+            self.assertEqual("".join(state), self.full[cycle], cycle)
+
+    def testCompressed(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "run.txt.gz")
+            sim = Simulator(self.program)
+            writer = tracing.TraceWriter(tracing.openTrace(path))
+            sim.run(tracer=writer)
+            writer.close(sim)
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(dumps(f.read()), self.full)
+        finally:
+            shutil.rmtree(directory)
+
+    def testFromSpec(self):
+        writer = tracing.TraceWriter.fromSpec(None, "every:7")
+        self.assertEqual((writer.level, writer.interval), ("every", 7))
+        writer = tracing.TraceWriter.fromSpec(None, "range:3-9")
+        self.assertEqual((writer.level, writer.first, writer.last), ("range", 3, 9))
+        writer = tracing.TraceWriter.fromSpec(None, "range:5-5")
+        self.assertEqual((writer.first, writer.last), (5, 5))
+        for spec in ("loud", "every:0", "every:-2", "range:9-3"):
+            with self.assertRaises(ValueError):
+                tracing.TraceWriter.fromSpec(None, spec)
+
+
+if __name__ == "__main__":
+    unittest.main()
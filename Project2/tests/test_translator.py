@@ -0,0 +1,63 @@
+import random
+import unittest
+
+import programs
+import functional
+from team23_project2 import Config, TEXT_BASE
+from workloads import lw, sw, addi, beq, jump, BREAK
+
+
+#############
+# Runs an executor and returns everything a difference between
+# translated and interpreted execution could show up in
+def runState(program, config, **limits):
+    executor = functional.FunctionalExecutor(program, config)
+    try:
+        count = executor.run(**limits)
+        error = None
+    except IndexError as e:
+        count = None
+        error = str(e)
+    return (count, error, executor.PC, executor.registers, list(executor.memory),
+            executor.halted, executor.instructionCount)
+
+
+#========================================
+# Block Translator Tests
+#========================================
+class TranslatorTest(unittest.TestCase):
+
+    #############
+    # Compiled blocks leave the state interpretation leaves, whether the
+    # run ends at the BREAK, after maxInstructions or at untilPC
+    def testMatchesInterpreter(self):
+        for seed in range(150):
+            program = programs.decode(programs.randomProgram(seed))
+            rnd = random.Random(seed)
+            for limits in (dict(maxInstructions=programs.MAX_INSTRUCTIONS),
+                           dict(maxInstructions=rnd.randrange(1, 300)),
+                           dict(untilPC=TEXT_BASE + 4 * rnd.randrange(0, 40), maxInstructions=5000)):
+                expected = runState(program, Config(translateBlocks=False), **limits)
+                for threshold in (1, 2, 5):
+                    actual = runState(program, Config(translateThreshold=threshold), **limits)
+                    self.assertEqual(actual, expected, (seed, limits, threshold))
+
+    #############
+    # A SW into a compiled block is dropped, as the interpreter drops
+    # it, so every pass runs the instruction that was loaded
+    def testCodeWrite(self):
+        # R3 counts three passes; each copies the word at 176 over the
+        # instruction at 116, which still adds 1 to R4
+        words = [addi(1, 0, 5), addi(3, 0, 3), lw(2, TEXT_BASE + 4 * 20, 0),
+                 sw(2, TEXT_BASE + 4 * 5, 0), addi(3, 3, -1), addi(4, 4, 1),
+                 beq(3, 0, 4), jump(TEXT_BASE + 16), BREAK] + [0] * 11 + [addi(4, 4, 100)]
+        program = programs.decode(words)
+        expected = runState(program, Config(translateBlocks=False))
+        self.assertEqual(expected[3][4], 3)
+        self.assertEqual(expected[4], words)
+        for threshold in (1, 2, 5):
+            self.assertEqual(runState(program, Config(translateThreshold=threshold)), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import programs
+import loader
+import workloads
+from team23_project2 import Config
+
+# kind, body words, data words, iterations
+SIZES = (("alu", 50, 8, 4), ("mem", 80, 40000, 3), ("branch", 120, 16, 5),
+         ("stride", 30, 300, 2), ("stride", 64, 1 << 16, 2))
+
+
+#========================================
+# Workload Generator Tests
+#========================================
+class WorkloadsTest(programs.DifferentialCase):
+
+    #############
+    # Every kind halts and runs on the pipeline as on the instruction
+    # set, also with data sections past the 16-bit immediate
+    def testRuns(self):
+        wordLists = [list(workloads.generate(*size, seed=size[1])) for size in SIZES]
+        self.assertMatchesReference(wordLists, Config())
+
+    #############
+    # The stride kind walks the whole data section
+    def testStrideCoversData(self):
+        dataWords = 1 << 14
+        perBody = 64
+        iterations = dataWords * 4 // (perBody * 64)
+        words = list(workloads.generate("stride", perBody, dataWords, iterations, stride=64))
+        accesses = []
+        self.assertTrue(programs.execute(words, 10 ** 6, accesses)[3])
+        dataAddress = programs.decode(words).dataAddress
+        self.assertEqual(sorted(set(accesses)), list(range(dataAddress, dataAddress + dataWords * 4, 64)))
+
+    def testRejects(self):
+        for args in (("vector",), ("alu", 0), ("alu", 10, 0), ("stride", 10, 64, 1, 0, 6)):
+            with self.assertRaises(ValueError):
+                workloads.generate(*args)
+
+    #############
+    # Written images load back as the same words
+    def testWrite(self):
+        directory = tempfile.mkdtemp()
+        try:
+            words = workloads.generate("mem", 40, 100, 2, seed=7)
+            path = os.path.join(directory, "prog.txt")
+            workloads.writeText(words, path)
+            self.assertEqual(loader.loadWords(path), words)
+            for byteorder in ("little", "big"):
+                path = os.path.join(directory, "prog.bin")
+                workloads.writeRaw(words, path, byteorder)
+                self.assertEqual(loader.loadWords(path, "raw", byteorder), words)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
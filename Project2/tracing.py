@@ -0,0 +1,151 @@
+"""Pipeline trace output.
+
+A TraceWriter decides which cycles of a Simulator run are dumped and
+writes each dump as one string built by Simulator.formatState, so a
+cycle costs a single buffered write instead of dozens of tiny ones.
+
+Levels:
+
+  full      every cycle, in the original _pipeline.txt format (default)
+  off       nothing
+  final     only the state after the last simulated cycle
+  every     every `interval`-th cycle
+  range     cycles first..last inclusive
+  changed   only the sections (buffers, registers, cache, data) that
+            changed since the previous dump; unchanged cycles are skipped,
+            and cycles the Simulator jumped over while the machine sat
+            idle are summed up in one "Cycles:N-M idle" record
+
+Output is plain text unless compression is "gzip" or "zstd" (the latter
+needs the zstandard package).
+"""
+
+import gzip
+import io
+
+LEVELS = ("full", "off", "final", "every", "range", "changed")
+
+HEADER = "--------------------\nCycle:"
+BUFFER_SIZE = 1 << 20
+
+
+#############
+# Opens a trace file for writing text, optionally compressed
+def openTrace(path, compression=None):
+    if (compression is None):
+        if (path.endswith(".gz")):
+            compression = "gzip"
+        elif (path.endswith(".zst")):
+            compression = "zstd"
+
+    if (compression is None):
+        return io.open(path, "w", buffering=BUFFER_SIZE)
+    elif (compression == "gzip"):
+        return io.TextIOWrapper(io.BufferedWriter(gzip.open(path, "wb", compresslevel=6),
+                                                  BUFFER_SIZE))
+    elif (compression == "zstd"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd trace output needs the zstandard package")
+        raw = io.open(path, "wb")
+        stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(io.BufferedWriter(stream, BUFFER_SIZE))
+    raise ValueError("unknown trace compression '" + str(compression) + "'")
+
+
+#========================================
+# Trace Writer Class
+#========================================
+class TraceWriter(object):
+
+    def __init__(self, out, level="full", interval=1, first=1, last=None):
+        if (level not in LEVELS):
+            raise ValueError("unknown trace level '" + str(level) + "'")
+        if (level == "every" and interval < 1):
+            raise ValueError("trace interval must be at least 1, not " + str(interval))
+        if (level == "range" and last is not None and last < first):
+            raise ValueError("trace range " + str(first) + "-" + str(last) + " ends before it starts")
+        self.out = out
+        self.level = level
+        self.interval = interval
+        self.first = first
+        self.last = last
+        self.lastSections = None    # sections of the previous dump, for "changed"
+        self.finalDone = False
+
+    #############
+    # Parses a command line level: full, off, final, changed,
+    # every:N or range:FIRST-LAST
+    @classmethod
+    def fromSpec(cls, out, spec):
+        name, sep, arg = spec.partition(":")
+        if (name == "every"):
+            return cls(out, "every", interval=int(arg))
+        elif (name == "range"):
+            first, sep, last = arg.partition("-")
+            return cls(out, "range", first=int(first), last=int(last) if last else None)
+        return cls(out, name)
+
+    #############
+    # Called by the Simulator at the end of every cycle
+    def cycle(self, sim):
+        level = self.level
+        if (level == "full"):
+            self.out.write(sim.formatState())
+        elif (level == "every"):
+            if (sim.cycle % self.interval == 0):
+                self.out.write(sim.formatState())
+        elif (level == "range"):
+            if (sim.cycle >= self.first and (self.last is None or sim.cycle <= self.last)):
+                self.out.write(sim.formatState())
+        elif (level == "changed"):
+            self.writeChanged(sim)
+        elif (level == "final" and sim.halted):
+            self.final(sim, sim.cycle)
+
+    #############
+    # Called by the Simulator when it skips cycles first..last, in each
+    # of which the state was exactly what it is now
+    def idle(self, sim, first, last):
+        level = self.level
+        if (level == "changed"):
+            self.out.write(HEADER[:-1] + "s:" + str(first) + "-" + str(last) + " idle\n")
+            return
+        if (level == "full" or level == "every" or level == "range"):
+            body = None
+            for cycle in range(first, last + 1):
+                if (level == "every" and cycle % self.interval != 0):
+                    continue
+                if (level == "range" and (cycle < self.first or
+                                          (self.last is not None and cycle > self.last))):
+                    continue
+                if (body is None):
+                    body = "\n" + "".join(sim.stateSections())
+                self.out.write(HEADER + str(cycle) + body)
+
+    def writeChanged(self, sim):
+        sections = sim.stateSections()
+        previous = self.lastSections
+        if (previous is None):
+            changed = sections
+        else:
+            changed = [sections[i] for i in range(len(sections)) if sections[i] != previous[i]]
+        if (changed):
+            self.out.write(HEADER + str(sim.cycle) + "\n" + "".join(changed))
+        self.lastSections = sections
+
+    #############
+    # Dumps the final state once, for the "final" level
+    def final(self, sim, cycle):
+        if (not self.finalDone):
+            self.finalDone = True
+            self.out.write(HEADER + str(cycle) + "\n" + "".join(sim.stateSections()))
+
+    #############
+    # Finishes the trace; sim is the Simulator whose final state the
+    # "final" level dumps if the run stopped before the BREAK
+    def close(self, sim=None):
+        if (self.level == "final" and sim is not None):
+            self.final(sim, sim.cycle - 1)
+        self.out.close()
@@ -0,0 +1,210 @@
+"""Basic-block translation for the functional executor.
+
+A basic block is the run of instructions from an entry PC up to and
+including the next J, JR, BEQ or BLTZ (or up to the BREAK). Once a block
+has been entered `threshold` times, the BlockTranslator generates the
+source of one Python function that performs the whole block on the
+register list and memory array, with every field, immediate and PC
+folded in as a constant, and compiles it. Running the block is then a
+single call instead of a dispatch per instruction.
+
+A block function returns (nextPC, instructions, exit, detail):
+
+  EXIT_NEXT    ran to its end; continue at nextPC
+  EXIT_BREAK   reached the BREAK at nextPC (not counted)
+  EXIT_FAULT   the LW/SW at nextPC addressed `detail`, outside memory
+
+Compiled blocks are kept by entry PC for the rest of the run: SWs into
+the text section are dropped and code is always decoded from the image
+as loaded (see imageInstruction), so a block never goes stale.
+"""
+
+from team23_project2 import (TEXT_BASE, KIND_ALU, KIND_MEM, KIND_BRANCH, KIND_BREAK,
+                             OP_ADDI, OP_ADD, OP_SUB, OP_MUL, OP_AND, OP_OR, OP_SLL,
+                             OP_SRL, OP_MOVZ, OP_LW, OP_J, OP_JR, OP_BEQ, OP_BLTZ,
+                             MASK32, signed)
+
+EXIT_NEXT = 0
+EXIT_BREAK = 1
+EXIT_FAULT = 2
+
+MAX_BLOCK = 128         # instructions in one block at most
+
+# how each ALU operation computes its unmasked result
+ARITHMETIC = {OP_ADD: "%(rs)s + %(rt)s",
+              OP_SUB: "%(rs)s - %(rt)s",
+              OP_MUL: "%(rs)s * %(rt)s",
+              OP_ADDI: "%(rs)s + %(imm)d",
+              OP_SLL: "%(rt)s << %(shamt)d"}
+
+#========================================
+# Block Class
+#========================================
+class Block(object):
+
+    __slots__ = ('PC', 'end', 'length', 'words', 'function', 'source')
+
+    def __init__(self, PC, end, length, words, function, source):
+        self.PC = PC                # entry PC
+        self.end = end              # PC after the last instruction
+        self.length = length        # instructions counted when it runs to its end
+        self.words = words          # memory indices it was built from
+        self.function = function
+        self.source = source
+
+
+#========================================
+# Block Translator Class
+#========================================
+class BlockTranslator(object):
+
+    def __init__(self, executor, threshold=2):
+        self.executor = executor
+        self.threshold = threshold
+        self.blocks = {}            # entry PC -> Block
+        self.entries = {}           # entry PC -> times entered before being compiled
+        self.compiled = 0
+
+    #############
+    # Returns the compiled block at PC, compiling it once it is hot;
+    # None while it should still be interpreted
+    def lookup(self, PC):
+        block = self.blocks.get(PC)
+        if (block is not None):
+            return block
+        seen = self.entries.get(PC, 0) + 1
+        if (seen < self.threshold):
+            self.entries[PC] = seen
+            return None
+        self.entries.pop(PC, None)
+        block = self.translate(PC)
+        if (block is not None):
+            self.blocks[PC] = block
+            self.compiled += 1
+        return block
+
+    #############
+    # Generates and compiles the block that starts at PC
+    #
+    # Registers the block uses live in locals (x1..x31) while it runs;
+    # the ones it writes are stored back by a finally clause, so every
+    # exit leaves the register list up to date
+    def translate(self, PC):
+        executor = self.executor
+        memSize = len(executor.memory)
+        index = (PC - TEXT_BASE) >> 2
+        if (index < 0 or index >= memSize):
+            return None         # the interpreter reports the bad PC
+
+        self.used = set()
+        self.written = set()
+        body = []
+        words = []
+        count = 0
+        start = PC
+        while (True):
+            if (index >= memSize or count >= MAX_BLOCK):
+                body.append("    return %d, %d, 0, 0" % (PC, count))
+                break
+            inst = executor.instructionAt(index)
+            words.append(index)
+            kind = inst.kind
+            if (kind == KIND_BREAK):
+                body.append("    return %d, %d, %d, 0" % (PC, count, EXIT_BREAK))
+                break
+            elif (kind == KIND_BRANCH):
+                self.emitBranch(body, inst, PC, count + 1)
+                count += 1
+                PC += 4
+                break
+            elif (kind == KIND_ALU):
+                self.emitAlu(body, inst)
+            elif (kind == KIND_MEM):
+                self.emitMemory(body, inst, PC, count, memSize)
+            count += 1
+            PC += 4
+            index += 1
+
+        lines = ["def block(r, m):"]
+        for reg in sorted(self.used):
+            lines.append("    x%d = r[%d]" % (reg, reg))
+        if (self.written):
+            lines.append("    try:")
+            lines += ["    " + line for line in body]
+            lines.append("    finally:")
+            for reg in sorted(self.written):
+                lines.append("        r[%d] = x%d" % (reg, reg))
+        else:
+            lines += body
+        source = "\n".join(lines) + "\n"
+
+        namespace = {}
+        exec(compile(source, "<block " + str(start) + ">", "exec"), namespace)
+        return Block(start, PC, count, words, namespace["block"], source)
+
+    #############
+    # Name of the local holding a register (R0 is the constant 0)
+    def read(self, reg):
+        if (reg == 0):
+            return "0"
+        self.used.add(reg)
+        return "x%d" % reg
+
+    def write(self, reg):
+        self.used.add(reg)
+        self.written.add(reg)
+        return "x%d" % reg
+
+    def emitAlu(self, lines, inst):
+        d = inst.dest
+        if (d == -1):
+            return          # writes to R0 are dropped
+        op = inst.op
+        fields = {"rs": self.read(inst.rs), "rt": self.read(inst.rt),
+                  "imm": inst.imm, "shamt": inst.shamt}
+        if (op == OP_ADDI and inst.rs == 0):
+            lines.append("    %s = %d" % (self.write(d), signed(inst.imm & MASK32)))
+        elif (op in ARITHMETIC):
+            lines.append("    v = (" + ARITHMETIC[op] % fields + ") & 4294967295")
+            lines.append("    %s = v - ((v & 2147483648) << 1)" % self.write(d))
+        elif (op == OP_AND):
+            lines.append("    %s = %s & %s" % (self.write(d), fields["rs"], fields["rt"]))
+        elif (op == OP_OR):
+            lines.append("    %s = %s | %s" % (self.write(d), fields["rs"], fields["rt"]))
+        elif (op == OP_SRL):
+            if (inst.shamt == 0):
+                lines.append("    %s = %s" % (self.write(d), fields["rt"]))
+            else:
+                lines.append("    %s = (%s & 4294967295) >> %d" % (self.write(d), fields["rt"], inst.shamt))
+        elif (op == OP_MOVZ):
+            lines.append("    if %s == 0: %s = %s" % (fields["rt"], self.write(d), fields["rs"]))
+        else:
+            lines.append("    %s = 0" % self.write(d))
+
+    def emitMemory(self, lines, inst, PC, count, memSize):
+        base = self.read(inst.rs)
+        lines.append("    i = (%s + %d) >> 2" % (base, inst.imm - TEXT_BASE))
+        lines.append("    if i < 0 or i >= %d: return %d, %d, %d, %s + %d" %
+                     (memSize, PC, count, EXIT_FAULT, base, inst.imm))
+        if (inst.op == OP_LW):
+            if (inst.dest != -1):
+                lines.append("    w = m[i]")
+                lines.append("    %s = w - ((w & 2147483648) << 1)" % self.write(inst.dest))
+        else:
+            lines.append("    if i >= %d: m[i] = %s & 4294967295" %
+                         (self.executor.dataStart, self.read(inst.rt)))
+
+    def emitBranch(self, lines, inst, PC, count):
+        op = inst.op
+        if (op == OP_J):
+            lines.append("    return %d, %d, 0, 0" % (inst.target * 4, count))
+        elif (op == OP_JR):
+            lines.append("    return %s, %d, 0, 0" % (self.read(inst.rs), count))
+        elif (op == OP_BEQ):
+            lines.append("    if %s == %s: return %d, %d, 0, 0" %
+                         (self.read(inst.rs), self.read(inst.rt), PC + 4 + inst.imm, count))
+            lines.append("    return %d, %d, 0, 0" % (PC + 4, count))
+        elif (op == OP_BLTZ):
+            lines.append("    if %s < 0: return %d, %d, 0, 0" %
+                         (self.read(inst.rs), PC + 4 + inst.imm, count))
+            lines.append("    return %d, %d, 0, 0" % (PC + 4, count))
@@ -0,0 +1,395 @@
+"""Synthetic workload generator.
+
+Builds valid program images in the encodings the Disassembler
+understands: a text section that loops `iterations` times over a body of
+about `textWords` instructions, the BREAK, and `dataWords` words of data.
+
+Kinds:
+
+  alu       ALU instructions only (ADD, SUB, MUL, AND, OR, MOVZ, SLL,
+            SRL, ADDI) over R1-R9
+  mem       mostly LW/SW to random words of the data section
+  branch    ALU work broken up by data dependent BEQ/BLTZ that skip the
+            next instruction
+  stride    LW/SW walking the whole data section with a stride of
+            `stride` bytes, wrapping around at its end, so that large
+            data sections thrash the cache
+
+parallelSum() builds a kernel for multicore.System instead: every core
+sums its share of the data section, and core 0 adds up the partial sums
+once every core has flagged its own as done.
+
+Sizes scale from a few hundred words to millions. Data addresses are
+formed in a base register, so they are not limited by the 16-bit
+immediate.
+"""
+
+import random
+import sys
+from array import array
+
+from team23_project2 import TEXT_BASE, WORD_TYPECODE
+
+KINDS = ("alu", "mem", "branch", "stride")
+
+VALID = 1 << 31
+
+# registers with a fixed role in every workload
+LOOP_REG = 10           # remaining iterations
+BASE_REG = 20           # address of the first data word
+POINTER_REG = 21        # stride: current address
+CHUNK_REG = 22          # stride: chunks left before wrapping
+
+# registers a multicore.System sets in each core
+CORE_ID_REG = 26        # $k0: number of the core
+CORE_COUNT_REG = 27     # $k1: number of cores
+
+
+#========================================
+# Instruction Encoding
+#========================================
+def rType(rs, rt, rd, shamt, funct, opcode=0):
+    return VALID | (opcode << 26) | (rs << 21) | (rt << 16) | (rd << 11) | (shamt << 6) | funct
+
+def iType(opcode, rs, rt, imm):
+    return VALID | (opcode << 26) | (rs << 21) | (rt << 16) | (imm & 0xFFFF)
+
+def add(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 32)
+
+def sub(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 34)
+
+def mul(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 2, 28)
+
+def andOp(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 36)
+
+def orOp(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 37)
+
+def movz(rd, rs, rt):
+    return rType(rs, rt, rd, 0, 10)
+
+def sll(rd, rt, shamt):
+    return rType(0, rt, rd, shamt, 0)
+
+def srl(rd, rt, shamt):
+    return rType(0, rt, rd, shamt, 2)
+
+def addi(rt, rs, imm):
+    return iType(8, rs, rt, imm)
+
+def lw(rt, offset, rs):
+    return iType(3, rs, rt, offset)
+
+def sw(rt, offset, rs):
+    return iType(11, rs, rt, offset)
+
+def beq(rs, rt, offset):
+    return iType(4, rs, rt, offset)
+
+def bltz(rs, offset):
+    return iType(1, rs, 0, offset)
+
+def jump(address):
+    return VALID | (2 << 26) | (address // 4)
+
+def jr(rs):
+    return rType(rs, 0, 0, 0, 8)
+
+BREAK = VALID | 13
+
+
+#############
+# Instructions that put a non-negative constant below 2**30 in a register
+def loadConstant(reg, value):
+    if (value < 0x8000):
+        return [addi(reg, 0, value)]
+    return [addi(reg, 0, value >> 15), sll(reg, reg, 15), addi(reg, reg, value & 0x7FFF)]
+
+
+#############
+# One random ALU instruction over R1-R9
+def randomAlu(rnd):
+    d = rnd.randrange(1, 10)
+    s = rnd.randrange(0, 10)
+    t = rnd.randrange(0, 10)
+    k = rnd.randrange(9)
+    if (k == 0):
+        return add(d, s, t)
+    elif (k == 1):
+        return sub(d, s, t)
+    elif (k == 2):
+        return mul(d, s, t)
+    elif (k == 3):
+        return andOp(d, s, t)
+    elif (k == 4):
+        return orOp(d, s, t)
+    elif (k == 5):
+        return movz(d, s, t)
+    elif (k == 6):
+        return sll(d, t, rnd.randrange(0, 8))
+    elif (k == 7):
+        return srl(d, t, rnd.randrange(0, 8))
+    return addi(d, s, rnd.randrange(-100, 100))
+
+
+#============================================================
+# Generates a program image and returns it as an array of words
+#
+# kind is one of KINDS; textWords is the approximate size of
+# the loop body, dataWords the size of the data section
+#============================================================
+def generate(kind, textWords=200, dataWords=256, iterations=10, seed=0, stride=64):
+    if (kind not in KINDS):
+        raise ValueError("unknown workload kind '" + str(kind) + "'")
+    if (dataWords < 1 or iterations < 1 or textWords < 1):
+        raise ValueError("sizes and iterations must be positive")
+    rnd = random.Random(seed)
+
+    # the prologue and epilogue have fixed sizes, so the data address
+    # is known before the body is generated
+    prologueSize = 3 + 3 + 3 + 3        # LOOP_REG, BASE_REG, POINTER_REG, CHUNK_REG
+    if (kind == "stride"):
+        if (stride <= 0 or stride % 4 != 0):
+            raise ValueError("stride must be a positive multiple of 4")
+        perChunk = max(1, min(textWords, 0x7FFF // stride, (dataWords * 4) // stride))  # accesses per body
+        chunkBytes = perChunk * stride
+        chunks = max(1, (dataWords * 4) // chunkBytes)
+        bodySize = perChunk + 2 + 2 + 6
+    else:
+        bodySize = textWords
+    textSize = prologueSize + bodySize + 3      # ... ADDI, BEQ, J, then the BREAK
+    dataAddress = TEXT_BASE + (textSize + 1) * 4
+
+    def padded(code):
+        return code + [addi(0, 0, 0)] * (3 - len(code))     # writes to R0 are dropped
+
+    text = padded(loadConstant(LOOP_REG, iterations))
+    text += padded(loadConstant(BASE_REG, dataAddress))
+    text += padded(loadConstant(POINTER_REG, dataAddress))
+    if (kind == "stride"):
+        text += padded(loadConstant(CHUNK_REG, chunks))
+    else:
+        text += padded([])
+    loopAddress = TEXT_BASE + len(text) * 4
+
+    reach = min(dataWords, 0x8000 // 4)     # words addressable from BASE_REG
+    body = []
+    if (kind == "alu"):
+        for i in range(bodySize):
+            body.append(randomAlu(rnd))
+    elif (kind == "mem"):
+        for i in range(bodySize):
+            k = rnd.randrange(10)
+            reg = rnd.randrange(1, 10)
+            offset = rnd.randrange(reach) * 4
+            if (k < 4):
+                body.append(lw(reg, offset, BASE_REG))
+            elif (k < 7):
+                body.append(sw(reg, offset, BASE_REG))
+            else:
+                body.append(randomAlu(rnd))
+    elif (kind == "branch"):
+        i = 0
+        while (i < bodySize):
+            if (i + 2 <= bodySize and rnd.randrange(4) == 0):
+                reg = rnd.randrange(1, 10)
+                if (rnd.randrange(2) == 0):
+                    body.append(beq(reg, rnd.randrange(0, 10), 4))
+                else:
+                    body.append(bltz(reg, 4))
+                body.append(randomAlu(rnd))     # skipped when the branch is taken
+                i += 2
+            else:
+                body.append(randomAlu(rnd))
+                i += 1
+    else:
+        for i in range(perChunk):
+            reg = rnd.randrange(1, 10)
+            if (rnd.randrange(4) == 0):
+                body.append(sw(reg, i * stride, POINTER_REG))
+            else:
+                body.append(lw(reg, i * stride, POINTER_REG))
+        body.append(addi(POINTER_REG, POINTER_REG, chunkBytes))
+        body.append(addi(CHUNK_REG, CHUNK_REG, -1))
+        continueAddress = loopAddress + (perChunk + 2 + 2 + 6) * 4
+        body.append(beq(CHUNK_REG, 0, 4))       # out of chunks: wrap around
+        body.append(jump(continueAddress))
+        body += padded(loadConstant(POINTER_REG, dataAddress))
+        body += padded(loadConstant(CHUNK_REG, chunks))
+    text += body
+
+    text.append(addi(LOOP_REG, LOOP_REG, -1))
+    text.append(beq(LOOP_REG, 0, 4))
+    text.append(jump(loopAddress))
+    text.append(BREAK)
+    if (len(text) != textSize + 1):
+        raise AssertionError("text section is " + str(len(text)) + " words, expected " +
+                             str(textSize + 1))
+
+    words = array(WORD_TYPECODE, text)
+    data = array(WORD_TYPECODE, [0]) * dataWords
+    for i in range(min(dataWords, 4096)):
+        data[i] = rnd.getrandbits(32)
+    words += data
+    return words
+
+
+#============================================================
+# Generates the parallel sum kernel for up to maxCores cores
+#
+# The data section holds `elements` words to add, then one
+# partial sum and one done flag per core, then the total, which
+# core 0 stores before its BREAK. Core k adds elements k,
+# k + cores, k + 2 * cores, ... so the elements are shared
+# between the cores' caches while the partial sums and flags
+# are written by one core each
+#============================================================
+def parallelSum(elements=1024, seed=0, maxCores=16):
+    if (elements < 1 or maxCores < 1):
+        raise ValueError("sizes must be positive")
+    rnd = random.Random(seed)
+
+    def padded(code):
+        return code + [addi(0, 0, 0)] * (3 - len(code))
+
+    # built twice: the first pass finds the labels, the second
+    # uses them
+    def here():
+        return TEXT_BASE + len(text) * 4
+
+    labels = {}
+    for attempt in range(2):
+        dataAddress = labels.get("data", 0)
+        partialAddress = dataAddress + elements * 4
+        flagsAddress = partialAddress + maxCores * 4
+        totalAddress = flagsAddress + maxCores * 4
+
+        text = padded(loadConstant(BASE_REG, dataAddress))
+        text += padded(loadConstant(11, elements))
+        text += padded(loadConstant(12, partialAddress))
+        text += padded(loadConstant(13, flagsAddress))
+        text.append(add(1, CORE_ID_REG, 0))             # R1: next element
+        text.append(sll(3, CORE_ID_REG, 2))
+        text.append(add(3, 3, BASE_REG))                # R3: its address
+        text.append(sll(4, CORE_COUNT_REG, 2))          # R4: bytes between elements
+        text.append(addi(2, 0, 0))                      # R2: sum
+        labels["loop"] = here()
+        text.append(sub(5, 1, 11))
+        text.append(bltz(5, 4))                         # element left: skip the exit
+        text.append(jump(labels.get("done", 0)))
+        text.append(lw(6, 0, 3))
+        text.append(add(2, 2, 6))
+        text.append(add(3, 3, 4))
+        text.append(add(1, 1, CORE_COUNT_REG))
+        text.append(jump(labels["loop"]))
+
+        labels["done"] = here()
+        text.append(sll(7, CORE_ID_REG, 2))
+        text.append(add(8, 12, 7))
+        text.append(sw(2, 0, 8))                        # partial sum, then the flag
+        text.append(add(8, 13, 7))
+        text.append(addi(9, 0, 1))
+        text.append(sw(9, 0, 8))
+        text.append(beq(CORE_ID_REG, 0, 4))             # core 0 goes on to add them up
+        text.append(jump(labels.get("halt", 0)))
+
+        text.append(addi(1, 0, 0))                      # R1: core whose sum is next
+        text.append(addi(2, 0, 0))                      # R2: total
+        labels["wait"] = here()
+        text.append(sub(5, 1, CORE_COUNT_REG))
+        text.append(bltz(5, 4))
+        text.append(jump(labels.get("finish", 0)))
+        text.append(sll(7, 1, 2))
+        text.append(add(8, 13, 7))
+        text.append(lw(6, 0, 8))
+        text.append(beq(6, 0, -8))                      # spin until its flag is set
+        text.append(add(8, 12, 7))
+        text.append(lw(6, 0, 8))
+        text.append(add(2, 2, 6))
+        text.append(addi(1, 1, 1))
+        text.append(jump(labels["wait"]))
+
+        labels["finish"] = here()
+        text += padded(loadConstant(8, totalAddress))
+        text.append(sw(2, 0, 8))
+        labels["halt"] = here()
+        text.append(BREAK)
+        labels["data"] = here()
+
+    words = array(WORD_TYPECODE, text)
+    words += array(WORD_TYPECODE, [rnd.randrange(1000) for i in range(elements)])
+    words += array(WORD_TYPECODE, [0]) * (2 * maxCores + 1)
+    return words
+
+
+#############
+# Writes words in the '0'/'1' text format, one word per line
+def writeText(words, path):
+    with open(path, "w") as f:
+        f.write("".join(format(word, "032b") + "\n" for word in words))
+
+
+#############
+# Writes words as a packed image
+def writeRaw(words, path, byteorder="little"):
+    words = array(WORD_TYPECODE, words)
+    if (byteorder != sys.byteorder):
+        words.byteswap()
+    with open(path, "wb") as f:
+        words.tofile(f)
+
+
+#========================================
+# Main Code
+#========================================
+def main(args):
+    kind = None
+    outputFileName = None
+    textWords = 200
+    dataWords = 256
+    iterations = 10
+    seed = 0
+    stride = 64
+    outputFormat = "text"
+
+    for i in range(len(args)):
+        if (args[i] == '-k' and i < (len(args) - 1)):
+            kind = args[i + 1]
+        elif (args[i] == '-o' and i < (len(args) - 1)):
+            outputFileName = args[i + 1]
+        elif (args[i] == '-n' and i < (len(args) - 1)):
+            textWords = int(args[i + 1])
+        elif (args[i] == '-d' and i < (len(args) - 1)):
+            dataWords = int(args[i + 1])
+        elif (args[i] == '-r' and i < (len(args) - 1)):
+            iterations = int(args[i + 1])
+        elif (args[i] == '-s' and i < (len(args) - 1)):
+            seed = int(args[i + 1])
+        elif (args[i] == '-b' and i < (len(args) - 1)):
+            stride = int(args[i + 1])
+        elif (args[i] == '-t' and i < (len(args) - 1)):
+            outputFormat = args[i + 1]
+
+    if (kind is None or outputFileName is None):
+        print("usage: workloads.py -k " + "|".join(KINDS) + "|parallel -o <output file>\n"
+              "                    [-n <body words>] [-d <data words>] [-r <iterations>]\n"
+              "                    [-s <seed>] [-b <stride bytes>] [-t text|raw]")
+        return 2
+
+    if (kind == "parallel"):
+        words = parallelSum(dataWords, seed)
+    else:
+        words = generate(kind, textWords, dataWords, iterations, seed, stride)
+    if (outputFormat == "raw"):
+        writeRaw(words, outputFileName)
+    else:
+        writeText(words, outputFileName)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))